@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+End-to-end benchmarks for ffmpeg-cut.
+
+Inputs are generated with ffmpeg's ``testsrc`` and ``sine`` sources (so they are deterministic) and every mode is run
+through :func:`ffmpeg_cut.cli.process` in a forked child. For each run the wall time, CPU time and peak RSS of the child
+processes (from ``wait4``) and the bytes written are recorded. Results can be saved as a JSON baseline and later runs
+compared against it::
+
+    python benchmarks/bench.py --save baseline.json
+    python benchmarks/bench.py --compare baseline.json --extra='--encoder=libx265'
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+from ffmpeg_cut.cli import parser as cli_parser
+from ffmpeg_cut.cli import process
+from ffmpeg_cut.smartcut import format_timestamp
+
+MODES = ['cut', 'multi-cut', 'crop', 'filter', 'fps', 'text', 'clips', 'join']
+
+
+def generate_input(work_dir: pathlib.Path, resolution: str, duration: int) -> pathlib.Path:
+    path = work_dir / f'testsrc-{resolution}-{duration}s.mp4'
+    if not path.exists():
+        subprocess.check_call(
+            [
+                'ffmpeg',
+                '-v',
+                'error',
+                '-f',
+                'lavfi',
+                '-i',
+                f'testsrc=size={resolution}:rate=60:duration={duration}',
+                '-f',
+                'lavfi',
+                '-i',
+                f'sine=frequency=440:duration={duration}',
+                '-c:v',
+                'libx264',
+                '-g',
+                '120',
+                '-pix_fmt',
+                'yuv420p',
+                '-c:a',
+                'aac',
+                '-fflags',
+                '+bitexact',
+                '-flags',
+                '+bitexact',
+                '-shortest',
+                path,
+            ]
+        )
+    return path
+
+
+def cuts(duration, *spans):
+    return [f'{format_timestamp(duration * start)}-{format_timestamp(duration * end)}' for start, end in spans]
+
+
+def scenario(mode, source: pathlib.Path, duration, output_dir: pathlib.Path):
+    """
+    Returns ``(setup, argv)``: the ffmpeg-cut arguments that need to run (unmeasured) before and the ones to measure.
+    """
+    output = output_dir / 'output.mp4'
+    spans = cuts(duration, (0.1, 0.3), (0.4, 0.6), (0.7, 0.9))
+    match mode:
+        case 'cut':
+            return None, [source, output, *cuts(duration, (0.1, 0.9))]
+        case 'multi-cut':
+            return None, [source, output, *spans]
+        case 'crop':
+            return None, ['--crop=9:16', source, output]
+        case 'filter':
+            return None, ['--filter=0:0:320:180:boxblur=5:4', source, output]
+        case 'fps':
+            return None, ['--fps=30', source, output]
+        case 'text':
+            text = output_dir / 'cuts.txt'
+            text.write_text('\n'.join([str(source), *spans, str(source), *reversed(spans)]))
+            return None, ['--text', text, output]
+        case 'clips':
+            clips = output_dir / 'cuts.clips'
+            clips.write_text(''.join(f'# {source} {span}\nfile unused\n' for span in spans))
+            return None, ['--clips', clips, output]
+        case 'join':
+            return [source, output, *spans, '--no-join'], ['--join', output.with_suffix('.clips'), output]
+        case _:
+            raise ValueError(mode)
+
+
+def measure(argv, verbose=False):
+    args = cli_parser.parse_args([str(arg) for arg in argv])
+    started = time.perf_counter()
+    pid = os.fork()
+    if not pid:
+        try:
+            if not verbose:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, 1)
+                os.dup2(devnull, 2)
+            process(args)
+        except BaseException:
+            os._exit(1)
+        else:
+            os._exit(0)
+    _, status, rusage = os.wait4(pid, 0)
+    wall_time = time.perf_counter() - started
+    if os.waitstatus_to_exitcode(status):
+        raise RuntimeError(f'ffmpeg-cut {shlex.join(map(str, argv))} failed')
+    return {
+        'wall_time': round(wall_time, 3),
+        'cpu_time': round(rusage.ru_utime + rusage.ru_stime, 3),
+        'max_rss': rusage.ru_maxrss * 1024,  # Linux reports kilobytes
+    }
+
+
+def directory_size(path: pathlib.Path):
+    return sum(entry.stat().st_size for entry in path.rglob('*') if entry.is_file())
+
+
+def run(options):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='ffmpeg-cut-bench-') as tmp:
+        work_dir = options.work_dir or pathlib.Path(tmp)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        for resolution in options.resolutions:
+            for duration in options.durations:
+                source = generate_input(work_dir, resolution, duration)
+                for mode in options.modes:
+                    name = f'{mode}/{resolution}/{duration}s'
+                    with tempfile.TemporaryDirectory(dir=work_dir) as output_dir:
+                        output_dir = pathlib.Path(output_dir)
+                        setup, argv = scenario(mode, source, duration, output_dir)
+                        if setup:
+                            measure([*setup, *options.extra], verbose=options.verbose)
+                        size_before = directory_size(output_dir)
+                        result = measure([*argv, *options.extra], verbose=options.verbose)
+                        result['bytes_written'] = directory_size(output_dir) - size_before
+                    results[name] = result
+                    print(f'{name:30} {json.dumps(result)}', flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in 'wall_time', 'cpu_time':
+            before = baseline[name][metric]
+            after = result[metric]
+            if before and after > before * (1 + tolerance):
+                regressions.append(f'{name} {metric}: {before:.3f} -> {after:.3f} ({after / before - 1:+.1%})')
+    return regressions
+
+
+parser = argparse.ArgumentParser(description='ffmpeg-cut end-to-end benchmarks')
+parser.add_argument('--resolutions', nargs='+', default=['640x360', '1280x720', '1920x1080'], metavar='WxH')
+parser.add_argument('--durations', nargs='+', type=int, default=[10, 60], metavar='SECONDS')
+parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+parser.add_argument(
+    '--extra', help='extra ffmpeg-cut arguments for every run (eg: "--encoder=libx265 -q 28")', type=shlex.split, default=[]
+)
+parser.add_argument('--work-dir', help='where to keep generated inputs (default: a temporary directory)', type=pathlib.Path)
+parser.add_argument('--save', help='write results as a JSON baseline', type=pathlib.Path, metavar='FILE')
+parser.add_argument('--compare', help='compare results against a JSON baseline', type=pathlib.Path, metavar='FILE')
+parser.add_argument('--tolerance', help='allowed slowdown against the baseline (default: %(default)s)', type=float, default=0.2)
+parser.add_argument('-v', '--verbose', help='show the output of ffmpeg-cut', action='store_true')
+
+
+def main():
+    options = parser.parse_args()
+    results = run(options)
+    if options.save:
+        options.save.write_text(json.dumps(results, indent=2, sort_keys=True))
+    if options.compare:
+        if regressions := compare(results, json.loads(options.compare.read_text()), options.tolerance):
+            print('regressions:')
+            for regression in regressions:
+                print(f'    {regression}')
+            sys.exit(1)
+        print('no regressions')
+
+
+if __name__ == '__main__':
+    main()
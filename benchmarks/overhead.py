@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the orchestration overhead of ffmpeg-cut with very long cut lists: parsing, planning (the clip names and
+commands), building the concat lists and spawning the ffmpeg processes.
+
+A fake ``ffmpeg`` and ``ffprobe`` are put on ``PATH``: the fake ``ffmpeg`` records its arguments, waits ``--latency``
+seconds and writes a placeholder output, so no media or encoder is needed and the time spent in ffmpeg-cut itself is
+not hidden by the encodes. Every stage runs in this process and reports its wall time, the CPU time of this process
+(without the fake commands) and the peak memory allocated by Python (with ``tracemalloc``, which slows everything down
+a bit; use ``--no-memory`` for cleaner times), also per entry::
+
+    python benchmarks/overhead.py --entries 10000 100000
+    python benchmarks/overhead.py --save baseline.json
+    python benchmarks/overhead.py --compare baseline.json --latency 0.01
+"""
+
+import argparse
+import gc
+import json
+import os
+import pathlib
+import shlex
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench import compare
+
+from ffmpeg_cut.cli import execute
+from ffmpeg_cut.cli import parser as cli_parser
+from ffmpeg_cut.plan import parse_clips
+from ffmpeg_cut.plan import parse_join
+from ffmpeg_cut.plan import parse_text
+from ffmpeg_cut.plan import plan_cuts
+from ffmpeg_cut.plan import plan_join
+from ffmpeg_cut.smartcut import format_timestamp
+
+MODES = ['text', 'clips', 'join']
+FAKE_FFMPEG = """\
+#!/bin/sh
+# fake ffmpeg from benchmarks/overhead.py: records the arguments, waits and writes a placeholder output
+printf '%s\\n' "$*" >> "$FAKE_FFMPEG_LOG"
+[ "$FAKE_FFMPEG_LATENCY" = 0 ] || sleep "$FAKE_FFMPEG_LATENCY"
+for output; do :; done
+case "$output" in
+    -|pipe:*) ;;
+    *) printf placeholder > "$output" ;;
+esac
+"""
+FAKE_FFPROBE = """\
+#!/bin/sh
+# fake ffprobe from benchmarks/overhead.py: every file is a long 1080p60 video with stereo AAC audio
+case "$*" in
+    *csv=p=0*) echo "$FAKE_FFPROBE_DURATION" ;;
+    *) printf '{"format": {"duration": "%s"}, "streams": [%s, %s]}\\n' "$FAKE_FFPROBE_DURATION" \\
+        '{"codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080, "r_frame_rate": "60/1", "pix_fmt": "yuv420p"}' \\
+        '{"codec_type": "audio", "codec_name": "aac", "sample_rate": "48000", "channels": 2}' ;;
+esac
+"""
+
+
+def install_fakes(bin_dir: pathlib.Path, log: pathlib.Path, latency: float, duration: float):
+    """
+    Writes the fake ``ffmpeg`` and ``ffprobe`` in ``bin_dir`` and puts it first on ``PATH``.
+    """
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name, script in ('ffmpeg', FAKE_FFMPEG), ('ffprobe', FAKE_FFPROBE):
+        path = bin_dir / name
+        path.write_text(script)
+        path.chmod(0o755)
+    os.environ['PATH'] = f'{bin_dir}{os.pathsep}{os.environ["PATH"]}'
+    os.environ['FAKE_FFMPEG_LOG'] = str(log)
+    os.environ['FAKE_FFMPEG_LATENCY'] = str(latency)
+    os.environ['FAKE_FFPROBE_DURATION'] = str(duration)
+
+
+def generate_cuts(entries, inputs):
+    """
+    Returns ``entries`` distinct one second cuts spread over ``inputs`` sources, as ``(source index, cut)``.
+    """
+    return [(index % inputs, f'{format_timestamp(index // inputs)}-{format_timestamp(index // inputs + 1)}') for index in range(entries)]
+
+
+def scenario(mode, entries, inputs, work_dir: pathlib.Path):
+    """
+    Writes the input file of ``mode`` (and the sources or clips it refers to), returns the ffmpeg-cut arguments.
+    """
+    sources = [work_dir / f'source-{index}.mp4' for index in range(inputs)]
+    for source in sources:
+        source.write_text('placeholder')
+    cuts = generate_cuts(entries, inputs)
+    output = work_dir / 'output.mp4'
+    match mode:
+        case 'text':
+            text = work_dir / 'cuts.txt'
+            text.write_text(
+                '\n'.join(line for index, source in enumerate(sources) for line in [str(source), *(cut for i, cut in cuts if i == index)])
+            )
+            return ['--text', text, output]
+        case 'clips':
+            clips = work_dir / 'cuts.clips'
+            clips.write_text(''.join(f'# {sources[index]} {cut}\nfile unused\n' for index, cut in cuts))
+            return ['--clips', clips, output]
+        case 'join':
+            clips = work_dir / 'cuts.clips'
+            clip_dir = work_dir / 'clips'
+            clip_dir.mkdir()
+            lines = []
+            for number, (index, cut) in enumerate(cuts):
+                clip = clip_dir / f'clip-{number}.mp4'
+                clip.write_text('placeholder')
+                lines.append(f'# {sources[index]} {cut}\nfile {str(clip)!r}\n')
+            clips.write_text(''.join(lines))
+            return ['--join', clips, output]
+        case _:
+            raise ValueError(mode)
+
+
+def measure(function, *args, memory=True, **kwargs):
+    """
+    Runs ``function(*args, **kwargs)``. Returns its result and the wall time, CPU time and (if ``memory``) the peak of memory
+    allocated while it ran.
+    """
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        metrics = {
+            'wall_time': round(time.perf_counter() - started, 3),
+            'cpu_time': round(time.process_time() - cpu_started, 3),
+        }
+        if memory:
+            metrics['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result, metrics
+
+
+def run_stages(mode, args, memory=True):
+    """
+    Runs what ``ffmpeg-cut`` does for ``args`` one stage at a time. Returns the metrics of every stage.
+    """
+    results = {}
+    with args.input.open() as fh:
+        lines = fh.readlines()
+    match mode:
+        case 'text':
+            instructions, results['parse'] = measure(parse_text, lines, base=args.input.parent, memory=memory)
+            plan, results['plan'] = measure(plan_cuts, instructions, args, memory=memory)
+            clips = plan.clips
+        case 'clips':
+            instructions, results['parse'] = measure(parse_clips, lines, base=args.input.parent, memory=memory)
+            plan, results['plan'] = measure(plan_cuts, instructions, args, memory=memory)
+            clips = plan.clips
+        case 'join':
+            clips, results['parse'] = measure(parse_join, lines, echo=args.echo, base=args.input.parent, memory=memory)
+            plan, results['plan'] = measure(plan_join, clips, args, memory=memory)
+    _, results['concat'] = measure(clips.as_concat_input, memory=memory)
+    _, results['execute'] = measure(execute, plan, args, memory=memory)
+    return results
+
+
+def per_entry(metrics, entries):
+    result = dict(metrics)
+    result['wall_us_per_entry'] = round(metrics['wall_time'] / entries * 1_000_000, 1)
+    result['cpu_us_per_entry'] = round(metrics['cpu_time'] / entries * 1_000_000, 1)
+    if 'peak_memory' in metrics:
+        result['bytes_per_entry'] = round(metrics['peak_memory'] / entries)
+    return result
+
+
+def run(options):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='ffmpeg-cut-overhead-') as tmp:
+        tmp = pathlib.Path(tmp)
+        log = tmp / 'ffmpeg.log'
+        install_fakes(tmp / 'bin', log, options.latency, max(options.entries) + 1)
+        for mode in options.modes:
+            for entries in options.entries:
+                with tempfile.TemporaryDirectory(dir=tmp) as work_dir:
+                    argv = scenario(mode, entries, options.inputs, pathlib.Path(work_dir))
+                    args = cli_parser.parse_args([str(arg) for arg in [*argv, f'--jobs={options.jobs}', *options.extra]])
+                    if not options.verbose:
+                        args.echo = lambda *args: None
+                    log.write_text('')
+                    stages = run_stages(mode, args, memory=options.memory)
+                    with log.open() as fh:
+                        commands = sum(1 for _ in fh)
+                for stage, metrics in stages.items():
+                    name = f'{mode}/{entries}/{stage}'
+                    results[name] = per_entry(metrics, entries)
+                    if stage == 'execute':
+                        results[name]['commands'] = commands
+                    print(f'{name:30} {json.dumps(results[name])}', flush=True)
+    return results
+
+
+parser = argparse.ArgumentParser(description='ffmpeg-cut orchestration overhead benchmarks (with a fake ffmpeg)')
+parser.add_argument('--entries', nargs='+', type=int, default=[1000, 10000, 100000], metavar='N', help='cut list sizes')
+parser.add_argument('--inputs', type=int, default=10, metavar='N', help='how many sources the cuts are spread over (default: %(default)s)')
+parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+parser.add_argument('--latency', type=float, default=0.0, metavar='SECONDS', help='how long every fake ffmpeg run takes')
+parser.add_argument('--jobs', type=int, default=os.cpu_count(), metavar='N', help='ffmpeg-cut --jobs (default: the CPU count)')
+parser.add_argument('--no-memory', dest='memory', action='store_false', help='do not trace memory allocations')
+parser.add_argument('--extra', help='extra ffmpeg-cut arguments for every run (eg: "--fps=30 --merge")', type=shlex.split, default=[])
+parser.add_argument('--save', help='write results as a JSON baseline', type=pathlib.Path, metavar='FILE')
+parser.add_argument('--compare', help='compare results against a JSON baseline', type=pathlib.Path, metavar='FILE')
+parser.add_argument('--tolerance', help='allowed slowdown against the baseline (default: %(default)s)', type=float, default=0.2)
+parser.add_argument('-v', '--verbose', help='show the output of ffmpeg-cut', action='store_true')
+
+
+def main():
+    options = parser.parse_args()
+    results = run(options)
+    if options.save:
+        options.save.write_text(json.dumps(results, indent=2, sort_keys=True))
+    if options.compare:
+        if regressions := compare(results, json.loads(options.compare.read_text()), options.tolerance):
+            print('regressions:')
+            for regression in regressions:
+                print(f'    {regression}')
+            sys.exit(1)
+        print('no regressions')
+
+
+if __name__ == '__main__':
+    main()
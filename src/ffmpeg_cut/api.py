@@ -0,0 +1,75 @@
+"""
+Python API for planning and running cuts in-process, without going through argparse or the console::
+
+    from ffmpeg_cut import api
+
+    settings = api.Settings(output=pathlib.Path('compilation.mp4'), filters=api.parse_fps('60'), jobs=4, echo=logger.info)
+    plan = api.plan_cuts(api.parse_text(pathlib.Path('compilation.txt').read_text().splitlines()), settings)
+    json.dumps(plan.as_dict())  # inputs, cuts and the ffmpeg arguments of every step
+    api.execute(plan, settings)
+
+Invalid input raises :class:`PlanError` and failed ffmpeg commands raise :class:`subprocess.CalledProcessError`. All
+the output goes through ``settings.echo``.
+"""
+
+from .calibrate import calibrate
+from .cli import execute
+from .cli import parse_crop
+from .cli import parse_cut
+from .cli import parse_filter
+from .cli import parse_fps
+from .export import export_plan
+from .plan import ParseErrors
+from .plan import PlanError
+from .plan import Rendition
+from .plan import Settings
+from .plan import apply_preview
+from .plan import check_settings
+from .plan import merge_cuts
+from .plan import parse_clips
+from .plan import parse_join
+from .plan import parse_text
+from .plan import plan_cut
+from .plan import plan_cuts
+from .plan import plan_filters
+from .plan import plan_join
+from .preflight import preflight
+from .progress import ProgressReporter
+from .smartcut import MediaInfo
+from .structs import ClipList
+from .structs import Cut
+from .structs import Instruction
+from .structs import Plan
+from .structs import Step
+
+__all__ = [
+    'ClipList',
+    'Cut',
+    'Instruction',
+    'MediaInfo',
+    'ParseErrors',
+    'Plan',
+    'PlanError',
+    'ProgressReporter',
+    'Rendition',
+    'Settings',
+    'Step',
+    'apply_preview',
+    'calibrate',
+    'check_settings',
+    'execute',
+    'export_plan',
+    'merge_cuts',
+    'parse_clips',
+    'parse_crop',
+    'parse_cut',
+    'parse_filter',
+    'parse_fps',
+    'parse_join',
+    'parse_text',
+    'plan_cut',
+    'plan_cuts',
+    'plan_filters',
+    'plan_join',
+    'preflight',
+]
@@ -0,0 +1,123 @@
+import errno
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(value: str) -> int:
+    """
+    Parses sizes like ``500M`` or ``20G`` into bytes.
+    """
+    value = value.strip().upper().removesuffix('B')
+    unit = value[-1:] if value[-1:] in SIZE_UNITS else ''
+    return int(float(value.removesuffix(unit)) * SIZE_UNITS[unit])
+
+
+def format_size(size: int) -> str:
+    for unit in 'KMGT':
+        size /= 1024
+        if size < 1024 or unit == 'T':
+            return f'{size:.1f}{unit}'
+
+
+def file_identity(path: pathlib.Path):
+    stat = path.stat()
+    return [str(path.resolve()), stat.st_size, stat.st_mtime_ns]
+
+
+def content_key(input, cut, filters, encoder, quality, *extra) -> str:
+    """
+    Hash of everything that affects an encoded clip, including the identity of the input file.
+    """
+    data = json.dumps([file_identity(input), cut.start, cut.end, filters, encoder, quality, *extra], default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def clone_file(source: pathlib.Path, destination: pathlib.Path, link=True):
+    """
+    Makes ``destination`` share the data of ``source``: hard link (if ``link``), then reflink, then a plain copy.
+
+    Hard links share the inode, so they are only fit for files that are never edited and soon removed (eg: the clips of
+    a join): editing one changes the other and removing the cache entry frees nothing.
+    """
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError as exc:
+            if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+    with source.open('rb') as src, destination.open('wb') as dst:
+        try:
+            if fcntl is None:
+                raise OSError(errno.ENOTSUP, 'reflinks not supported')
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            shutil.copyfileobj(src, dst)
+
+
+class ClipCache:
+    """
+    Content-addressed clip store. Entries are keyed by a hash of everything that affects the encoded clip and evicted in
+    least-recently-used order (by mtime, which is bumped on every hit) once the total size exceeds ``budget``.
+    """
+
+    def __init__(self, path: pathlib.Path, budget: int):
+        self.path = path
+        self.budget = budget
+        self.lock = threading.Lock()
+
+    def entry(self, key, suffix):
+        return self.path / key[:2] / f'{key}{suffix}'
+
+    def fetch(self, key, output: pathlib.Path, link=True) -> bool:
+        """
+        Puts the entry of ``key`` in ``output`` (see :func:`clone_file` for ``link``). Returns ``False`` if it's not
+        cached.
+        """
+        entry = self.entry(key, output.suffix)
+        tmp = output.with_name(f'{output.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            os.utime(entry)
+            clone_file(entry, tmp, link=link)
+        except FileNotFoundError:
+            return False
+        tmp.replace(output)
+        return True
+
+    def store(self, key, clip: pathlib.Path, link=True):
+        entry = self.entry(key, clip.suffix)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f'{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        clone_file(clip, tmp, link=link)
+        tmp.replace(entry)
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for entry in self.path.glob('*/*'):
+                if entry.suffix == '.tmp':
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry))
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= self.budget:
+                    break
+                entry.unlink(missing_ok=True)
+                total -= size
@@ -0,0 +1,161 @@
+"""
+Picks the encoder preset from a throughput target (``--target-speed``) or a deadline (``--deadline``): short samples of
+an input are encoded with the filters, encoder and thread count of the plan and the slowest preset (the one that
+compresses best) that is still fast enough is used.
+
+The measured speeds are kept in ``presets.json`` in the user's cache directory, by machine, encoder, quality, filters,
+thread count and input format, so a calibration only runs once for a given setup.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import time
+import types
+
+from .plan import PRESETS
+from .plan import PlanError
+from .plan import encode_argv
+from .plan import join_filters
+from .plan import threads_options
+from .smartcut import MediaInfo
+from .smartcut import cached_probe
+from .structs import Cut
+from .structs import Plan
+
+CALIBRATION_FILE = pathlib.Path(os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache') / 'ffmpeg-cut' / 'presets.json'
+SAMPLE_LENGTH = 5.0
+PARALLEL_STEPS = ('clip', 'chunk')
+
+
+def calibration_key(info: MediaInfo, settings) -> str:
+    data = [
+        platform.node(),
+        os.cpu_count(),
+        settings.encoder,
+        settings.quality,
+        join_filters(settings.filters),
+        threads_options(settings),
+        info.width,
+        info.height,
+        info.frame_rate,
+        info.pix_fmt,
+    ]
+    return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+
+def load_speeds(path=None) -> dict[str, dict[str, float]]:
+    try:
+        return json.loads((path or CALIBRATION_FILE).read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_speeds(speeds, path=None):
+    path = path or CALIBRATION_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'{path.name}.{os.getpid()}')
+    temporary.write_text(json.dumps(speeds, indent=2, sort_keys=True))
+    temporary.replace(path)
+
+
+def measure_speed(input, info: MediaInfo, settings, preset) -> float:
+    """
+    Encodes (to nowhere) a sample from the middle of ``input`` with ``preset`` and returns how many times faster than
+    realtime that was.
+    """
+    start = max(0.0, info.duration / 2 - SAMPLE_LENGTH / 2)
+    cut = Cut(round(start * 1000), round(min(info.duration, start + SAMPLE_LENGTH) * 1000))
+    sample = types.SimpleNamespace(
+        filters=settings.filters, encoder=settings.encoder, quality=settings.quality, preset=preset, jobs=settings.jobs
+    )
+    argv = encode_argv(input, cut, '-', sample, '-v', 'error', output_options=['-an', '-f', 'null'], audio=False)
+    started = time.perf_counter()
+    subprocess.run(argv, check=True, stdin=subprocess.DEVNULL)
+    return cut.duration / max(time.perf_counter() - started, 0.001)
+
+
+def required_speed(plan: Plan, info: MediaInfo, settings) -> float:
+    """
+    How many times faster than realtime every encode needs to be, given that clips and chunks are encoded ``settings.jobs``
+    at a time.
+    """
+    if settings.target_speed:
+        speed = settings.target_speed
+    else:
+        speed = (plan.duration or info.duration) / settings.deadline
+    parallel = sum(1 for step in plan.steps if step.kind in PARALLEL_STEPS)
+    return speed / max(1, min(settings.jobs, parallel))
+
+
+def select_preset(plan: Plan, settings) -> str | None:
+    """
+    Returns the slowest preset that encodes the first input of ``plan`` fast enough for ``settings.target_speed`` or
+    ``settings.deadline``, measuring (with a binary search, assuming slower presets are never faster) the ones that aren't
+    in the calibration file yet. Returns ``None`` for a dry run that would need to measure.
+    """
+    input = plan.inputs[0]
+    if settings.dry_run and not input.exists():
+        settings.echo(f'would calibrate the encoder preset on {input}')
+        return None
+    try:
+        info = cached_probe(input)
+    except (FileNotFoundError, subprocess.CalledProcessError, KeyError, ValueError):
+        raise PlanError(f'cannot probe {str(input)!r} to calibrate the encoder preset') from None
+    needed = required_speed(plan, info, settings)
+    speeds = load_speeds()
+    known = speeds.setdefault(calibration_key(info, settings), {})
+    measured = False
+    low, high = 0, len(PRESETS) - 1  # the answer is in [low, high], or ultrafast if even that is too slow
+    while low < high:
+        middle = (low + high + 1) // 2
+        preset = PRESETS[middle]
+        if preset not in known:
+            if settings.dry_run:
+                settings.echo(f'would calibrate the encoder preset on {input}')
+                return None
+            settings.echo(f'calibrating: encoding a sample of {input} with -preset {preset}')
+            try:
+                known[preset] = round(measure_speed(input, info, settings, preset), 3)
+            except subprocess.CalledProcessError:
+                raise PlanError(f'cannot encode a sample of {str(input)!r} with {settings.encoder} -preset {preset}') from None
+            measured = True
+        if known[preset] >= needed:
+            low = middle
+        else:
+            high = middle - 1
+    if measured:
+        save_speeds(speeds)
+    preset = PRESETS[low]
+    if preset in known and known[preset] < needed:
+        settings.echo(f'WARNING: -preset {preset} is the fastest but only encodes at {known[preset]}x, {needed:.2f}x is needed')
+    settings.echo(f'using -preset {preset} (every encode needs to run at {needed:.2f}x realtime)')
+    return preset
+
+
+def apply_preset(plan: Plan, preset):
+    """
+    Changes the encodes of ``plan`` (in place) to use ``preset``.
+    """
+    for step in plan.steps:
+        if step.argv and '-crf' in step.argv:
+            index = step.argv.index('-crf') + 2
+            if step.argv[index : index + 1] == ['-preset']:
+                step.argv[index + 1] = preset
+            else:
+                step.argv[index:index] = ['-preset', preset]
+
+
+def calibrate(plan: Plan, settings):
+    """
+    Picks the preset for ``settings.target_speed`` or ``settings.deadline`` (see :func:`select_preset`) and applies it to
+    ``settings`` and ``plan``.
+    """
+    if not plan.inputs or not any((step.argv and '-crf' in step.argv) or step.kind == 'clip' for step in plan.steps):
+        return
+    if preset := select_preset(plan, settings):
+        settings.preset = preset
+        apply_preset(plan, preset)
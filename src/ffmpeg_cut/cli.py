@@ -16,19 +16,75 @@ Why does this file exist, and why not put this in __main__?
 """
 
 import argparse
+import contextlib
+import copy
+import dataclasses
 import pathlib
 import re
 import shlex
 import subprocess
+import sys
 import textwrap
-
-from .structs import ClipList
+import uuid
+
+from . import jobs
+from .cache import ClipCache
+from .cache import content_key
+from .cache import parse_size
+from .calibrate import calibrate
+from .export import export_plan
+from .filters import optimize_filters
+from .jobs import JobPool
+from .jobs import ProcessGroup
+from .jobs import default_jobs
+from .journal import Journal
+from .journal import journal_path
+from .plan import AUDIO_MODES
+from .plan import PlanError
+from .plan import Rendition
+from .plan import Settings
+from .plan import apply_preview
+from .plan import check_settings
+from .plan import encode_argv
+from .plan import filter_graph
+from .plan import join_filters
+from .plan import parse_clips
+from .plan import parse_join
+from .plan import parse_text
+from .plan import plan_cut
+from .plan import plan_cuts
+from .plan import plan_filters
+from .plan import plan_join
+from .plan import preset_options
+from .plan import resolve_renditions
+from .plan import threads_options
+from .preflight import check_free_space
+from .preflight import preflight
+from .progress import ProgressReporter
+from .smartcut import Codecs
+from .smartcut import SmartCutPlan
+from .smartcut import format_timestamp
+from .smartcut import load_probes
+from .smartcut import plan_smart_cut
+from .smartcut import probe_codecs
+from .smartcut import probe_duration
+from .smartcut import probe_keyframes
+from .smartcut import save_probes
+from .spool import SpoolDir
+from .stream import Spool
+from .stream import relay
+from .structs import TIMESTAMP_RE
 from .structs import Cut
 from .structs import Instruction
+from .structs import Plan
+from .structs import Step
+from .trace import Tracer
+from .watch import check_watch
+from .watch import reuse_clips
+from .watch import snapshot
+from .watch import wait_for_change
 
-CLIP_COMMENT_RE = re.compile(r'# (?P<path>.+?) (?P<start>(\d\d:)?\d\d:\d\d.\d\d\d)-(?P<end>(\d\d:)?\d\d:\d\d.\d\d\d)')
 FILE_INSTRUCTION_RE = re.compile("file '(.+)'")
-TIMESTAMP_RE = re.compile(r'(?P<start>(\d\d:)?\d\d:\d\d.\d\d\d)-(?P<end>(\d\d:)?\d\d:\d\d.\d\d\d)')
 
 
 def parse_crop(value):
@@ -89,11 +145,35 @@ def parse_fps(value):
 
 
 def parse_cut(value):
-    if match := TIMESTAMP_RE.fullmatch(value):
-        groups = match.groupdict()
-        return Cut(groups['start'], groups['end'])
-    else:
-        raise argparse.ArgumentTypeError('must be value of the form: HH:MM:SS.mmm-HH:MM:SS.mmm')
+    if not TIMESTAMP_RE.fullmatch(value):
+        raise argparse.ArgumentTypeError('must be value of the form: [[HH:]MM:]SS[.mmm]-[[HH:]MM:]SS[.mmm]')
+    try:
+        return Cut.parse(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+
+
+class RenditionParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise argparse.ArgumentTypeError(message)
+
+
+rendition_parser = RenditionParser(prog='--rendition', add_help=False)
+rendition_parser.add_argument('-c', '--crop', type=parse_crop, action='extend', dest='filters', default=[])
+rendition_parser.add_argument('-f', '--filter', type=parse_filter, action='extend', dest='filters', default=[])
+rendition_parser.add_argument('-s', '--fps', type=parse_fps, action='extend', dest='filters', default=[])
+rendition_parser.add_argument('-e', '--encoder')
+rendition_parser.add_argument('-q', '--quality', type=int)
+rendition_parser.add_argument('--preset')
+rendition_parser.add_argument('output', type=pathlib.Path)
+
+
+def parse_rendition(value):
+    try:
+        options = rendition_parser.parse_args(shlex.split(value))
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+    return Rendition(**vars(options))
 
 
 parser = argparse.ArgumentParser(
@@ -110,6 +190,8 @@ If you use --text then the input file must contain instructions in the form:
     HH:MM:SS.mmm-HH:MM:SS.mmm
     HH:MM:SS.mmm-HH:MM:SS.mmm
     HH:MM:SS.mmm-HH:MM:SS.mmm
+
+To queue jobs on a shared worker pool instead see: ffmpeg-cut serve --help
 """,
 )
 parser_join_group = parser.add_mutually_exclusive_group()
@@ -133,262 +215,764 @@ parser_join_group.add_argument(
     '-n', '--no-join', help='only produce the intermediary clips and ffmpeg concat instruction file', action='store_true'
 )
 parser.add_argument('-q', '--quality', help='libx265 crf', type=int, default=15, metavar='CRF')
+parser.add_argument('--preset', help='encoder preset, eg: `veryfast` or `slow`')
+parser.add_argument(
+    '--target-speed',
+    help='use the slowest --preset that still encodes at least this many times faster than realtime (eg: 2), '
+    'measured with short sample encodes',
+    type=float,
+    metavar='SPEED',
+)
+parser.add_argument(
+    '--deadline',
+    help='use the slowest --preset that still encodes everything within this many seconds, measured with short sample encodes',
+    type=float,
+    metavar='SECONDS',
+)
 parser.add_argument('-d', '--dry-run', action='store_true')
+parser.add_argument(
+    '-p',
+    '--jobs',
+    help='how many clips to encode in parallel (default: a quarter of the CPU count)',
+    type=int,
+    default=default_jobs(),
+    metavar='N',
+)
 parser.add_argument('-r', '--dirty', action='store_true')
+parser.add_argument(
+    '-k', '--smart-cut', help='stream-copy whole GOPs and only re-encode the edges of each cut (no filters)', action='store_true'
+)
+parser.add_argument('--merge', help='merge overlapping or adjacent cuts of the same input (in place of the first one)', action='store_true')
+parser.add_argument(
+    '--chunk-length',
+    help='split a single cut or a filters-only encode in chunks of about this long (starting on keyframes) that are encoded in parallel',
+    type=float,
+    metavar='SECONDS',
+)
+parser.add_argument(
+    '--single-decode',
+    help='decode each input once and render all cuts in a single ffmpeg process, without intermediary clips',
+    action='store_true',
+)
+parser.add_argument(
+    '--stream-join',
+    help='pipe clips straight into the join step (as MPEG-TS) instead of writing intermediary clips',
+    action='store_true',
+)
+parser.add_argument(
+    '--stream-buffer',
+    help='how much of a clip that finished before its turn to be joined is kept in memory before spilling to disk (default: %(default)s)',
+    type=parse_size,
+    default='64M',
+    metavar='SIZE',
+)
+parser.add_argument(
+    '--preview',
+    help='quickly render a low resolution preview (same cuts and filters, fastest preset) to NAME.preview.EXT instead of the output',
+    action='store_true',
+)
+parser.add_argument(
+    '--spool',
+    help='queue the clip encodes as tasks in this directory (eg: on a shared filesystem) for `ffmpeg-cut worker` processes',
+    type=pathlib.Path,
+    metavar='DIR',
+)
+parser.add_argument(
+    '--scratch',
+    help='directory for the intermediary clips and chunks (eg: on a fast local disk) instead of next to the output',
+    type=pathlib.Path,
+    metavar='DIR',
+)
+parser.add_argument(
+    '--scratch-budget',
+    help='join the clips in batches that fit in about this much space, removing them as soon as they are joined',
+    type=parse_size,
+    metavar='SIZE',
+)
+parser.add_argument(
+    '--rendition',
+    help='also render the same cuts to another output, decoding them only once: OUTPUT with its own filters (-c, -f, -s), '
+    'encoder (-e), quality (-q) or --preset, eg: "small.mp4 -s 30 -q 28" (can be repeated)',
+    type=parse_rendition,
+    action='append',
+    dest='renditions',
+    default=[],
+    metavar='SPEC',
+)
+parser.add_argument(
+    '--export',
+    help='write the plan to a build file instead of running it: for ninja if FILE ends in .ninja, otherwise a Makefile',
+    type=pathlib.Path,
+    metavar='FILE',
+)
+parser.add_argument(
+    '--preflight',
+    help='probe the inputs before encoding anything: check that the cuts fit and re-encode the join if the inputs differ',
+    action='store_true',
+)
+parser.add_argument(
+    '--probe-cache',
+    help='keep what is probed from the inputs (duration, format) in FILE, so later runs only probe the inputs that changed',
+    type=pathlib.Path,
+    metavar='FILE',
+)
+parser.add_argument(
+    '--watch',
+    help='render the cut list again every time it or one of its inputs changes, only encoding the cuts that changed',
+    action='store_true',
+)
+parser.add_argument('--progress', help="show a progress bar with an ETA instead of ffmpeg's output", action='store_true')
+parser.add_argument(
+    '--metrics', help='append metrics (wall time, speed, size) for every ffmpeg run as JSON lines', type=pathlib.Path, metavar='FILE'
+)
+parser.add_argument(
+    '--trace', help='write a timeline of the run (every stage and ffmpeg command) as a Chrome trace', type=pathlib.Path, metavar='FILE'
+)
+parser.add_argument('--cache', help='directory where encoded clips are kept for reuse across runs', type=pathlib.Path, metavar='DIR')
+parser.add_argument(
+    '--cache-size', help='maximum size of the clip cache (default: %(default)s)', type=parse_size, default='20G', metavar='SIZE'
+)
+parser.add_argument(
+    '--optimize-filters',
+    help='reorder and simplify the filters (eg: reduce the frame rate before cropping), prints the graph before and after',
+    action='store_true',
+)
+parser.add_argument(
+    '--audio',
+    help="encode the audio (with ffmpeg's default codec or --audio-codec), copy it if the container allows it "
+    '(otherwise encode it with --audio-codec or AAC) or drop it (default: %(default)s)',
+    choices=AUDIO_MODES,
+    default='encode',
+)
+parser.add_argument('--audio-codec', help='audio encoder, eg: `aac` or `libopus`', metavar='CODEC')
+parser.add_argument(
+    '--audio-track',
+    help='only keep this audio track (counting from 0), can be repeated',
+    type=int,
+    action='append',
+    dest='audio_tracks',
+    default=[],
+    metavar='N',
+)
 parser.add_argument('-s', '--fps', dest='filters', action='extend', type=parse_fps, default=[])
 parser.add_argument(
     '-e', '--encoder', default='libx264', help='you can use `libx265` for better compression but possibly worse player support'
 )
 parser.add_argument('input', help='input file', type=pathlib.Path)
 parser.add_argument('output', help='output file', type=pathlib.Path)
+parser.set_defaults(reporter=None, tracer=None, echo=print)
 parser_cut_group.add_argument('-t', '--text', help='input file is text file with cuts', action='store_true')
 parser_cut_group.add_argument('-l', '--clips', help='input file is clips file with cuts', action='store_true')
 parser_cut_group.add_argument('cut', help='pair of timestamps to cut', type=parse_cut, nargs='?', action='append')
 parser.add_argument('cut', help='pair of timestamps to cut', type=parse_cut, nargs='*', action='extend')
 
 
-def clips_cut(args):
-    instructions = []
-
-    for line in args.input.read_text().splitlines():
-        line = line.strip()
-        if match := CLIP_COMMENT_RE.fullmatch(line):
-            groups = match.groupdict()
-            instructions.append(
-                current_instruction := Instruction(
-                    input=pathlib.Path(groups['path']),
-                    cut=[Cut(groups['start'], groups['end'])],
-                    args=args,
-                )
-            )
-            if not current_instruction.input.exists() and not args.dry_run:
-                raise parser.error(f'{line!r} does not exist')
-
-    print('parsed input:')
-    for instruction in instructions:
-        print(f'    {instruction}')
-
-    clips = ClipList()
-    for instruction in instructions:
-        multi_cut(clips, instruction)
+def execute(plan: Plan, args, pool: ProcessGroup | None = None):
+    """
+    Runs the steps of a plan. Clip encodes run in parallel (``args.jobs`` at a time), everything else runs in order.
+
+    If a ``pool`` is given the encodes are submitted to it instead (eg: a :class:`~ffmpeg_cut.jobs.PriorityGroup` shared
+    with other jobs) and cancelling it stops the plan.
+    """
+    if args.reporter:
+        args.reporter.add(plan.duration)
+
+    steps = iter(plan.steps)
+    step = next(steps, None)
+    while step:
+        match step.kind:
+            case 'clip' if args.spool:
+                clips = []
+                while step and step.kind == 'clip':
+                    clips.append(step)
+                    step = next(steps, None)
+                with stage(args, 'spooled clips'):
+                    run_spooled(clips, args, None if args.dry_run else Journal(journal_path(plan.output)))
+                continue
+            case 'clip':
+                with stage(args, 'clips'), pool or JobPool(args.jobs) as clip_pool:
+                    cache = ClipCache(args.cache, args.cache_size) if args.cache else None
+                    journal = None if args.dry_run else Journal(journal_path(plan.output))
+                    # only the clips that are removed after the join may share their data with the cache
+                    intermediate = {path for cleanup in plan.steps if cleanup.kind == 'cleanup' for path in cleanup.paths}
+                    while step and step.kind == 'clip':
+                        run_clip(step, args, clip_pool, cache, journal if '-n' in step.options else None, link=step.output in intermediate)
+                        step = next(steps, None)
+                continue
+            case 'split':
+                with stage(args, 'splits'), pool or JobPool(args.jobs) as split_pool:
+                    journal = None if args.dry_run else Journal(journal_path(plan.output))
+                    while step and step.kind == 'split':
+                        run_split(step, args, split_pool, journal)
+                        step = next(steps, None)
+                continue
+            case 'chunk':
+                with stage(args, 'chunks'), pool or JobPool(args.jobs) as chunk_pool:
+                    while step and step.kind == 'chunk':
+                        if args.dry_run:
+                            check_call(*step.argv, dry_run=True, echo=args.echo)
+                        else:
+                            chunk_pool.submit(
+                                check_call,
+                                *step.argv,
+                                dry_run=False,
+                                pool=chunk_pool,
+                                reporter=args.reporter,
+                                tracer=args.tracer,
+                                duration=step.duration,
+                                echo=args.echo,
+                            )
+                        step = next(steps, None)
+                continue
+            case 'stream':
+                streams = []
+                while step.kind == 'stream':
+                    streams.append(step)
+                    step = next(steps)
+                with stage(args, 'stream join'):
+                    run_streams(streams, step, args, pool)
+            case 'encode':
+                if pool is None:
+                    check_call(
+                        *step.argv,
+                        dry_run=args.dry_run,
+                        reporter=args.reporter,
+                        duration=step.duration,
+                        echo=args.echo,
+                        tracer=args.tracer,
+                    )
+                else:
+                    with pool:
+                        pool.submit(
+                            check_call,
+                            *step.argv,
+                            dry_run=args.dry_run,
+                            pool=pool,
+                            reporter=args.reporter,
+                            tracer=args.tracer,
+                            duration=step.duration,
+                            echo=args.echo,
+                        )
+            case 'write':
+                if args.dry_run:
+                    args.echo(f'would write to {step.output}:')
+                    args.echo(textwrap.indent(step.content, '    '))
+                else:
+                    with stage(args, f'write {step.output.name}'):
+                        step.output.write_text(step.content)
+            case 'join':
+                if args.dry_run:
+                    args.echo('would run:')
+                check_call(*step.argv, dry_run=args.dry_run, pool=pool, reporter=args.reporter, echo=args.echo, tracer=args.tracer)
+            case 'cleanup':
+                if not args.dry_run:
+                    with stage(args, 'cleanup', paths=len(step.paths)):
+                        for path in step.paths:
+                            path.unlink(missing_ok=True)
+            case _:
+                raise PlanError(f'unknown step: {step}')
+        step = next(steps, None)
 
-    join_clips(clips, args)
 
+def stage(args, name, **details):
+    """
+    Traces a stage of the run (if there's a tracer).
+    """
+    if args.tracer and not args.dry_run:
+        return args.tracer.span(name, 'stage', **details)
+    return contextlib.nullcontext()
 
-def text_cut(args):
-    instructions = []
-    current_instruction = None
 
-    for line in args.input.read_text().splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        if match := TIMESTAMP_RE.fullmatch(line):
-            if current_instruction is None:
-                parser.error(f'did not find a path before {line!r}')
-            else:
-                groups = match.groupdict()
-                current_instruction.cut.append(Cut(groups['start'], groups['end']))
+def run_clip(step: Step, args, pool: ProcessGroup, cache: ClipCache | None, journal: Journal | None = None, link=False):
+    """
+    Submits the encode of a clip to the ``pool``, unless the ``journal`` says it's already done or it's in the ``cache``.
+    Clips are only hard-linked to and from the cache if ``link`` (see :func:`~ffmpeg_cut.cache.clone_file`).
+    """
+    if args.dry_run:
+        if cache and step.input.exists():
+            args.echo(f'    # would reuse {cache.entry(clip_key(step, args), step.output.suffix)} if cached')
+        cut_clip(step.input, step.cut, step.output, args, *step.options)
+        return
+
+    key = clip_key(step, args) if cache or journal else None
+    if journal:
+        if journal.finished(step.output, key):
+            return
+        step.output.unlink(missing_ok=True)  # not finished, or encoded with other settings
+    if cache and cache.fetch(key, step.output, link=link):
+        args.echo(f'reused {step.output} from cache')
+        if journal:
+            record_clip(step, args, journal, key)
+        return
+    pool.submit(encode_step, step, args, pool=pool, cache=cache, key=key, journal=journal, link=link)
+
+
+def encode_step(step: Step, args, pool=None, cache=None, key=None, journal=None, tag='partial', link=False):
+    """
+    Encodes a clip. Resumable clips (``-n``) are written to a temporary name that is renamed when complete, so an
+    interrupted encode never leaves a truncated clip behind.
+    """
+    if '-n' in step.options:
+        partial = step.output.with_stem(f'{step.output.stem}.{tag}')
+        partial.unlink(missing_ok=True)  # left behind by a run that was killed
+        try:
+            cut_clip(step.input, step.cut, partial, args, *step.options, pool=pool)
+            partial.replace(step.output)
+        finally:
+            partial.unlink(missing_ok=True)
+    else:
+        cut_clip(step.input, step.cut, step.output, args, *step.options, pool=pool)
+    if cache:
+        cache.store(key, step.output, link=link)
+    if journal:
+        record_clip(step, args, journal, key)
+
+
+def run_split(step: Step, args, pool: ProcessGroup, journal: Journal | None = None):
+    """
+    Submits a split (the clips of all the renditions of a cut, from a single decode) to the ``pool``, unless the
+    ``journal`` says that all its clips are already done.
+    """
+    if args.dry_run:
+        check_call(*step.argv, dry_run=True, echo=args.echo)
+        return
+
+    clips = [dataclasses.replace(step, output=output, paths=[]) for output in [step.output, *step.paths]]
+    keys = [clip_key(clip, args, rendition) for clip, rendition in zip(clips, resolve_renditions(args))]
+    if journal and all(journal.finished(clip.output, key) for clip, key in zip(clips, keys)):
+        return
+    pool.submit(split_step, step, clips, keys, args, pool=pool, journal=journal)
+
+
+def split_step(step: Step, clips: list[Step], keys, args, pool=None, journal=None):
+    """
+    Runs a split. Like :func:`encode_step` the clips are written to a temporary name and renamed once the split is
+    complete, then recorded in the ``journal``.
+    """
+    partials = {clip.output: clip.output.with_stem(f'{clip.output.stem}.partial') for clip in clips}
+    try:
+        check_call(
+            *(partials.get(arg, arg) for arg in step.argv),
+            dry_run=False,
+            pool=pool,
+            reporter=args.reporter,
+            tracer=args.tracer,
+            duration=step.duration,
+            echo=args.echo,
+        )
+        for output, partial in partials.items():
+            partial.replace(output)
+    finally:
+        for partial in partials.values():
+            partial.unlink(missing_ok=True)
+    if journal:
+        for clip, key in zip(clips, keys):
+            record_clip(clip, args, journal, key)
+
+
+def record_clip(step: Step, args, journal: Journal, key):
+    duration = probe_duration(step.output)
+    if step.duration and duration < step.duration - 1:
+        args.echo(f'WARNING: {step.output} is {duration:.3f}s long instead of {step.duration:.3f}s (does the input end before the cut?)')
+    journal.record(step.output, key, duration)
+
+
+def run_spooled(steps: list[Step], args, journal: Journal | None = None):
+    """
+    Queues the clip encodes in the ``args.spool`` directory and waits for workers to do them.
+    """
+    spool = SpoolDir(args.spool)
+    run_id = uuid.uuid4().hex[:12]
+    queued = {}
+    for index, step in enumerate(steps):
+        if journal and '-n' in step.options:
+            key = clip_key(step, args)
+            if journal.finished(step.output, key):
+                continue
         else:
-            instructions.append(
-                current_instruction := Instruction(
-                    input=pathlib.Path(line),
-                    cut=[],
-                    args=args,
-                )
-            )
-            if not current_instruction.input.exists() and not args.dry_run:
-                parser.error(f'{line!r} does not exist')
+            key = None
+        name = f'{run_id}-{index:03}'
+        task_step = dataclasses.replace(step, input=step.input.absolute(), output=step.output.absolute())
+        if args.dry_run:
+            args.echo(f'    # would queue {name}: {task_step.input} {task_step.cut} -> {task_step.output}')
+            continue
+        spool.submit(
+            name,
+            {
+                'step': task_step.as_dict(),
+                'settings': {
+                    'filters': args.filters,
+                    'encoder': args.encoder,
+                    'quality': args.quality,
+                    'preset': args.preset,
+                    'smart_cut': args.smart_cut,
+                    'dirty': args.dirty,
+                    'audio': args.audio,
+                    'audio_codec': args.audio_codec,
+                    'audio_tracks': args.audio_tracks,
+                },
+            },
+        )
+        queued[name] = step, key
 
-    print('parsed input:')
-    for instruction in instructions:
-        print(f'    {instruction}')
+    def done(name):
+        step, key = queued[name]
+        if key:
+            record_clip(step, args, journal, key)
+        if args.reporter:
+            args.reporter.advance(step.duration or 0)
 
-    if args.dry_run:
-        print('would run:')
+    if queued:
+        args.echo(f'queued {len(queued)} clips in {args.spool}, waiting for workers')
+        spool.wait(queued, done=done)
 
-    clips = ClipList()
-    for instruction in instructions:
-        multi_cut(clips, instruction)
 
-    join_clips(clips, args)
+def run_task(task: dict, jobs=1, echo=print):
+    """
+    Encodes a clip queued by :func:`run_spooled` (the worker side). The temporary name is unique so a task that runs twice
+    (after its lease expired) doesn't clash with itself.
+    """
+    step = Step.from_dict(task['step'])
+    settings = Settings(output=step.output, jobs=jobs, echo=echo, **task['settings'])
+    encode_step(step, settings, tag=f'partial-{uuid.uuid4().hex[:8]}')
 
 
-def check_call(*args, dry_run):
+def run_streams(streams: list[Step], mux: Step, args, pool: ProcessGroup | None = None):
+    if args.dry_run:
+        for stream in streams:
+            check_call(*stream.argv, dry_run=True, echo=args.echo)
+        args.echo('    # would pipe the output of all the commands above (in order) to:')
+        check_call(*mux.argv, dry_run=True, echo=args.echo)
+        return
+
+    spools = []
+    with pool or JobPool(args.jobs) as pool:
+        for stream in streams:
+            spools.append(spool := Spool(args.stream_buffer, dir=args.scratch))
+            future = pool.submit(
+                check_call,
+                *stream.argv,
+                dry_run=False,
+                pool=pool,
+                stdout=spool.write,
+                reporter=args.reporter,
+                tracer=args.tracer,
+                duration=stream.duration,
+                echo=args.echo,
+            )
+            future.add_done_callback(spool.close_from_future)
+        with args.tracer.command(mux.argv) if args.tracer else contextlib.nullcontext() as usage:
+            muxer = subprocess.Popen(mux.argv, stdin=subprocess.PIPE)
+            try:
+                complete = relay(spools, muxer.stdin)
+            except BaseException:
+                muxer.kill()
+                raise
+            finally:
+                muxer.stdin.close()
+            if not complete:
+                muxer.kill()
+            jobs.wait_process(muxer, usage)
+            if complete and muxer.returncode:
+                raise subprocess.CalledProcessError(muxer.returncode, mux.argv)
+
+
+def check_call(*args, dry_run, pool=None, stdout=None, reporter=None, duration=None, echo=print, tracer=None):
     pretty = ' '.join(shlex.quote(str(i)) for i in args)
     width = len(pretty) + 8
     if dry_run:
-        print(f'    {pretty}')
-    else:
-        print('=' * width)
-        print(f'    {pretty}')
-        print('=' * width)
-        subprocess.check_call(args)
-
-
-def multi_cut(clips: ClipList, args):
-    cuts = args.cut
-    output = args.output
-
-    for cut in cuts:
-        clips.append(args.input, cut, clip := output.with_stem(f'{output.stem}-{len(clips):03}').with_suffix(output.suffix))
-        if args.dry_run:
-            check_call(
-                'ffmpeg',
-                '-ss',
-                cut.start,
-                '-to',
-                cut.end,
-                '-i',
-                args.input,
-                *join_filters(args.filters),
-                '-c:v',
-                args.encoder,
-                '-crf',
-                str(args.quality),
-                clip,
-                dry_run=True,
-            )
-        else:
-            if clip.exists():
-                if clip.stat().st_size:
-                    continue
+        echo(f'    {pretty}')
+        return
+    with tracer.command(args) if tracer else contextlib.nullcontext() as usage:
+        if reporter:
+            progress = reporter.track(args[-1], duration)
+            returncode = 0
+            try:
+                if pool is None:
+                    jobs.check_call(args, stdout=stdout, progress=progress, usage=usage)
                 else:
-                    clip.unlink()
+                    pool.check_call(args, stdout=stdout, progress=progress, usage=usage)
+            except subprocess.CalledProcessError as exc:
+                returncode = exc.returncode
+                raise
+            except BaseException:
+                returncode = None
+                raise
+            finally:
+                progress.finish(returncode)
+        else:
+            echo('=' * width)
+            echo(f'    {pretty}')
+            echo('=' * width)
+            if pool is None:
+                jobs.check_call(args, usage=usage)
+            else:
+                pool.check_call(args, stdout=stdout, usage=usage)
+
+
+def clip_key(step: Step, args, rendition=None):
+    """
+    The key of everything that affects the clip of ``step``. The filters and encoder settings are the ones of
+    ``rendition`` if given (for the clips of a split).
+    """
+    rendition = rendition or args
+    return content_key(
+        step.input,
+        step.cut,
+        join_filters(rendition.filters),
+        rendition.encoder,
+        rendition.quality,
+        args.smart_cut,
+        rendition.preset,
+        step.output.suffix,
+        args.audio,
+        args.audio_codec,
+        args.audio_tracks,
+    )
+
+
+def cut_clip(input, cut: Cut, output, args, *options, pool=None):
+    if args.smart_cut:
+        codecs = None if args.dry_run and not input.exists() else probe_codecs(input)
+        if codecs is None or codecs.supported:
+            smart_cut(input, cut, output, args, codecs, *options, pool=pool)
+        else:
+            args.echo(f'WARNING: cannot smart cut {input} ({codecs}), re-encoding everything')
+            encode_clip(input, cut, output, args, *options, pool=pool)
+    else:
+        encode_clip(input, cut, output, args, *options, pool=pool)
+
+
+def encode_clip(input, cut: Cut, output, args, *options, pool=None):
+    check_call(
+        *encode_argv(input, cut, output, args, *options),
+        dry_run=args.dry_run,
+        pool=pool,
+        reporter=args.reporter,
+        tracer=args.tracer,
+        duration=cut.duration,
+        echo=args.echo,
+    )
+
+
+def smart_cut(input, cut: Cut, output, args, codecs: Codecs, *options, pool=None):
+    start = cut.start / 1000
+    end = cut.end / 1000
+    if codecs is None:
+        args.echo(f'    # would probe keyframes of {input} between {cut.start_timestamp} and {cut.end_timestamp}')
+        plan = SmartCutPlan(head=(start, end), copy=None, tail=None)
+        encode_options = ['-c:v', args.encoder, '-crf', str(args.quality), *preset_options(args)]
+    else:
+        plan = plan_smart_cut(probe_keyframes(input, start, end), start, end)
+        encode_options = [*codecs.video_options, '-crf', str(args.quality), *preset_options(args)]
+        for index, encoder in enumerate(codecs.audio_encoders):
+            encode_options.extend([f'-c:a:{index}', encoder])
+
+    parts = []
+    for name, span, codec_options in [
+        ('head', plan.head, [*encode_options, *threads_options(args)]),
+        ('copy', plan.copy, ['-c', 'copy']),
+        ('tail', plan.tail, [*encode_options, *threads_options(args)]),
+    ]:
+        if span:
+            part_start, part_end = span
+            parts.append(part := output.with_stem(f'{output.stem}.{name}').with_suffix('.ts'))
             check_call(
                 'ffmpeg',
-                '-n',
+                '-y',
                 '-ss',
-                cut.start,
+                format_timestamp(part_start),
                 '-to',
-                cut.end,
+                format_timestamp(part_end),
                 '-i',
-                args.input,
-                *join_filters(args.filters),
-                '-c:v',
-                args.encoder,
-                '-crf',
-                str(args.quality),
-                clip,
+                input,
+                '-map',
+                '0:v:0',
+                '-map',
+                '0:a?',
+                *codec_options,
+                part,
                 dry_run=args.dry_run,
+                pool=pool,
+                reporter=args.reporter,
+                tracer=args.tracer,
+                duration=part_end - part_start,
+                echo=args.echo,
             )
 
-
-def join_clips(clips: ClipList, args, dirty=False):
-    clips_file = args.output.with_suffix('.clips')
-
+    parts_file = output.with_suffix('.parts')
+    parts_input = ''.join(f'file {str(part.absolute())!r}\n' for part in parts)
     if args.dry_run:
-        print(f'would write to {clips_file}:')
-        print(textwrap.indent(clips.as_concat_input(), '    '))
-        print('would run:')
+        args.echo(f'    # would write to {parts_file}:')
+        args.echo(textwrap.indent(parts_input.rstrip('\n'), '    #     '))
     else:
-        clips_file.write_text(clips.as_concat_input())
-
-    if not args.no_join:
-        check_call('ffmpeg', '-f', 'concat', '-i', clips_file, '-c', 'copy', args.output, dry_run=args.dry_run)
-        if not args.dry_run and not args.dirty and not dirty:
-            for clip in clips.outputs:
-                clip.unlink()
-
-
-def join_filters(filters):
-    if filters:
-        filter_chain = []
-        last_step = len(filters) - 1
-        for step, filter in enumerate(filters):
-            if step == last_step:
-                output = ''
-            else:
-                output = f'[step_{step}]'
-            if step:
-                filter_chain.append(f'[step_{step - 1}]{filter}{output}')
-            else:
-                filter_chain.append(f'[0:v]{filter}{output}')
+        parts_file.write_text(parts_input)
+    check_call(
+        'ffmpeg',
+        *options,
+        '-f',
+        'concat',
+        '-safe',
+        '0',
+        '-i',
+        parts_file,
+        '-c',
+        'copy',
+        output,
+        dry_run=args.dry_run,
+        pool=pool,
+        reporter=args.reporter,
+        tracer=args.tracer,
+        echo=args.echo,
+    )
+    if not args.dry_run and not args.dirty:
+        parts_file.unlink()
+        for part in parts:
+            part.unlink()
+
+
+def build_plan(args, base=None) -> Plan:
+    """
+    Plans what the command line ``args`` ask for. Relative paths in input files are relative to ``base`` (the current
+    directory by default). Invalid input raises :class:`PlanError`.
+    """
+    if args.probe_cache:
+        load_probes(args.probe_cache)
+    with stage(args, 'plan'):
+        plan = plan_args(args, base)
+    if args.target_speed or args.deadline:
+        with stage(args, 'calibrate'):
+            calibrate(plan, args)
+    infos = None
+    if args.preflight:
+        with stage(args, 'preflight'):
+            infos = preflight(plan, args)
+    if not args.dry_run:
+        if args.preflight or args.scratch_budget:
+            with stage(args, 'check free space'):
+                check_free_space(plan, args, infos)
+        if args.scratch:
+            args.scratch.mkdir(parents=True, exist_ok=True)
+    if args.probe_cache:
+        save_probes(args.probe_cache)
+    return plan
+
+
+def plan_args(args, base=None) -> Plan:
+    if args.join:
+        with args.input.open('r') as fh:
+            return plan_join(parse_join(fh, echo=args.echo, base=base), args)
+
+    if args.no_join:
+        args.dirty = True
+    if args.preview:
+        apply_preview(args)
+    if args.optimize_filters and args.filters:
+        optimized = optimize_filters(args.filters)
+        args.echo('filter graph:')
+        args.echo(f'    {filter_graph(args.filters)}')
+        args.echo('optimized filter graph:')
+        args.echo(f'    {filter_graph(optimized)}')
+        args.filters = optimized
+    check_settings(args)
+
+    match args.cut:
+        case [None] | []:
+            if args.text:
+                with args.input.open('r') as fh:
+                    instructions = parse_text(fh, check_exists=not args.dry_run, base=base)
+            elif args.clips:
+                with args.input.open('r') as fh:
+                    instructions = parse_clips(fh, check_exists=not args.dry_run, base=base)
+            elif args.filters:
+                if args.dry_run:
+                    args.echo('would run:')
 
-        return ['-filter_complex', ';'.join(filter_chain)]
-    else:
-        return []
+                return plan_filters(args.input, args)
+            else:
+                raise PlanError('no crop and no timestamps')
+
+            args.echo('parsed input:')
+            for instruction in instructions:
+                args.echo(f'    {instruction}')
+
+            if args.text and args.dry_run:
+                args.echo('would run:')
+
+            return plan_cuts(instructions, args)
+        case [Cut() as cut]:
+            if args.dry_run:
+                args.echo('would run:')
+
+            return plan_cut(args.input, cut, args)
+        case _:
+            if args.dry_run and (args.single_decode or args.stream_join):
+                args.echo('would run:')
+
+            return plan_cuts([Instruction(input=args.input, cut=args.cut)], args)
+
+
+def watch(args):
+    """
+    Renders the cut list, then renders it again every time it or one of its inputs changes (until interrupted).
+    """
+    args.dirty = True  # the next render needs the clips and their journal
+    while True:
+        state = snapshot([args.input])
+        render = copy.copy(args)  # planning changes the settings (eg: --preview)
+        try:
+            plan = build_plan(render)
+            state.update(snapshot(plan.inputs))
+            if not args.dry_run:
+                reused, encode = reuse_clips(plan, lambda step, render=render: clip_key(step, render))
+                args.echo(f'reusing {reused} clips, encoding {encode}')
+            execute(plan, render)
+        except (PlanError, OSError, subprocess.CalledProcessError) as exc:
+            args.echo(f'ERROR: {exc}')
+        args.echo(f'watching {args.input} and {len(state) - 1} inputs for changes (press Ctrl+C to stop)')
+        try:
+            changed = wait_for_change(state)
+        except KeyboardInterrupt:
+            return
+        args.echo(f'changed: {", ".join(str(path) for path in changed)}')
 
 
 def process(args):
-    if args.join:
-        clips = ClipList()
-        with args.input.open('r') as fh:
-            while True:
-                line = fh.readline()
-                if not line:
-                    break
-                line = line.strip()
-                if line.startswith('#'):
-                    original_file, cut = line[1:].strip().split()
-                    cut = parse_cut(cut)
-                elif line:
-                    match shlex.split(line):
-                        case ['file', clip_path]:
-                            clip_file = pathlib.Path(clip_path)
-                            if clip_file.exists():
-                                clips.append(original_file, cut, clip_file)
-                            else:
-                                print(f'WARNING: {clip_file!r} does not exist!')
-                        case junk:
-                            print(f'WARNING: found junk in clips file: {junk!r}')
-
-        join_clips(clips, args, dirty=True)
-    else:
-        if args.no_join:
-            args.dirty = True
-
-        match args.cut:
-            case [None] | []:
-                if args.text:
-                    text_cut(args)
-                elif args.clips:
-                    clips_cut(args)
-                elif args.filters:
-                    if args.dry_run:
-                        print('would run:')
-
-                    check_call(
-                        'ffmpeg',
-                        '-i',
-                        args.input,
-                        *join_filters(args.filters),
-                        '-c:v',
-                        args.encoder,
-                        '-crf',
-                        str(args.quality),
-                        args.output,
-                        dry_run=args.dry_run,
-                    )
-                else:
-                    parser.error('no crop and no timestamps')
-            case [(start, end)]:
-                if args.dry_run:
-                    print('would run:')
-
-                check_call(
-                    'ffmpeg',
-                    '-ss',
-                    start,
-                    '-to',
-                    end,
-                    '-i',
-                    args.input,
-                    *join_filters(args.filters),
-                    '-c:v',
-                    args.encoder,
-                    '-crf',
-                    str(args.quality),
-                    args.output,
-                    dry_run=args.dry_run,
-                )
-            case _:
-                clips = ClipList()
-                multi_cut(clips, args)
-                join_clips(clips, args)
+    if args.watch:
+        try:
+            check_watch(args)
+        except PlanError as exc:
+            parser.error(str(exc))
+        watch(args)
+        return
+    try:
+        plan = build_plan(args)
+        if args.export:
+            export_plan(plan, args.export)
+            args.echo(f'wrote {args.export}')
+            return
+    except PlanError as exc:
+        parser.error(str(exc))
+    execute(plan, args)
 
 
 def run(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if args[:1] in (['serve'], ['submit'], ['status'], ['cancel'], ['worker']):
+        from .server import run as run_server  # the server builds on this module
+
+        run_server(args)
     args = parser.parse_args(args=args)
-    process(args.names)
+    if (args.progress or args.metrics) and not args.dry_run:
+        args.reporter = ProgressReporter(show=args.progress, metrics=args.metrics)
+    if args.trace and not args.dry_run:
+        args.tracer = Tracer(args.trace)
+    try:
+        process(args)
+    finally:
+        if args.reporter:
+            args.reporter.close()
+        if args.tracer:
+            args.tracer.close()
     parser.exit(0)
@@ -0,0 +1,149 @@
+"""
+Export of a plan as a build file (Ninja or Make), so the encodes can be run by a build tool that runs them in parallel
+and only redoes the ones whose inputs or commands changed.
+
+Every command step is an edge that produces its ``output`` (and the clips of the other renditions for ``split`` steps)
+and depends on the files it reads with ``-i``. For concat lists (written by the export, as they are part of the plan) the
+edge also depends on the files in the list. Cleanup steps are left out as build tools need the intermediary clips to know
+what's up to date.
+"""
+
+import pathlib
+import shlex
+from dataclasses import dataclass
+from dataclasses import field
+
+from .plan import PlanError
+from .plan import tokenize
+from .structs import Plan
+
+COMMAND_STEPS = ('clip', 'chunk', 'split', 'encode', 'join')
+HEADER = '# generated by ffmpeg-cut, rerun it to update this file\n'
+
+
+@dataclass
+class Edge:
+    output: pathlib.Path
+    argv: list[str]
+    inputs: list[pathlib.Path]
+    other_outputs: list[pathlib.Path] = field(default_factory=list)
+
+    @property
+    def command(self):
+        return shlex.join(self.argv)
+
+    @property
+    def outputs(self):
+        return [self.output, *self.other_outputs]
+
+
+def listed_files(content: str) -> list[pathlib.Path]:
+    return [pathlib.Path(token.value) for token in tokenize(content.splitlines()) if token.kind == 'file']
+
+
+def plan_edges(plan: Plan) -> tuple[list[Edge], dict[pathlib.Path, str]]:
+    """
+    Returns the command edges of ``plan`` and the files that its ``write`` steps write (path to content).
+    """
+    edges = []
+    files = {}
+    outputs = {}  # concat lists may have absolute paths, these map them back to the outputs of the edges
+    for step in plan.steps:
+        if step.kind == 'write':
+            files[pathlib.Path(step.output)] = step.content
+        elif step.kind in COMMAND_STEPS:
+            if step.argv is None:
+                raise PlanError(f'cannot export {step.output}: smart cuts depend on the keyframes of the input')
+            # ffmpeg must overwrite: the build tool decides what needs to be done again
+            argv = ['-y' if arg == '-n' else str(arg) for arg in step.argv]
+            inputs = []
+            for option, value in zip(argv, argv[1:]):
+                if option == '-i' and not value.startswith('pipe:'):
+                    path = pathlib.Path(value)
+                    inputs.append(path)
+                    if path in files:
+                        inputs.extend(outputs.get(file.absolute(), file) for file in listed_files(files[path]))
+            other_outputs = [pathlib.Path(path) for path in step.paths] if step.kind == 'split' else []
+            edges.append(Edge(pathlib.Path(step.output), argv, list(dict.fromkeys(inputs)), other_outputs))
+            for output in edges[-1].outputs:
+                outputs[output.absolute()] = output
+        elif step.kind != 'cleanup':
+            raise PlanError(f'cannot export {step.kind} steps (use it without --stream-join)')
+    return edges, files
+
+
+def final_outputs(edges: list[Edge]) -> list[pathlib.Path]:
+    """
+    Returns the outputs that no other edge uses (the joined output, or the clips with ``--no-join``).
+    """
+    used = {input for edge in edges for input in edge.inputs}
+    return [output for edge in edges for output in edge.outputs if output not in used]
+
+
+def ninja_path(path) -> str:
+    return str(path).replace('$', '$$').replace(' ', '$ ').replace(':', '$:')
+
+
+def make_path(path) -> str:
+    if any(char in str(path) for char in '\n%'):
+        raise PlanError(f'cannot use {path} in a Makefile')
+    return str(path).replace('$', '$$').replace('#', r'\#').replace(' ', r'\ ').replace(':', r'\:')
+
+
+def write_if_changed(path: pathlib.Path, content: str):
+    """
+    Leaves the file alone (and its mtime) if it already has the ``content``.
+    """
+    try:
+        if path.read_text() == content:
+            return
+    except FileNotFoundError:
+        pass
+    path.write_text(content)
+
+
+def export_ninja(plan: Plan, path: pathlib.Path):
+    """
+    Writes a Ninja build file. Ninja reruns edges whose command changed by itself.
+    """
+    edges, files = plan_edges(plan)
+    lines = [HEADER, 'rule ffmpeg', '  command = $cmd', '  description = ffmpeg $out', '']
+    for edge in edges:
+        targets = ' '.join(ninja_path(output) for output in edge.outputs)
+        lines.append(f'build {targets}: ffmpeg {" ".join(ninja_path(input) for input in edge.inputs)}'.rstrip())
+        lines.append(f'  cmd = {edge.command.replace("$", "$$")}')
+        lines.append('')
+    lines.append(f'default {" ".join(ninja_path(output) for output in final_outputs(edges))}')
+    for file, content in files.items():
+        write_if_changed(file, content)
+    write_if_changed(path, '\n'.join(lines) + '\n')
+
+
+def export_make(plan: Plan, path: pathlib.Path):
+    """
+    Writes a Makefile. Make only looks at mtimes so the command of every edge is kept in ``OUTPUT.cmd`` (rewritten when it
+    changes) which the edge depends on. Edges with several outputs are grouped targets (GNU Make 4.3 or later).
+    """
+    edges, files = plan_edges(plan)
+    lines = [HEADER, '.DELETE_ON_ERROR:', '.PHONY: all', f'all: {" ".join(make_path(output) for output in final_outputs(edges))}', '']
+    for edge in edges:
+        command_file = edge.output.with_name(f'{edge.output.name}.cmd')
+        write_if_changed(command_file, edge.command + '\n')
+        targets = ' '.join(make_path(output) for output in edge.outputs)
+        separator = '&:' if edge.other_outputs else ':'
+        lines.append(f'{targets}{separator} {" ".join(make_path(input) for input in [*edge.inputs, command_file])}')
+        lines.append(f'\t{edge.command.replace("$", "$$")}')
+        lines.append('')
+    for file, content in files.items():
+        write_if_changed(file, content)
+    write_if_changed(path, '\n'.join(lines))
+
+
+def export_plan(plan: Plan, path: pathlib.Path):
+    """
+    Writes ``plan`` as a Ninja build file if ``path`` ends in ``.ninja``, otherwise as a Makefile.
+    """
+    if path.suffix == '.ninja':
+        export_ninja(plan, path)
+    else:
+        export_make(plan, path)
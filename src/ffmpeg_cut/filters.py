@@ -0,0 +1,151 @@
+"""
+Optimization pass over the filter steps (``--crop``, ``--filter``, ``--fps``) before they are chained by
+:func:`~ffmpeg_cut.plan.filter_graph`.
+
+Steps are either simple chains (``name=arguments`` filters separated by commas, which are split in individual filters)
+or whole graphs with labels that are kept as they are.
+"""
+
+import re
+
+# filters that turn every input frame in one output frame with the same timestamp
+FRAME_FILTERS = {
+    'boxblur',
+    'crop',
+    'drawbox',
+    'eq',
+    'format',
+    'gblur',
+    'hflip',
+    'hue',
+    'null',
+    'overlay',
+    'pad',
+    'scale',
+    'setdar',
+    'setsar',
+    'split',
+    'transpose',
+    'unsharp',
+    'vflip',
+}
+LABEL_RE = re.compile(r'\[[^\]]*\]')
+UNPARSED = set('\'"\\')
+
+
+def parse_chain(step: str):
+    """
+    Splits a simple filter chain in ``(name, arguments)`` pairs. Returns ``None`` for graphs (steps with labels) and
+    anything quoted or escaped.
+    """
+    if UNPARSED.intersection(step) or LABEL_RE.search(step) or ';' in step:
+        return None
+    filters = []
+    for part in step.split(','):
+        name, _, arguments = part.strip().partition('=')
+        filters.append((name, arguments))
+    return filters
+
+
+def filter_names(graph: str):
+    return [part.partition('=')[0].strip() for part in re.split('[;,]', LABEL_RE.sub('', graph))]
+
+
+def is_frame_filter(node) -> bool:
+    """
+    Whether a frame rate reduction can be moved before ``node`` without changing the output: all its filters must work
+    frame by frame and it must not read the input (``[0:v]``) again.
+    """
+    if isinstance(node, tuple):
+        return node[0] in FRAME_FILTERS
+    if '[0:v]' in node or UNPARSED.intersection(node):
+        return False
+    return all(name in FRAME_FILTERS for name in filter_names(node))
+
+
+def positional(arguments: str, count: int):
+    """
+    Returns the first ``count`` positional arguments as integers if there are exactly that many and nothing else,
+    otherwise ``None``.
+    """
+    values = arguments.split(':')
+    if len(values) != count:
+        return None
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        return None
+
+
+def is_noop(node, previous) -> bool:
+    if not isinstance(node, tuple):
+        return False
+    name, arguments = node
+    return (
+        name == 'null'
+        or (name == 'scale' and arguments in ('iw:ih', '-1:-1'))
+        or (name == 'crop' and arguments in ('iw:ih', 'iw:ih:0:0'))
+        or (name == 'setpts' and arguments == 'PTS')
+        or (name == 'fps' and node == previous)
+    )
+
+
+def merge(previous, node):
+    """
+    Returns the filter that does the same as ``previous`` followed by ``node``, or ``None`` if they can't be merged.
+    """
+    if not (isinstance(previous, tuple) and isinstance(node, tuple)) or previous[0] != node[0]:
+        return None
+    match node[0]:
+        case 'crop':
+            first = positional(previous[1], 4)
+            second = positional(node[1], 4)
+            if first and second:
+                width, height, x, y = second
+                return 'crop', f'{width}:{height}:{first[2] + x}:{first[3] + y}'
+        case 'scale':
+            # the first scale doesn't matter if the second one has a fixed size, and nothing else (eg:
+            # force_original_aspect_ratio or -1 depend on the size that the first one makes)
+            size = positional(node[1], 2)
+            if size and all(value > 0 for value in size):
+                return node
+    return None
+
+
+def optimize_filters(filters: list[str]) -> list[str]:
+    """
+    Moves frame rate reductions (``fps``) as early as possible, merges adjacent crops and scales and drops steps that
+    don't do anything.
+    """
+    nodes = []
+    for step in filters:
+        nodes.extend(parse_chain(step) or [step])
+
+    for index, node in enumerate(nodes):
+        if isinstance(node, tuple) and node[0] == 'fps':
+            position = index
+            while position and is_frame_filter(nodes[position - 1]):
+                nodes[position - 1], nodes[position] = nodes[position], nodes[position - 1]
+                position -= 1
+
+    optimized = []
+    for node in nodes:
+        previous = optimized[-1] if optimized else None
+        if is_noop(node, previous):
+            continue
+        if merged := merge(previous, node):
+            optimized[-1] = merged
+        else:
+            optimized.append(node)
+
+    steps = []
+    for node, previous in zip(optimized, [None, *optimized]):
+        if isinstance(node, tuple):
+            spec = f'{node[0]}={node[1]}' if node[1] else node[0]
+            if isinstance(previous, tuple):
+                steps[-1] = f'{steps[-1]},{spec}'
+            else:
+                steps.append(spec)
+        else:
+            steps.append(node)
+    return steps
@@ -0,0 +1,244 @@
+import abc
+import itertools
+import math
+import os
+import queue
+import subprocess
+import threading
+from concurrent.futures import FIRST_EXCEPTION
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+CHUNK_SIZE = 1 << 16
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def default_jobs():
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def threads_per_job(jobs):
+    return max(1, (os.cpu_count() or 1) // jobs)
+
+
+def popen(args, stdin=None, stdout=None, progress=None):
+    """
+    Starts a command. If ``progress`` is given ffmpeg is told to write its ``-progress`` output to a pipe that is read
+    (in a separate thread) by ``progress.consume``.
+    """
+    stdout = None if stdout is None else subprocess.PIPE
+    if progress is None:
+        return subprocess.Popen(args, stdin=stdin, stdout=stdout), None
+
+    read_fd, write_fd = os.pipe()
+    try:
+        process = subprocess.Popen(
+            [args[0], '-progress', f'pipe:{write_fd}', '-nostats', '-hide_banner', '-loglevel', 'error', *args[1:]],
+            stdin=stdin,
+            stdout=stdout,
+            pass_fds=(write_fd,),
+        )
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    reader = threading.Thread(target=progress.consume, args=(os.fdopen(read_fd, encoding='utf-8', errors='replace'),), daemon=True)
+    reader.start()
+    return process, reader
+
+
+def wait_process(process: subprocess.Popen, usage=None) -> int:
+    """
+    Waits for ``process`` like :meth:`subprocess.Popen.wait`. If ``usage`` is given it's called with the resource usage
+    of the process (where ``os.wait4`` is available).
+    """
+    if usage is None or not hasattr(os, 'wait4'):
+        return process.wait()
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:  # already reaped (eg: by terminate)
+        return process.wait()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    usage(rusage)
+    return process.returncode
+
+
+def communicate(process, reader, stdout=None, usage=None):
+    if stdout is not None:
+        while data := process.stdout.read1(CHUNK_SIZE):
+            stdout(data)
+        process.stdout.close()
+    returncode = wait_process(process, usage)
+    if reader is not None:
+        reader.join()
+    return returncode
+
+
+def check_call(args, stdout=None, progress=None, usage=None):
+    process, reader = popen(args, stdout=stdout, progress=progress)
+    if returncode := communicate(process, reader, stdout, usage):
+        raise subprocess.CalledProcessError(returncode, args)
+
+
+class ProcessGroup(abc.ABC):
+    """
+    Tracks the calls submitted by one job and the processes they spawn through :meth:`check_call`.
+
+    The first failure cancels every call that didn't start yet and terminates the processes that are running.
+    """
+
+    def __init__(self):
+        self.futures = []
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    @abc.abstractmethod
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Schedules ``fn(*args, **kwargs)`` as part of this group.
+        """
+
+    def check_call(self, args, stdout=None, progress=None, usage=None):
+        """
+        Runs a command, like :func:`subprocess.check_call`. If ``stdout`` is given it's called with every chunk of output,
+        if ``usage`` is given it's called with the resource usage of the process.
+        """
+        with self.lock:
+            if self.cancelled.is_set():
+                raise JobCancelled(args)
+            process, reader = popen(args, stdin=subprocess.DEVNULL, stdout=stdout, progress=progress)
+            self.processes.add(process)
+        try:
+            returncode = communicate(process, reader, stdout, usage)
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        if self.cancelled.is_set():
+            raise JobCancelled(args)
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, args)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled.set()
+            for future in self.futures:
+                future.cancel()
+            for process in self.processes:
+                process.terminate()
+
+    def wait(self):
+        done, _ = wait(self.futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if not future.cancelled() and (exc := future.exception()) and not isinstance(exc, JobCancelled):
+                self.cancel()
+                wait(self.futures)
+                raise exc
+        if self.cancelled.is_set():
+            raise JobCancelled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.cancel()
+        try:
+            if exc_type is None:
+                self.wait()
+        except BaseException:
+            self.cancel()
+            raise
+
+
+class JobPool(ProcessGroup):
+    """
+    Runs jobs (callables that usually spawn ffmpeg through :meth:`check_call`) on a bounded number of threads.
+
+    The first failure cancels every job that didn't start yet and terminates the processes of the jobs that are running.
+    """
+
+    def __init__(self, jobs: int):
+        super().__init__()
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='ffmpeg-cut')
+
+    def submit(self, fn, *args, **kwargs):
+        future = self.executor.submit(fn, *args, **kwargs)
+        self.futures.append(future)
+        return future
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            super().__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+class PriorityPool:
+    """
+    A fixed number of worker threads shared by several jobs. Queued calls with a lower priority value run first (in
+    submission order for equal priorities).
+    """
+
+    def __init__(self, jobs: int):
+        self.jobs = jobs
+        self.queue = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.workers = [threading.Thread(target=self.work, name=f'ffmpeg-cut-{i}', daemon=True) for i in range(jobs)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, priority, fn, *args, **kwargs) -> Future:
+        future = Future()
+        self.queue.put((priority, next(self.counter), future, fn, args, kwargs))
+        return future
+
+    def group(self, priority=0) -> 'PriorityGroup':
+        return PriorityGroup(self, priority)
+
+    def work(self):
+        while True:
+            _, _, future, fn, args, kwargs = self.queue.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def shutdown(self):
+        """
+        Lets the workers finish what is queued and waits for them.
+        """
+        for _ in self.workers:
+            self.queue.put((math.inf, next(self.counter), None, None, None, None))
+        for worker in self.workers:
+            worker.join()
+
+
+class PriorityGroup(ProcessGroup):
+    """
+    The calls of one job on a :class:`PriorityPool`. Cancelling (or a failure) only affects the calls and processes of
+    this job.
+    """
+
+    def __init__(self, pool: PriorityPool, priority=0):
+        super().__init__()
+        self.pool = pool
+        self.priority = priority
+        self.jobs = pool.jobs
+
+    def submit(self, fn, *args, **kwargs):
+        future = self.pool.submit(self.priority, fn, *args, **kwargs)
+        self.futures.append(future)
+        return future
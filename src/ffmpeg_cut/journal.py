@@ -0,0 +1,62 @@
+"""
+Record of the clips of a run that are complete, so a rerun after a crash (or a kill, reboot, OOM...) only encodes the
+clips that didn't finish.
+"""
+
+import json
+import os
+import pathlib
+import threading
+
+
+def journal_path(output: pathlib.Path) -> pathlib.Path:
+    return output.with_suffix('.journal')
+
+
+class Journal:
+    """
+    Append-only JSON lines file, one line per finished clip with the key of the settings it was encoded with, its size
+    and its probed duration. Lines are synced to disk as they are written; a line cut short by a crash is ignored.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.separator = ''
+        line = '\n'
+        try:
+            with path.open() as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['clip']] = entry
+        except FileNotFoundError:
+            pass
+        else:
+            if not line.endswith('\n'):
+                self.separator = '\n'  # don't append to a line cut short
+
+    def finished(self, clip: pathlib.Path, key) -> bool:
+        """
+        Whether ``clip`` was recorded with the same ``key`` and still has the recorded size.
+        """
+        entry = self.entries.get(str(clip))
+        if entry is None or entry['key'] != key:
+            return False
+        try:
+            return clip.stat().st_size == entry['size']
+        except FileNotFoundError:
+            return False
+
+    def record(self, clip: pathlib.Path, key, duration: float):
+        entry = {'clip': str(clip), 'key': key, 'size': clip.stat().st_size, 'duration': duration}
+        with self.lock:
+            self.entries[entry['clip']] = entry
+            with self.path.open('a') as fh:
+                fh.write(f'{self.separator}{json.dumps(entry)}\n')
+                self.separator = ''
+                fh.flush()
+                os.fsync(fh.fileno())
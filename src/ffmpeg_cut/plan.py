@@ -0,0 +1,980 @@
+import pathlib
+import re
+import shlex
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from typing import NamedTuple
+
+from .jobs import default_jobs
+from .jobs import threads_per_job
+from .journal import journal_path
+from .smartcut import MediaInfo
+from .smartcut import cached_probe
+from .smartcut import format_timestamp
+from .smartcut import probe_all
+from .smartcut import probe_duration
+from .smartcut import probe_keyframes
+from .structs import LINE_TIME_PATTERN
+from .structs import LINE_TIMESTAMP_RE
+from .structs import ClipList
+from .structs import Cut
+from .structs import Instruction
+from .structs import Plan
+from .structs import Step
+
+CLIP_COMMENT_RE = re.compile(rf'(?P<path>.+?) (?P<cut>{LINE_TIME_PATTERN}-{LINE_TIME_PATTERN})')
+PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')  # fastest first
+PRESET_ENCODERS = ('libx264', 'libx265')
+LABEL_RE = re.compile(r'\[([^\]]+)\]')
+STAT_WORKERS = 16
+
+
+PREVIEW_HEIGHT = 360
+PREVIEW_QUALITY = 35
+
+AUDIO_MODES = ('encode', 'copy', 'none')
+# audio codecs that can be stream-copied into each container (containers that aren't listed take anything)
+CONTAINER_AUDIO = {
+    '.mp4': {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'alac', 'flac'},
+    '.m4v': {'aac', 'mp3', 'ac3', 'eac3', 'alac'},
+    '.mov': {'aac', 'mp3', 'ac3', 'eac3', 'alac', 'pcm_s16le', 'pcm_s24le'},
+    '.ts': {'aac', 'mp3', 'mp2', 'ac3', 'eac3', 'opus'},
+    '.webm': {'opus', 'vorbis'},
+}
+FALLBACK_AUDIO_ENCODERS = {
+    '.webm': 'libopus',
+}
+
+
+class PlanError(ValueError):
+    pass
+
+
+@dataclass
+class Rendition:
+    """
+    Another output of the same cuts with its own filters and encoder settings (``None`` means the same as the main output).
+    """
+
+    output: pathlib.Path
+    filters: list[str] = field(default_factory=list)
+    encoder: str | None = None
+    quality: int | None = None
+    preset: str | None = None
+
+
+@dataclass
+class Settings:
+    """
+    Everything that affects planning and running, the API counterpart of the command line options.
+    """
+
+    output: pathlib.Path
+    filters: list[str] = field(default_factory=list)
+    encoder: str = 'libx264'
+    quality: int = 15
+    preset: str | None = None
+    jobs: int = field(default_factory=default_jobs)
+    dry_run: bool = False
+    dirty: bool = False
+    no_join: bool = False
+    smart_cut: bool = False
+    merge: bool = False
+    chunk_length: float | None = None
+    single_decode: bool = False
+    stream_join: bool = False
+    stream_buffer: int = 64 << 20
+    cache: pathlib.Path | None = None
+    cache_size: int = 20 << 30
+    spool: pathlib.Path | None = None
+    scratch: pathlib.Path | None = None
+    scratch_budget: int | None = None
+    audio: str = 'encode'
+    audio_codec: str | None = None
+    audio_tracks: list[int] = field(default_factory=list)
+    renditions: list[Rendition] = field(default_factory=list)
+    target_speed: float | None = None
+    deadline: float | None = None
+    preflight: bool = False
+    probe_cache: pathlib.Path | None = None
+    reporter: object = None
+    tracer: object = None
+    echo: Callable = print
+
+
+def check_settings(settings):
+    if settings.smart_cut and settings.filters:
+        raise PlanError('cannot use filters with --smart-cut')
+    if settings.chunk_length is not None and settings.chunk_length <= 0:
+        raise PlanError('--chunk-length must be positive')
+    if settings.chunk_length and settings.smart_cut:
+        raise PlanError('cannot use --chunk-length with --smart-cut')
+    if settings.single_decode and (settings.smart_cut or settings.no_join):
+        raise PlanError('cannot use --smart-cut or --no-join with --single-decode')
+    if settings.stream_join and (settings.smart_cut or settings.no_join or settings.single_decode):
+        raise PlanError('cannot use --smart-cut, --no-join or --single-decode with --stream-join')
+    if settings.spool and (settings.single_decode or settings.stream_join or settings.cache):
+        raise PlanError('cannot use --single-decode, --stream-join or --cache with --spool')
+    if settings.scratch_budget and (settings.no_join or settings.single_decode or settings.stream_join):
+        raise PlanError('cannot use --no-join, --single-decode or --stream-join with --scratch-budget')
+    if settings.renditions and (
+        settings.smart_cut or settings.single_decode or settings.stream_join or settings.chunk_length or settings.scratch_budget
+    ):
+        raise PlanError('cannot use --smart-cut, --single-decode, --stream-join, --chunk-length or --scratch-budget with --rendition')
+    if settings.target_speed or settings.deadline:
+        if settings.target_speed and settings.deadline:
+            raise PlanError('cannot use --target-speed with --deadline')
+        if settings.preset or settings.renditions:
+            raise PlanError('cannot use --target-speed or --deadline with --preset or --rendition')
+        if settings.encoder not in PRESET_ENCODERS:
+            raise PlanError(f'--target-speed and --deadline only work with {" or ".join(PRESET_ENCODERS)}, not {settings.encoder}')
+    if settings.audio not in AUDIO_MODES:
+        raise PlanError(f'--audio must be one of: {", ".join(AUDIO_MODES)}')
+    if settings.smart_cut and (settings.audio != 'encode' or settings.audio_codec or settings.audio_tracks):
+        raise PlanError('cannot use --audio, --audio-codec or --audio-track with --smart-cut')
+    if settings.audio == 'none' and (settings.audio_codec or settings.audio_tracks):
+        raise PlanError('cannot use --audio-codec or --audio-track with --audio=none')
+    if settings.single_decode and len(settings.audio_tracks) > 1:
+        raise PlanError('cannot select more than one --audio-track with --single-decode')
+
+
+def resolve(path, base=None) -> pathlib.Path:
+    return pathlib.Path(path) if base is None else base / path
+
+
+class Token(NamedTuple):
+    lineno: int
+    kind: str
+    value: str
+    line: str
+
+
+def tokenize(lines):
+    """
+    Reads the lines of the input formats (``--text``, ``--clips`` and ``--join``) as they come, yielding a :class:`Token`
+    for every non-empty line. The kind is one of:
+
+    * ``cut``: a pair of timestamps
+    * ``comment``: the text after a ``#``
+    * ``file``: the path of a concat ``file`` directive
+    * ``other``: anything else (the value is the whole line)
+    """
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if LINE_TIMESTAMP_RE.fullmatch(line):
+            yield Token(lineno, 'cut', line, line)
+        elif line.startswith('#'):
+            yield Token(lineno, 'comment', line[1:].strip(), line)
+        else:
+            try:
+                words = shlex.split(line)
+            except ValueError:
+                words = None
+            if words and len(words) == 2 and words[0] == 'file':
+                yield Token(lineno, 'file', words[1], line)
+            else:
+                yield Token(lineno, 'other', line, line)
+
+
+class ParseErrors(PlanError):
+    """
+    All the problems found in an input file, as ``(line number, message)`` pairs.
+    """
+
+    def __init__(self, errors):
+        self.errors = sorted(errors)
+        super().__init__('\n'.join(f'line {lineno}: {message}' for lineno, message in self.errors))
+
+
+class PathChecker:
+    """
+    Checks whether paths exist on a thread pool while the rest of the file is parsed (each path is only checked once).
+    """
+
+    def __init__(self, enabled=True, workers=STAT_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ffmpeg-cut-stat') if enabled else None
+        self.checks = {}
+
+    def check(self, path: pathlib.Path, token: Token):
+        if self.executor and path not in self.checks:
+            self.checks[path] = token, self.executor.submit(path.exists)
+
+    def exists(self, path: pathlib.Path) -> bool:
+        if path in self.checks:
+            return self.checks[path][1].result()
+        return self.executor is None
+
+    def errors(self):
+        return [(token.lineno, f'{token.value!r} does not exist') for token, future in self.checks.values() if not future.result()]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def parse_text(lines, check_exists=True, base=None) -> list[Instruction]:
+    """
+    Parses the ``--text`` format: a path followed by timestamp pairs, repeated (``#`` starts a comment). Relative paths
+    are relative to ``base`` (the current directory by default).
+    """
+    instructions = []
+    errors = []
+    with PathChecker(check_exists) as checker:
+        for token in tokenize(lines):
+            match token.kind:
+                case 'cut' if not instructions:
+                    errors.append((token.lineno, f'did not find a path before {token.line!r}'))
+                case 'cut':
+                    try:
+                        instructions[-1].cut.append(Cut.parse(token.value))
+                    except ValueError as exc:
+                        errors.append((token.lineno, str(exc)))
+                case 'comment':
+                    pass
+                case _:
+                    instructions.append(Instruction(input=resolve(token.line, base), cut=[]))
+                    checker.check(instructions[-1].input, token._replace(value=token.line))
+        errors.extend(checker.errors())
+    if errors:
+        raise ParseErrors(errors)
+    return instructions
+
+
+def parse_clips(lines, check_exists=True, base=None) -> list[Instruction]:
+    """
+    Parses the cuts out of the comments in a ``.clips`` file.
+    """
+    instructions = []
+    errors = []
+    with PathChecker(check_exists) as checker:
+        for token in tokenize(lines):
+            if token.kind == 'comment' and (match := CLIP_COMMENT_RE.fullmatch(token.value)):
+                try:
+                    instructions.append(Instruction(input=resolve(match['path'], base), cut=[Cut.parse(match['cut'])]))
+                except ValueError as exc:
+                    errors.append((token.lineno, str(exc)))
+                else:
+                    checker.check(instructions[-1].input, token._replace(value=match['path']))
+        errors.extend(checker.errors())
+    if errors:
+        raise ParseErrors(errors)
+    return instructions
+
+
+def parse_join(lines, echo=print, base=None) -> ClipList:
+    """
+    Parses a ``.clips`` file (ffmpeg concat instructions with a comment before each clip), skipping missing clips.
+    """
+    entries = []
+    errors = []
+    comment = None
+    with PathChecker() as checker:
+        for token in tokenize(lines):
+            match token.kind:
+                case 'comment':
+                    if match := CLIP_COMMENT_RE.fullmatch(token.value):
+                        try:
+                            comment = match['path'], Cut.parse(match['cut'])
+                        except ValueError as exc:
+                            errors.append((token.lineno, str(exc)))
+                    else:
+                        errors.append((token.lineno, f'invalid cut in clips file: {token.line!r}'))
+                case 'file' if comment is None:
+                    errors.append((token.lineno, f'missing comment before {token.line!r}'))
+                case 'file':
+                    clip_file = resolve(token.value, base)
+                    checker.check(clip_file, token)
+                    entries.append((*comment, clip_file))
+                case _:
+                    echo(f'WARNING: found junk in clips file on line {token.lineno}: {token.line!r}')
+        if errors:
+            raise ParseErrors(errors)
+
+        clips = ClipList()
+        for original_file, cut, clip_file in entries:
+            if checker.exists(clip_file):
+                clips.append(original_file, cut, clip_file)
+            else:
+                echo(f'WARNING: {clip_file!r} does not exist!')
+    return clips
+
+
+def merge_cuts(instructions: list[Instruction]) -> list[Instruction]:
+    """
+    Merges the cuts of the same input that overlap or are adjacent (anywhere in the list). The merged cut takes the place
+    of the first one.
+    """
+    by_input = {}  # input to [(start, end, position)]
+    for position, (input, cut) in enumerate((instruction.input, cut) for instruction in instructions for cut in instruction.cut):
+        by_input.setdefault(input, []).append((cut.start, cut.end, position))
+    pairs = []  # (position, input, cut)
+    for input, spans in by_input.items():
+        spans.sort()
+        start, end, first = spans[0]
+        for span_start, span_end, position in spans[1:]:
+            if span_start <= end:
+                end = max(end, span_end)
+                first = min(first, position)
+            else:
+                pairs.append((first, input, Cut(start, end)))
+                start, end, first = span_start, span_end, position
+        pairs.append((first, input, Cut(start, end)))
+    merged = []
+    for _, input, cut in sorted(pairs, key=lambda pair: pair[0]):
+        if merged and merged[-1].input == input:
+            merged[-1].cut.append(cut)
+        else:
+            merged.append(Instruction(input=input, cut=[cut]))
+    return merged
+
+
+def apply_preview(settings):
+    """
+    Changes ``settings`` (in place) to render a quick low resolution preview of the same cuts and filters, to
+    ``<output>.preview`` so its clips never mix with the full quality ones. Renditions are changed the same way.
+    """
+    if settings.smart_cut:
+        raise PlanError('cannot use --smart-cut with --preview')
+    for rendition in [settings, *settings.renditions]:
+        rendition.output = rendition.output.with_stem(f'{rendition.output.stem}.preview')
+        rendition.filters = [*rendition.filters, f'scale=-2:{PREVIEW_HEIGHT}']
+        rendition.encoder = 'libx264'
+        rendition.quality = PREVIEW_QUALITY
+        rendition.preset = 'ultrafast'
+
+
+def preset_options(settings):
+    if settings.preset:
+        return ['-preset', settings.preset]
+    else:
+        return []
+
+
+def threads_options(settings):
+    if settings.jobs > 1:
+        return ['-threads', str(threads_per_job(settings.jobs))]
+    else:
+        return []
+
+
+def can_copy_audio(input, *containers) -> bool:
+    """
+    Whether the audio of ``input`` can be stream-copied into all the ``containers`` (file suffixes). Inputs that don't
+    exist yet (eg: for a dry run) are assumed to be fine.
+    """
+    input = pathlib.Path(input)
+    if not input.exists():
+        return True
+    codecs = set(cached_probe(input).audio_codecs)
+    for container in containers:
+        allowed = CONTAINER_AUDIO.get(container.lower())
+        if allowed is not None and not codecs <= allowed:
+            return False
+    return True
+
+
+def audio_codec_options(settings, input, *containers):
+    """
+    The audio codec for encoding ``input`` into ``containers``: nothing (ffmpeg's default) unless ``--audio-codec`` is
+    given, a stream-copy with ``--audio=copy`` if the containers allow it or else a cheap encoder (AAC, Opus for WebM).
+    """
+    if settings.audio == 'copy':
+        if can_copy_audio(input, *containers):
+            return ['-c:a', 'copy']
+        return ['-c:a', settings.audio_codec or FALLBACK_AUDIO_ENCODERS.get(containers[-1].lower(), 'aac')]
+    elif settings.audio_codec:
+        return ['-c:a', settings.audio_codec]
+    else:
+        return []
+
+
+def audio_options(settings, input, *containers, input_index=0):
+    """
+    Stream selection (``--audio-track``) and codec options for the audio of ``input`` (input number ``input_index``).
+    """
+    if settings.audio == 'none':
+        return ['-an']
+    options = []
+    if settings.audio_tracks:
+        if not settings.filters:
+            # an explicit -map turns off the automatic selection of the video (the output of a filter graph is always used)
+            options.extend(['-map', f'{input_index}:v:0'])
+        for track in settings.audio_tracks:
+            options.extend(['-map', f'{input_index}:a:{track}'])
+    return [*options, *audio_codec_options(settings, input, *containers)]
+
+
+def join_filters(filters):
+    if filters:
+        return ['-filter_complex', filter_graph(filters)]
+    else:
+        return []
+
+
+def filter_graph(filters, input='0:v', output=''):
+    filter_chain = []
+    last_step = len(filters) - 1
+    for step, filter in enumerate(filters):
+        if step == last_step:
+            step_output = f'[{output}]' if output else ''
+        else:
+            step_output = f'[step_{step}]'
+        if step:
+            filter_chain.append(f'[step_{step - 1}]{filter}{step_output}')
+        else:
+            filter_chain.append(f'[0:v]{filter}{step_output}')
+    graph = ';'.join(filter_chain)
+
+    if input != '0:v':
+        # filters may reference the input more than once (eg: --filter overlays on it) so split it if needed
+        uses = graph.count('[0:v]')
+        if uses > 1:
+            graph = f'[{input}]split={uses}{"".join(f"[{input}_{i}]" for i in range(uses))};{graph}'
+            for i in range(uses):
+                graph = graph.replace('[0:v]', f'[{input}_{i}]', 1)
+        else:
+            graph = graph.replace('[0:v]', f'[{input}]')
+    return graph
+
+
+def single_decode_graph(segments, filters, audio=True, audio_track=0):
+    """
+    Builds a filter graph that trims ``segments`` (a list of ``(input_index, start, end)`` with times relative to the start
+    of that input), concatenates them and then applies the ``filters``. Outputs are labeled ``[outv]`` and ``[outa]`` (from
+    the ``audio_track`` of the inputs).
+    """
+    graph = []
+    concat_inputs = []
+    for index, (input_index, start, end) in enumerate(segments):
+        graph.append(f'[{input_index}:v:0]trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS[v{index}]')
+        concat_inputs.append(f'[v{index}]')
+        if audio:
+            graph.append(f'[{input_index}:a:{audio_track}]atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS[a{index}]')
+            concat_inputs.append(f'[a{index}]')
+    video_output = 'cutv' if filters else 'outv'
+    audio_output = '[outa]' if audio else ''
+    graph.append(f'{"".join(concat_inputs)}concat=n={len(segments)}:v=1:a={int(audio)}[{video_output}]{audio_output}')
+    if filters:
+        graph.append(filter_graph(filters, input='cutv', output='outv'))
+    return ';'.join(graph)
+
+
+def encode_argv(input, cut: Cut, output, settings, *options, output_options=(), containers=(), audio=True):
+    """
+    Encodes ``cut`` of ``input`` to ``output``. If the clip ends up in other ``containers`` (eg: the output of a stream
+    join) the audio is only copied if it fits in those too. Without ``audio`` no audio options are added.
+    """
+    return [
+        'ffmpeg',
+        *options,
+        '-ss',
+        cut.start_timestamp,
+        '-to',
+        cut.end_timestamp,
+        '-i',
+        input,
+        *join_filters(settings.filters),
+        '-c:v',
+        settings.encoder,
+        '-crf',
+        str(settings.quality),
+        *preset_options(settings),
+        *threads_options(settings),
+        *(audio_options(settings, input, *containers, pathlib.Path(output).suffix) if audio else []),
+        *output_options,
+        output,
+    ]
+
+
+def filters_argv(input, output, settings):
+    return [
+        'ffmpeg',
+        '-i',
+        input,
+        *join_filters(settings.filters),
+        '-c:v',
+        settings.encoder,
+        '-crf',
+        str(settings.quality),
+        *preset_options(settings),
+        *audio_options(settings, input, pathlib.Path(output).suffix),
+        output,
+    ]
+
+
+def join_argv(clips_file, output, *options):
+    # clips can be anywhere (eg: in the scratch directory) so absolute paths must be allowed
+    return ['ffmpeg', *options, '-f', 'concat', '-safe', '0', '-i', clips_file, '-c', 'copy', output]
+
+
+def unique_inputs(instructions: list[Instruction]):
+    return list(dict.fromkeys(instruction.input for instruction in instructions))
+
+
+def clip_output(output: pathlib.Path, index):
+    return output.with_stem(f'{output.stem}-{index:03}').with_suffix(output.suffix)
+
+
+def scratch_output(settings, output=None) -> pathlib.Path:
+    """
+    The output path (``settings.output`` by default) that intermediary files are named after: in ``settings.scratch`` if
+    set, otherwise the output itself (so they go next to it).
+    """
+    output = output or settings.output
+    return settings.scratch / output.name if settings.scratch else output
+
+
+def estimate_size(input, cut: Cut, infos: dict[pathlib.Path, MediaInfo]) -> int:
+    """
+    Guesses the size of a clip from the bitrate of its input, as probed in ``infos`` (0 if it wasn't, eg: it doesn't
+    exist yet).
+    """
+    info = infos.get(input)
+    try:
+        size = pathlib.Path(input).stat().st_size
+    except OSError:
+        return 0
+    return round(size * min(cut.duration / info.duration, 1)) if info and info.duration else 0
+
+
+def budget_batches(clips: ClipList, sizes: dict[pathlib.Path, int], budget: int) -> list[ClipList]:
+    """
+    Splits ``clips`` (in order) in batches whose distinct clips have an estimated total size (``sizes``) within
+    ``budget``. A clip bigger than the budget gets a batch of its own.
+    """
+    batches = []
+    batch = ClipList()
+    for clip in clips.clips:
+        if clip.output not in batch.outputs:
+            total = sum(sizes[output] for output in dict.fromkeys(batch.outputs))
+            if batch and total + sizes[clip.output] > budget:
+                batches.append(batch)
+                batch = ClipList()
+        batch.clips.append(clip)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def batched_steps(batches: list[ClipList], clip_steps: dict[pathlib.Path, Step], settings) -> list[Step]:
+    """
+    Encodes and joins the clips one batch at a time into segments (in ``settings.scratch`` if set, otherwise next to the
+    output), removing the clips of a batch once joined (unless a later batch uses them too). The segments are then
+    joined into the output.
+    """
+    scratch = scratch_output(settings)
+    output = settings.output
+    last_batch = {clip.output: index for index, batch in enumerate(batches) for clip in batch.clips}
+    steps = []
+    segments = []
+    for index, batch in enumerate(batches):
+        for clip in dict.fromkeys(batch.outputs):
+            if step := clip_steps.pop(clip, None):
+                steps.append(step)
+        batch_file = scratch.with_stem(f'{scratch.stem}.part-{index:03}').with_suffix('.clips')
+        segments.append(segment := scratch.with_stem(f'{scratch.stem}.part-{index:03}'))
+        steps.append(Step('write', output=batch_file, content=batch.as_concat_input(absolute=True)))
+        steps.append(Step('join', output=segment, argv=join_argv(batch_file, segment, '-y')))
+        if not settings.dirty:
+            done = [clip for clip in dict.fromkeys(batch.outputs) if last_batch[clip] == index]
+            steps.append(Step('cleanup', paths=[*done, batch_file]))
+    segments_file = scratch.with_suffix('.segments')
+    steps.append(Step('write', output=segments_file, content=''.join(f'file {str(segment.absolute())!r}\n' for segment in segments)))
+    steps.append(Step('join', output=output, argv=join_argv(segments_file, output)))
+    if not settings.dirty:
+        steps.append(Step('cleanup', paths=[*segments, segments_file, journal_path(output)]))
+    return steps
+
+
+def join_steps(clips: ClipList, settings, cleanup=True, output=None) -> list[Step]:
+    output = output or settings.output
+    clips_file = output.with_suffix('.clips')
+    steps = [Step('write', output=clips_file, content=clips.as_concat_input())]
+    if not settings.no_join:
+        steps.append(Step('join', output=output, argv=join_argv(clips_file, output)))
+        if cleanup and not settings.dirty:
+            steps.append(Step('cleanup', paths=[*dict.fromkeys(clips.outputs), journal_path(output)]))
+    return steps
+
+
+def plan_cuts(instructions: list[Instruction], settings) -> Plan:
+    """
+    Plans cutting all the ``instructions`` and joining the result in ``settings.output``. Identical cuts of the same input
+    are only encoded once, with ``settings.merge`` overlapping or adjacent ones are merged first.
+    """
+    if settings.merge:
+        instructions = merge_cuts(instructions)
+    if settings.renditions:
+        return plan_renditions(instructions, settings)
+    elif settings.single_decode:
+        return plan_single_decode(instructions, settings)
+    elif settings.stream_join:
+        return plan_stream_join(instructions, settings)
+
+    plan = Plan(inputs=unique_inputs(instructions), output=settings.output)
+    clips = ClipList()
+    encoded = {}
+    clip_steps = {}
+    for instruction in instructions:
+        for cut in instruction.cut:
+            if clip := encoded.get((instruction.input, cut)):
+                clips.append(instruction.input, cut, clip)
+                continue
+            encoded[instruction.input, cut] = clip = clip_output(scratch_output(settings), len(clip_steps))
+            clips.append(instruction.input, cut, clip)
+            clip_steps[clip] = Step(
+                'clip',
+                input=instruction.input,
+                cut=cut,
+                output=clip,
+                options=['-n'],
+                argv=None if settings.smart_cut else encode_argv(instruction.input, cut, clip, settings, '-n'),
+                duration=cut.duration,
+            )
+    if settings.scratch_budget:
+        infos, _ = probe_all([step.input for step in clip_steps.values()])
+        sizes = {step.output: estimate_size(step.input, step.cut, infos) for step in clip_steps.values()}
+        batches = budget_batches(clips, sizes, settings.scratch_budget)
+        if len(batches) > 1:
+            plan.steps.extend(batched_steps(batches, clip_steps, settings))
+            return plan
+    plan.steps.extend(clip_steps.values())
+    plan.steps.extend(join_steps(clips, settings))
+    return plan
+
+
+def plan_cut(input, cut: Cut, settings) -> Plan:
+    """
+    Plans cutting a single piece of ``input`` straight to ``settings.output`` (in chunks if it's long enough for
+    ``settings.chunk_length``).
+    """
+    if settings.renditions:
+        return plan_renditions([Instruction(input=input, cut=[cut])], settings)
+    elif settings.chunk_length and cut.duration >= 2 * settings.chunk_length:
+        return plan_chunked(input, cut.start / 1000, cut.end / 1000, settings)
+    return Plan(
+        inputs=[input],
+        output=settings.output,
+        steps=[
+            Step(
+                'clip',
+                input=input,
+                cut=cut,
+                output=settings.output,
+                argv=None if settings.smart_cut else encode_argv(input, cut, settings.output, settings),
+                duration=cut.duration,
+            )
+        ],
+    )
+
+
+def plan_filters(input, settings) -> Plan:
+    """
+    Plans applying the filters to the whole ``input`` (in chunks if it's long enough for ``settings.chunk_length``).
+    """
+    if settings.renditions:
+        raise PlanError('cannot use --rendition without cuts')
+    if settings.chunk_length and input.exists() and (duration := probe_duration(input)) >= 2 * settings.chunk_length:
+        return plan_chunked(input, 0.0, duration, settings)
+    return Plan(
+        inputs=[input],
+        output=settings.output,
+        steps=[Step('encode', output=settings.output, argv=filters_argv(input, settings.output, settings))],
+    )
+
+
+def plan_join(clips: ClipList, settings) -> Plan:
+    """
+    Plans joining existing clips (they are not removed afterwards).
+    """
+    return Plan(inputs=list(dict.fromkeys(clips.outputs)), output=settings.output, steps=join_steps(clips, settings, cleanup=False))
+
+
+def chunk_spans(keyframes: list[float] | None, start: float, end: float, length: float) -> list[tuple[float, float]]:
+    """
+    Splits ``[start, end]`` in spans of at least ``length`` seconds that start on ``keyframes`` (or exactly every
+    ``length`` seconds if there are no keyframes).
+    """
+    if keyframes is None:
+        keyframes = [start + length * index for index in range(1, int((end - start) / length) + 1)]
+    bounds = [start]
+    for keyframe in keyframes:
+        if keyframe - bounds[-1] >= length and end - keyframe >= length:
+            bounds.append(keyframe)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+
+def chunked_audio_options(input, output, settings):
+    """
+    Maps and encodes the audio of the whole range (the second input) for the final step of a chunked encode.
+    """
+    if settings.audio == 'none':
+        return []
+    maps = [f'1:a:{track}' for track in settings.audio_tracks] or ['1:a?']
+    return [*(option for map in maps for option in ('-map', map)), *audio_codec_options(settings, input, output.suffix)]
+
+
+def plan_chunked(input, start: float, end: float, settings) -> Plan:
+    """
+    Plans encoding ``[start, end]`` of ``input`` as video-only chunks (in parallel) that are then concatenated with the audio
+    of the whole range.
+    """
+    keyframes = probe_keyframes(input, start, end) if input.exists() else None
+    output = settings.output
+    scratch = scratch_output(settings)
+    chunks_file = scratch.with_suffix('.chunks')
+    plan = Plan(inputs=[input], output=output)
+    chunks = []
+    for index, (chunk_start, chunk_end) in enumerate(chunk_spans(keyframes, start, end, settings.chunk_length)):
+        chunks.append(chunk := scratch.with_stem(f'{scratch.stem}.chunk-{index:03}').with_suffix('.ts'))
+        cut = Cut(round(chunk_start * 1000), round(chunk_end * 1000))
+        plan.steps.append(
+            Step(
+                'chunk',
+                input=input,
+                cut=cut,
+                output=chunk,
+                argv=encode_argv(input, cut, chunk, settings, '-y', output_options=['-an'], audio=False),
+                duration=cut.duration,
+            )
+        )
+    plan.steps.append(Step('write', output=chunks_file, content=''.join(f'file {str(chunk.absolute())!r}\n' for chunk in chunks)))
+    plan.steps.append(
+        Step(
+            'encode',
+            output=output,
+            argv=[
+                'ffmpeg',
+                '-f',
+                'concat',
+                '-safe',
+                '0',
+                '-i',
+                chunks_file,
+                '-ss',
+                format_timestamp(start),
+                '-to',
+                format_timestamp(end),
+                '-i',
+                input,
+                '-map',
+                '0:v',
+                *chunked_audio_options(input, output, settings),
+                '-c:v',
+                'copy',
+                output,
+            ],
+        )
+    )
+    if not settings.dirty:
+        plan.steps.append(Step('cleanup', paths=[*chunks, chunks_file]))
+    return plan
+
+
+def plan_single_decode(instructions: list[Instruction], settings) -> Plan:
+    inputs = []  # list of [path, seek, end of the last cut]
+    segments = []
+    for instruction in instructions:
+        for cut in instruction.cut:
+            start = cut.start / 1000
+            end = cut.end / 1000
+            for input_index, (path, _, last_end) in enumerate(inputs):
+                # frames are decoded once per input so only reuse an input if the cut comes after what was already used
+                if path == instruction.input and start >= last_end:
+                    inputs[input_index][2] = end
+                    break
+            else:
+                input_index = len(inputs)
+                inputs.append([instruction.input, start, end])
+            segments.append((input_index, start - inputs[input_index][1], end - inputs[input_index][1]))
+
+    audio_track = settings.audio_tracks[0] if settings.audio_tracks else 0
+    audio = settings.audio != 'none'
+    for path, _, _ in inputs:
+        if path.exists() and len(cached_probe(path).audio_codecs) <= audio_track:
+            audio = False
+    if not audio:
+        audio_codec = []
+    elif settings.audio == 'copy':  # the audio goes through a filter graph so it can't be copied
+        audio_codec = ['-c:a', settings.audio_codec or FALLBACK_AUDIO_ENCODERS.get(settings.output.suffix.lower(), 'aac')]
+    else:
+        audio_codec = audio_codec_options(settings, None)
+
+    input_options = []
+    for path, seek, last_end in inputs:
+        input_options.extend(['-ss', format_timestamp(seek), '-to', format_timestamp(last_end), '-i', path])
+    argv = [
+        'ffmpeg',
+        *input_options,
+        '-filter_complex',
+        single_decode_graph(segments, settings.filters, audio=audio, audio_track=audio_track),
+        '-map',
+        '[outv]',
+        *(['-map', '[outa]'] if audio else []),
+        '-c:v',
+        settings.encoder,
+        '-crf',
+        str(settings.quality),
+        *preset_options(settings),
+        *audio_codec,
+        settings.output,
+    ]
+    return Plan(
+        inputs=unique_inputs(instructions),
+        output=settings.output,
+        steps=[Step('encode', output=settings.output, argv=argv, duration=sum(end - start for _, start, end in segments))],
+    )
+
+
+def plan_stream_join(instructions: list[Instruction], settings) -> Plan:
+    plan = Plan(inputs=unique_inputs(instructions), output=settings.output)
+    offset = 0.0
+    for instruction in instructions:
+        for cut in instruction.cut:
+            # clips are muxed as one MPEG-TS stream so their timestamps need to continue from the previous clip
+            output_options = ['-f', 'mpegts', '-output_ts_offset', f'{offset:.3f}']
+            duration = cut.duration
+            offset += duration
+            plan.steps.append(
+                Step(
+                    'stream',
+                    input=instruction.input,
+                    cut=cut,
+                    argv=encode_argv(
+                        instruction.input,
+                        cut,
+                        'pipe:1',
+                        settings,
+                        output_options=output_options,
+                        containers=('.ts', settings.output.suffix),
+                    ),
+                    duration=duration,
+                )
+            )
+    plan.steps.append(
+        Step(
+            'mux', output=settings.output, argv=['ffmpeg', '-n', '-f', 'mpegts', '-i', 'pipe:0', '-map', '0', '-c', 'copy', settings.output]
+        )
+    )
+    return plan
+
+
+def resolve_renditions(settings) -> list[Rendition]:
+    """
+    All the renditions to render: the main output first, then ``settings.renditions`` with the missing encoder settings
+    taken from the main output.
+    """
+    return [
+        Rendition(
+            output=settings.output, filters=settings.filters, encoder=settings.encoder, quality=settings.quality, preset=settings.preset
+        ),
+        *(
+            Rendition(
+                output=rendition.output,
+                filters=rendition.filters,
+                encoder=rendition.encoder or settings.encoder,
+                quality=settings.quality if rendition.quality is None else rendition.quality,
+                preset=rendition.preset or settings.preset,
+            )
+            for rendition in settings.renditions
+        ),
+    ]
+
+
+def prefix_labels(graph, prefix, kept=()):
+    """
+    Prefixes the link labels of ``graph`` with ``prefix``, except the ``kept`` ones.
+    """
+    return LABEL_RE.sub(lambda match: match[0] if match[1] in kept else f'[{prefix}{match[1]}]', graph)
+
+
+def split_argv(input, cut: Cut, outputs: list[pathlib.Path], renditions: list[Rendition], settings):
+    """
+    Decodes ``cut`` of ``input`` once and splits the frames between the ``renditions``, each filtered and encoded to its
+    own output.
+    """
+    sources = ''.join(f'[rendition{index}_in]' for index in range(len(renditions)))
+    graph = [f'[0:v]split={len(renditions)}{sources}']
+    output_options = []
+    for index, (rendition, output) in enumerate(zip(renditions, outputs)):
+        if rendition.filters:
+            chain = filter_graph(rendition.filters, input=f'rendition{index}_in', output=f'rendition{index}')
+            # the chains share the graph so their inner labels (eg: step_0, or the ones from --crop) must not clash
+            graph.append(prefix_labels(chain, f'r{index}_', kept=(f'rendition{index}_in', f'rendition{index}')))
+        else:
+            graph.append(f'[rendition{index}_in]null[rendition{index}]')
+        if settings.audio == 'none':
+            audio = ['-an']
+        else:
+            maps = [f'0:a:{track}' for track in settings.audio_tracks] or ['0:a?']
+            audio = [*(option for map in maps for option in ('-map', map)), *audio_codec_options(settings, input, output.suffix)]
+        output_options.extend(
+            [
+                '-map',
+                f'[rendition{index}]',
+                *audio,
+                '-c:v',
+                rendition.encoder,
+                '-crf',
+                str(rendition.quality),
+                *preset_options(rendition),
+                *threads_options(settings),
+                output,
+            ]
+        )
+    return [
+        'ffmpeg',
+        '-y',
+        '-ss',
+        cut.start_timestamp,
+        '-to',
+        cut.end_timestamp,
+        '-i',
+        input,
+        '-filter_complex',
+        ';'.join(graph),
+        *output_options,
+    ]
+
+
+def plan_renditions(instructions: list[Instruction], settings) -> Plan:
+    """
+    Plans cutting the ``instructions`` for the main output and all the ``settings.renditions`` at once: every cut is
+    decoded by a single ffmpeg process that splits the frames between the renditions, then each rendition is joined on
+    its own.
+    """
+    renditions = resolve_renditions(settings)
+    plan = Plan(inputs=unique_inputs(instructions), output=settings.output)
+    clip_lists = [ClipList() for _ in renditions]
+    encoded = {}
+    for instruction in instructions:
+        for cut in instruction.cut:
+            if (instruction.input, cut) not in encoded:
+                index = len(encoded)
+                encoded[instruction.input, cut] = outputs = [
+                    clip_output(scratch_output(settings, rendition.output), index) for rendition in renditions
+                ]
+                plan.steps.append(
+                    Step(
+                        'split',
+                        input=instruction.input,
+                        cut=cut,
+                        output=outputs[0],
+                        paths=outputs[1:],
+                        argv=split_argv(instruction.input, cut, outputs, renditions, settings),
+                        duration=cut.duration,
+                    )
+                )
+            for clips, clip in zip(clip_lists, encoded[instruction.input, cut]):
+                clips.append(instruction.input, cut, clip)
+    for rendition, clips in zip(renditions, clip_lists):
+        plan.steps.extend(join_steps(clips, settings, output=rendition.output))
+    return plan
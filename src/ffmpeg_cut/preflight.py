@@ -0,0 +1,216 @@
+"""
+Checks a plan against the actual media before anything is encoded: every distinct input is probed once (in parallel),
+cuts that go past the end of their input are rejected and the join is switched to a normalizing re-encode if the clips
+can't be concatenated with ``-c copy``.
+"""
+
+import collections
+import pathlib
+import re
+import shutil
+
+from .cache import format_size
+from .plan import PlanError
+from .plan import estimate_size
+from .plan import preset_options
+from .plan import resolve_renditions
+from .plan import scratch_output
+from .smartcut import MediaInfo
+from .smartcut import probe_all
+from .structs import Plan
+from .structs import format_ms
+
+CHAIN_RE = re.compile(r'^((?:\[[^\]]+\])*)(.*?)((?:\[[^\]]+\])*)$')
+SIZE_RE = re.compile(r'(?:scale|crop|pad)=(?:w=)?\d+(?:\.\d+)?:(?:h=)?\d+(?:\.\d+)?(?::.*)?')
+
+
+def fixes_size(filter) -> bool | None:
+    """
+    Whether the output of ``filter`` (one of the chained filters, possibly a graph) has an explicit size (eg: ``--crop``
+    or ``scale=1280:720``), the size of the input (eg: ``--filter``, which overlays on ``[0:v]``) or ``None`` if it
+    depends on the output of the previous filter (eg: ``fps`` or the ``scale=-2:360`` of ``--preview``).
+    """
+    chains = []
+    producers = {}  # label to chain
+    for chain in filter.split(';'):
+        inputs, body, outputs = CHAIN_RE.match(chain.strip()).groups()
+        chains.append((inputs[1:-1].split('][') if inputs else [], body))
+        for label in outputs[1:-1].split(']['):
+            producers[label] = len(chains) - 1
+
+    def chain_size(index, seen=()):
+        inputs, body = chains[index]
+        if not inputs:
+            size = None
+        elif inputs[0] == '0:v':
+            size = False
+        elif inputs[0] in producers and index not in seen:
+            size = chain_size(producers[inputs[0]], (*seen, index))
+        else:
+            size = None
+        # only the main (first) input decides the size, overlays and the like keep it
+        for part in body.split(','):
+            if SIZE_RE.fullmatch(part.strip()):
+                size = True
+        return size
+
+    return chain_size(len(chains) - 1)
+
+
+def fixed_properties(filters) -> set[str]:
+    """
+    Which of the properties compared for the join are the same for all clips regardless of their input because of the
+    ``filters``.
+    """
+    fixed = set()
+    size = False
+    for filter in filters:
+        if filter.startswith('fps='):
+            fixed.add('frame_rate')
+        if (filter_size := fixes_size(filter)) is not None:
+            size = filter_size
+    if size:
+        fixed.add('size')
+    return fixed
+
+
+def join_mismatches(infos: list[MediaInfo], fixed=()) -> list[str]:
+    """
+    Returns the properties (``size``, ``frame_rate``, ``pix_fmt``, ``sample_rate``, ``channels``) that differ between the
+    ``infos``, except the ``fixed`` ones.
+    """
+    return [
+        name
+        for name in ('size', 'frame_rate', 'pix_fmt', 'sample_rate', 'channels')
+        if name not in fixed and len({getattr(info, name) for info in infos}) > 1
+    ]
+
+
+def normalize_argv(clips_file, output, target: MediaInfo, properties: list[str], settings, *options):
+    """
+    Joins the clips by re-encoding them, with the ``properties`` that differ changed to match ``target`` (sizes are
+    letterboxed).
+    """
+    video_filters = []
+    if 'size' in properties and target.width:
+        video_filters.extend(
+            [
+                f'scale={target.width}:{target.height}:force_original_aspect_ratio=decrease',
+                f'pad={target.width}:{target.height}:-1:-1',
+                'setsar=1',
+            ]
+        )
+    if 'frame_rate' in properties and target.frame_rate:
+        video_filters.append(f'fps={target.frame_rate}')
+    if 'pix_fmt' in properties and target.pix_fmt:
+        video_filters.append(f'format={target.pix_fmt}')
+    audio_options = []
+    if 'sample_rate' in properties and target.sample_rate:
+        audio_options.extend(['-ar', target.sample_rate])
+    if 'channels' in properties and target.channels:
+        audio_options.extend(['-ac', str(target.channels)])
+    return [
+        'ffmpeg',
+        *options,
+        '-f',
+        'concat',
+        '-safe',
+        '0',
+        '-i',
+        clips_file,
+        *(['-vf', ','.join(video_filters)] if video_filters else []),
+        '-c:v',
+        settings.encoder,
+        '-crf',
+        str(settings.quality),
+        *preset_options(settings),
+        *audio_options,
+        output,
+    ]
+
+
+def preflight(plan: Plan, settings) -> dict[pathlib.Path, MediaInfo]:
+    """
+    Probes the inputs of ``plan`` and raises :class:`PlanError` (with all the problems found) if any can't be probed or
+    if a cut doesn't fit in its input. If the inputs differ in ways that break a concat copy the ``join`` step is changed
+    (in place) to a re-encode that normalizes them to the first input.
+    """
+    infos, errors = probe_all(plan.inputs)
+    for step in plan.steps:
+        if step.cut is not None and (info := infos.get(step.input)):
+            end = round(info.duration * 1000)
+            if step.cut.end > end:
+                errors.append(f'{str(step.input)!r} is only {format_ms(end)} long, cannot cut {step.cut}')
+    if errors:
+        raise PlanError('\n'.join(dict.fromkeys(errors)))
+
+    sources = [infos[input] for input in plan.inputs]
+    joins = [step for step in plan.steps if step.kind == 'join']
+    if settings.renditions:
+        # every rendition is joined on its own and normalized with its own encoder settings
+        renditions = {rendition.output: rendition for rendition in resolve_renditions(settings)}
+        for step in joins:
+            rendition = renditions[step.output]
+            if mismatches := join_mismatches(sources, fixed_properties(rendition.filters)):
+                settings.echo(
+                    f'inputs have different {", ".join(mismatches)}, the join of {step.output} will re-encode to match {plan.inputs[0]}'
+                )
+                clips_file = step.argv[step.argv.index('-i') + 1]
+                step.argv = normalize_argv(clips_file, step.output, sources[0], mismatches, rendition)
+        return infos
+    mismatches = join_mismatches(sources, fixed_properties(settings.filters))
+    if mismatches and joins:
+        settings.echo(f'inputs have different {", ".join(mismatches)}, the join will re-encode to match {plan.inputs[0]}')
+        # with --scratch-budget the last join only puts together segments that were already normalized
+        for step in joins[:-1] or joins:
+            clips_file = step.argv[step.argv.index('-i') + 1]
+            options = ['-y'] if '-y' in step.argv else []
+            step.argv = normalize_argv(clips_file, step.output, sources[0], mismatches, settings, *options)
+    return infos
+
+
+def existing_parent(path: pathlib.Path) -> pathlib.Path:
+    path = path.absolute().parent
+    while not path.exists():
+        path = path.parent
+    return path
+
+
+def check_free_space(plan: Plan, settings, infos: dict[pathlib.Path, MediaInfo] | None = None):
+    """
+    Estimates (from the bitrate of the inputs) the space that the intermediary files and the output need at most and
+    raises :class:`PlanError` if a filesystem doesn't have that much free. The inputs are probed unless already in
+    ``infos`` (as returned by :func:`preflight`), those that can't be are not counted.
+    """
+    if infos is None:
+        infos, _ = probe_all(plan.inputs)
+    outputs = [rendition.output for rendition in resolve_renditions(settings)]
+    totals = collections.Counter()  # output to bytes
+    needed = collections.Counter()  # directory to bytes
+    for step in plan.steps:
+        if step.kind in ('clip', 'chunk', 'split') and step.cut is not None:
+            size = estimate_size(step.input, step.cut, infos)
+            # split steps write a clip for every rendition, each next to its own output (or in the scratch directory)
+            for output, clip in zip(outputs, [step.output, *step.paths] if step.kind == 'split' else [step.output]):
+                totals[output] += size
+                if clip != output:
+                    needed[existing_parent(clip)] += size
+    if not sum(totals.values()):
+        return
+    if settings.scratch_budget and any(step.kind == 'join' and step.output not in outputs for step in plan.steps):
+        # joined in batches: the clips only pile up to the budget but the segments take as much as the output
+        needed = collections.Counter({directory: min(size, settings.scratch_budget) for directory, size in needed.items()})
+        needed[existing_parent(scratch_output(settings))] += totals[plan.output]
+    for output, size in totals.items():
+        needed[existing_parent(output)] += size
+
+    devices = {}  # device to [directory, bytes]
+    for directory, size in needed.items():
+        devices.setdefault(directory.stat().st_dev, [directory, 0])[1] += size
+    errors = []
+    for directory, size in devices.values():
+        free = shutil.disk_usage(directory).free
+        if size > free:
+            errors.append(f'not enough space in {directory}: need about {format_size(size)}, only {format_size(free)} free')
+    if errors:
+        raise PlanError('\n'.join(errors))
@@ -0,0 +1,168 @@
+import json
+import sys
+import threading
+import time
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:02}:{minutes:02}:{seconds:02}'
+
+
+def parse_progress(lines):
+    """
+    Groups the ``key=value`` lines of ffmpeg's ``-progress`` output in blocks (each block ends with a ``progress`` key).
+    """
+    block = {}
+    for line in lines:
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            continue
+        block[key] = value
+        if key == 'progress':
+            yield block
+            block = {}
+
+
+def out_time(block) -> float:
+    for key in 'out_time_us', 'out_time_ms':  # out_time_ms is in microseconds too
+        value = block.get(key, 'N/A')
+        if value != 'N/A':
+            return max(0, int(value)) / 1_000_000
+    return 0.0
+
+
+class CommandProgress:
+    """
+    Progress of a single ffmpeg command. ``duration`` is how much media time the command is expected to output (or
+    ``None`` if it's not known).
+    """
+
+    def __init__(self, reporter, name, duration=None):
+        self.reporter = reporter
+        self.name = name
+        self.duration = duration
+        self.started = time.monotonic()
+        self.out_time = 0.0
+        self.fps = None
+        self.speed = None
+        self.total_size = 0
+
+    @property
+    def done(self):
+        if self.duration is None:
+            return 0.0
+        return min(self.out_time, self.duration)
+
+    def consume(self, fh):
+        with fh:
+            for block in parse_progress(fh):
+                self.out_time = out_time(block)
+                self.fps = block.get('fps')
+                self.speed = block.get('speed')
+                if block.get('total_size', 'N/A') != 'N/A':
+                    self.total_size = int(block['total_size'])
+                self.reporter.render()
+
+    def finish(self, returncode):
+        self.reporter.finish(self, returncode)
+
+
+class ProgressReporter:
+    """
+    Aggregates the progress of all the ffmpeg commands into a progress bar with an ETA and optionally writes metrics for
+    every command as JSON lines.
+    """
+
+    def __init__(self, show=True, metrics=None, stream=sys.stderr, interval=0.25):
+        self.show = show
+        self.metrics = metrics.open('a') if metrics else None
+        self.stream = stream
+        self.interval = interval
+        self.total = 0.0
+        self.finished = 0.0
+        self.active = []
+        self.started = time.monotonic()
+        self.last_render = 0.0
+        self.lock = threading.RLock()
+
+    def add(self, duration: float):
+        with self.lock:
+            self.total += duration
+
+    def advance(self, duration: float):
+        """
+        Counts work done elsewhere (eg: by spool workers) as finished.
+        """
+        with self.lock:
+            self.finished += duration
+            self.render(force=True)
+
+    def track(self, name, duration=None) -> CommandProgress:
+        progress = CommandProgress(self, name, duration)
+        with self.lock:
+            self.active.append(progress)
+        return progress
+
+    def finish(self, progress: CommandProgress, returncode):
+        wall_time = time.monotonic() - progress.started
+        with self.lock:
+            self.active.remove(progress)
+            if progress.duration is not None and returncode == 0:
+                self.finished += progress.duration
+            if self.metrics:
+                self.metrics.write(
+                    json.dumps(
+                        {
+                            'output': str(progress.name),
+                            'returncode': returncode,
+                            'duration': progress.duration,
+                            'wall_time': round(wall_time, 3),
+                            'speed': round(progress.out_time / wall_time, 3) if wall_time else None,
+                            'fps': progress.fps,
+                            'bytes': progress.total_size,
+                        }
+                    )
+                    + '\n'
+                )
+                self.metrics.flush()
+            self.render(force=True)
+
+    @property
+    def done(self):
+        return self.finished + sum(progress.done for progress in self.active)
+
+    def status(self, width=30):
+        elapsed = time.monotonic() - self.started
+        done = self.done
+        if self.total:
+            ratio = min(1.0, done / self.total)
+            filled = int(width * ratio)
+            bar = f'[{"#" * filled}{"-" * (width - filled)}] {ratio:6.1%}'
+        else:
+            bar = '[?]'
+        speed = done / elapsed if elapsed else 0.0
+        eta = format_duration((self.total - done) / speed) if speed and self.total else '--:--:--'
+        return (
+            f'{bar} {format_duration(done)}/{format_duration(self.total)} '
+            f'{speed:.2f}x {len(self.active)} running, elapsed {format_duration(elapsed)}, ETA {eta}'
+        )
+
+    def render(self, force=False):
+        if not self.show:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if force or now - self.last_render >= self.interval:
+                self.last_render = now
+                self.stream.write(f'\r\033[K{self.status()}')
+                self.stream.flush()
+
+    def close(self):
+        with self.lock:
+            if self.show:
+                self.render(force=True)
+                self.stream.write('\n')
+            if self.metrics:
+                self.metrics.close()
@@ -0,0 +1,386 @@
+"""
+Job server: queues jobs submitted over a Unix socket and runs their encodes on a worker pool shared by all the jobs.
+
+The protocol is one JSON object per line, one request per connection:
+
+* ``{"action": "submit", "argv": [...], "cwd": "...", "priority": 0}``: ``argv`` takes the same arguments as ``ffmpeg-cut``
+  (the job is planned once it starts, so planning errors show up as a failed job)
+* ``{"action": "status", "id": 1}`` (or without ``id`` for all the jobs)
+* ``{"action": "cancel", "id": 1}``
+
+Replies are a job (see :meth:`Job.as_dict`), ``{"jobs": [...]}`` or ``{"error": "..."}``.
+
+The ``worker`` command runs the clip encodes queued by ``ffmpeg-cut --spool DIR`` instead (see :mod:`ffmpeg_cut.spool`).
+"""
+
+import argparse
+import collections
+import functools
+import heapq
+import itertools
+import json
+import os
+import pathlib
+import shlex
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import CancelledError
+from dataclasses import dataclass
+from dataclasses import field
+
+from .cli import build_plan
+from .cli import execute
+from .cli import parser as cut_parser
+from .cli import run_task
+from .jobs import JobCancelled
+from .jobs import PriorityGroup
+from .jobs import PriorityPool
+from .jobs import default_jobs
+from .plan import PlanError
+from .progress import ProgressReporter
+from .spool import SpoolDir
+from .spool import work
+from .structs import Plan
+from .trace import Tracer
+
+DEFAULT_SOCKET = pathlib.Path(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()) / 'ffmpeg-cut.sock'
+LOG_LINES = 200
+
+
+@dataclass
+class Job:
+    id: int
+    argv: list[str]
+    cwd: pathlib.Path
+    priority: int
+    args: argparse.Namespace
+    plan: Plan | None = None  # planned once the job starts
+    state: str = 'queued'
+    error: str | None = None
+    group: PriorityGroup | None = None
+    submitted: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    log: collections.deque = field(default_factory=lambda: collections.deque(maxlen=LOG_LINES))
+
+    def as_dict(self, log=True):
+        job = {
+            'id': self.id,
+            'state': self.state,
+            'priority': self.priority,
+            'argv': self.argv,
+            'cwd': str(self.cwd),
+            'output': str(self.args.output if self.plan is None else self.plan.output),
+            'done': round(self.plan.duration if self.state == 'done' else self.args.reporter.done, 3),
+            'total': 0 if self.plan is None else round(self.plan.duration, 3),
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'error': self.error,
+        }
+        if log:
+            job['log'] = list(self.log)
+        return job
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            reply = self.server.dispatch(json.loads(self.rfile.readline()))
+        except (ValueError, KeyError, TypeError) as exc:
+            reply = {'error': f'invalid request: {exc}'}
+        self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+
+class JobServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Runs up to ``max_jobs`` submitted jobs at a time (lowest priority value first), with all their ffmpeg commands going
+    through one :class:`PriorityPool` of ``jobs`` workers.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: pathlib.Path, jobs: int, max_jobs: int):
+        self.path = path
+        self.pool = PriorityPool(jobs)
+        self.max_jobs = max_jobs
+        self.submitted = {}
+        self.pending = []
+        self.running = 0
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        super().__init__(str(path), RequestHandler)
+
+    def dispatch(self, message):
+        match message:
+            case {'action': 'submit', 'argv': list(argv), 'cwd': str(cwd), **options}:
+                return self.submit(argv, pathlib.Path(cwd), int(options.get('priority', 0)))
+            case {'action': 'status', 'id': int(id)}:
+                return self.status(id)
+            case {'action': 'status'}:
+                with self.lock:
+                    return {'jobs': [job.as_dict(log=False) for job in self.submitted.values()]}
+            case {'action': 'cancel', 'id': int(id)}:
+                return self.cancel(id)
+            case _:
+                return {'error': f'invalid request: {message!r}'}
+
+    def submit(self, argv, cwd, priority):
+        try:
+            args = cut_parser.parse_args(argv)
+        except SystemExit:
+            return {'error': f'invalid arguments: {shlex.join(argv)} (see ffmpeg-cut --help)'}
+        if args.watch:
+            return {'error': 'cannot submit a job with --watch'}
+        log = collections.deque(maxlen=LOG_LINES)
+        args.echo = log.append
+        args.jobs = self.pool.jobs
+        for name in 'input', 'output', 'metrics', 'trace', 'cache', 'spool', 'scratch', 'probe_cache':
+            if (path := getattr(args, name)) is not None:
+                setattr(args, name, cwd / path)
+        for rendition in args.renditions:
+            rendition.output = cwd / rendition.output
+        if args.trace and not args.dry_run:
+            args.tracer = Tracer(args.trace)
+        args.reporter = ProgressReporter(show=False, metrics=args.metrics)
+        with self.lock:
+            job = Job(id=next(self.ids), argv=argv, cwd=cwd, priority=priority, args=args, log=log)
+            self.submitted[job.id] = job
+            heapq.heappush(self.pending, (priority, job.id))
+        self.start_pending()
+        return job.as_dict()
+
+    def status(self, id):
+        with self.lock:
+            if job := self.submitted.get(id):
+                return job.as_dict()
+        return {'error': f'no such job: {id}'}
+
+    def cancel(self, id):
+        with self.lock:
+            job = self.submitted.get(id)
+            if job is None:
+                return {'error': f'no such job: {id}'}
+            if job.state == 'queued':
+                self.pending.remove((job.priority, job.id))
+                heapq.heapify(self.pending)
+                self.close_job(job, 'cancelled')
+            elif job.state == 'running':
+                job.group.cancel()
+            return job.as_dict()
+
+    def start_pending(self):
+        with self.lock:
+            while self.pending and self.running < self.max_jobs:
+                _, id = heapq.heappop(self.pending)
+                job = self.submitted[id]
+                job.state = 'running'
+                job.started = time.time()
+                job.group = self.pool.group(job.priority)
+                self.running += 1
+                threading.Thread(target=self.run_job, args=(job,), name=f'ffmpeg-cut-job-{id}', daemon=True).start()
+
+    def run_job(self, job: Job):
+        state = 'failed'
+        try:
+            # planning probes the inputs (and may encode calibration samples) so it takes a worker of the pool too
+            job.plan = job.group.submit(build_plan, job.args, base=job.cwd).result()
+            execute(job.plan, job.args, pool=job.group)
+            state = 'done'
+        except (JobCancelled, CancelledError):
+            state = 'cancelled'
+        except (PlanError, OSError) as exc:
+            job.error = str(exc)
+        except Exception as exc:
+            job.error = f'{type(exc).__name__}: {exc}'
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.close_job(job, state)
+            self.start_pending()
+
+    def close_job(self, job: Job, state):
+        job.state = state
+        job.finished = time.time()
+        job.args.reporter.close()
+        if job.args.tracer:
+            job.args.tracer.close()
+
+    def server_close(self):
+        super().server_close()
+        with self.lock:
+            for job in self.submitted.values():
+                if job.group:
+                    job.group.cancel()
+        self.pool.shutdown()
+        self.path.unlink(missing_ok=True)
+
+
+def request(path: pathlib.Path, message) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(path))
+        sock.sendall(json.dumps(message).encode() + b'\n')
+        with sock.makefile('rb') as fh:
+            return json.loads(fh.readline())
+
+
+def format_job(job) -> str:
+    progress = f'{job["done"] / job["total"]:6.1%}' if job['total'] else '     ?'
+    return f'{job["id"]:>5} {job["state"]:<9} {job["priority"]:>4} {progress} {job["output"]}'
+
+
+parser = argparse.ArgumentParser(prog='ffmpeg-cut', description='ffmpeg wrapper job server and spool workers')
+parser_commands = parser.add_subparsers(dest='command', required=True)
+parser_serve = parser_commands.add_parser('serve', help='run the job server')
+parser_serve.add_argument(
+    '-p',
+    '--jobs',
+    help='how many ffmpeg commands run at once, across all jobs (default: a quarter of the CPU count)',
+    type=int,
+    default=default_jobs(),
+    metavar='N',
+)
+parser_serve.add_argument('--max-jobs', help='how many jobs run at once (default: same as --jobs)', type=int, metavar='N')
+parser_submit = parser_commands.add_parser(
+    'submit',
+    help='queue a job',
+    usage='%(prog)s [options] -- FFMPEG-CUT-ARGUMENTS',
+    description='queue a job with the ffmpeg-cut arguments given after --',
+)
+parser_submit.add_argument('--priority', help='jobs with a lower value run first (default: %(default)s)', type=int, default=0, metavar='N')
+parser_submit.add_argument('--wait', help='wait for the job to finish and exit with an error if it failed', action='store_true')
+parser_status = parser_commands.add_parser('status', help='show the state of all the jobs or the log of one job')
+parser_status.add_argument('id', help='job id', type=int, nargs='?')
+parser_cancel = parser_commands.add_parser('cancel', help='cancel a job')
+parser_cancel.add_argument('id', help='job id', type=int)
+parser_worker = parser_commands.add_parser('worker', help='encode the clips queued in a spool directory (see ffmpeg-cut --spool)')
+parser_worker.add_argument('spool', help='spool directory', type=pathlib.Path, metavar='DIR')
+parser_worker.add_argument(
+    '-p',
+    '--jobs',
+    help='how many clips to encode at once (default: a quarter of the CPU count)',
+    type=int,
+    default=default_jobs(),
+    metavar='N',
+)
+parser_worker.add_argument(
+    '--idle-exit', help='exit when there is nothing queued or running instead of waiting for more', action='store_true'
+)
+for subparser in parser_serve, parser_submit, parser_status, parser_cancel:
+    subparser.add_argument('--socket', help='path of the server socket (default: %(default)s)', type=pathlib.Path, default=DEFAULT_SOCKET)
+
+
+def serve(args):
+    if args.socket.exists():
+        try:
+            request(args.socket, {'action': 'status'})
+        except ConnectionRefusedError:
+            args.socket.unlink()  # left behind by a server that crashed
+        else:
+            parser.error(f'a server is already running on {args.socket}')
+
+    def terminate(signum, frame):
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, terminate)
+    with JobServer(args.socket, args.jobs, args.max_jobs or args.jobs) as server:
+        print(f'serving on {args.socket} ({args.jobs} workers)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def worker(args):
+    stop = threading.Event()
+
+    def terminate(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGTERM, terminate)
+    spool = SpoolDir(args.spool)
+    run = functools.partial(run_task, jobs=args.jobs)
+    owner = f'{socket.gethostname()}-{os.getpid()}'
+    threads = [
+        threading.Thread(target=work, args=(spool, run, f'{owner}-{index}'), kwargs={'idle_exit': args.idle_exit, 'stop': stop})
+        for index in range(args.jobs)
+    ]
+    print(f'working on {args.spool} ({args.jobs} workers)')
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        stop.set()  # the encodes that are running finish first
+        for thread in threads:
+            thread.join()
+
+
+def submit(args):
+    if not args.argv:
+        parser_submit.error('missing ffmpeg-cut arguments after --')
+    cut_parser.parse_args(args.argv)  # report usage errors here instead of on the server
+    reply = request(args.socket, {'action': 'submit', 'argv': args.argv, 'cwd': str(pathlib.Path.cwd()), 'priority': args.priority})
+    if error := reply.get('error'):
+        parser.error(error)
+    print(format_job(reply))
+    if args.wait:
+        while reply['state'] in ('queued', 'running'):
+            time.sleep(1)
+            reply = request(args.socket, {'action': 'status', 'id': reply['id']})
+        print(format_job(reply))
+        if reply['state'] != 'done':
+            for line in reply['log']:
+                print(f'    {line}')
+            parser.exit(1, f'{reply["error"] or reply["state"]}\n')
+
+
+def status(args):
+    if args.id is None:
+        for job in request(args.socket, {'action': 'status'})['jobs']:
+            print(format_job(job))
+    else:
+        job = request(args.socket, {'action': 'status', 'id': args.id})
+        if 'id' not in job:
+            parser.error(job['error'])
+        print(format_job(job))
+        for line in job['log']:
+            print(f'    {line}')
+        if job['error']:
+            print(job['error'])
+
+
+def cancel(args):
+    job = request(args.socket, {'action': 'cancel', 'id': args.id})
+    if 'id' not in job:
+        parser.error(job['error'])
+    print(format_job(job))
+
+
+def run(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if '--' in args:
+        separator = args.index('--')
+        args, argv = args[:separator], args[separator + 1 :]
+    else:
+        argv = []
+    args = parser.parse_args(args=args)
+    args.argv = argv
+    if args.command == 'serve':
+        serve(args)
+    elif args.command == 'worker':
+        worker(args)
+    else:
+        try:
+            {'submit': submit, 'status': status, 'cancel': cancel}[args.command](args)
+        except (FileNotFoundError, ConnectionRefusedError):
+            parser.error(f'no server running on {args.socket}')
+    parser.exit(0)
@@ -0,0 +1,296 @@
+import dataclasses
+import json
+import os
+import pathlib
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from .cache import file_identity
+
+VIDEO_ENCODERS = {
+    'h264': 'libx264',
+    'hevc': 'libx265',
+}
+VIDEO_PROFILES = {  # ffprobe profile names to the encoder -profile:v values
+    'h264': {
+        'Constrained Baseline': 'baseline',
+        'Baseline': 'baseline',
+        'Main': 'main',
+        'High': 'high',
+        'High 10': 'high10',
+        'High 4:2:2': 'high422',
+        'High 4:4:4 Predictive': 'high444',
+    },
+    'hevc': {
+        'Main': 'main',
+        'Main 10': 'main10',
+    },
+}
+AUDIO_ENCODERS = {
+    'aac': 'aac',
+    'ac3': 'ac3',
+    'mp3': 'libmp3lame',
+    'opus': 'libopus',
+}
+PROBES = {}  # file identity (path, size and mtime) to MediaInfo, shared by all the plans of the process
+PROBES_LOCK = threading.Lock()
+PROBE_FILE_ENTRIES = 10000
+PROBE_WORKERS = 8
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds * 1000), 60000)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:02}:{minutes:02}:{seconds // 1000:02}.{seconds % 1000:03}'
+
+
+@dataclass
+class Codecs:
+    video: str
+    pix_fmt: str | None
+    audio: list[str]
+    profile: str | None = None
+    level: int | None = None
+    time_base: str | None = None
+
+    @property
+    def video_encoder(self):
+        return VIDEO_ENCODERS.get(self.video)
+
+    @property
+    def video_profile(self):
+        return VIDEO_PROFILES.get(self.video, {}).get(self.profile)
+
+    @property
+    def video_options(self) -> list[str]:
+        """
+        The encoder options for the re-encoded head and tail of a cut, so they match the stream-copied GOPs.
+        """
+        if self.video == 'hevc':
+            level = ['-x265-params', f'level-idc={self.level / 30:g}']
+        else:
+            level = ['-level:v', f'{self.level / 10:g}']
+        return [
+            '-c:v',
+            self.video_encoder,
+            '-pix_fmt',
+            self.pix_fmt,
+            '-profile:v',
+            self.video_profile,
+            *level,
+            '-enc_time_base:v',
+            self.time_base,
+        ]
+
+    @property
+    def audio_encoders(self):
+        return [AUDIO_ENCODERS.get(codec) for codec in self.audio]
+
+    @property
+    def supported(self):
+        """
+        Whether the head and tail can be encoded to match the copied GOPs: all the properties need to be known.
+        """
+        return (
+            self.video_encoder is not None
+            and self.video_profile is not None
+            and self.pix_fmt is not None
+            and self.level is not None
+            and self.level > 0
+            and self.time_base is not None
+            and all(self.audio_encoders)
+        )
+
+
+@dataclass
+class SmartCutPlan:
+    head: tuple[float, float] | None
+    copy: tuple[float, float] | None
+    tail: tuple[float, float] | None
+
+
+def probe_codecs(input) -> Codecs:
+    info = json.loads(
+        subprocess.check_output(
+            [
+                'ffprobe',
+                '-v',
+                'error',
+                '-show_entries',
+                'stream=codec_type,codec_name,pix_fmt,profile,level,time_base',
+                '-of',
+                'json',
+                input,
+            ],
+        )
+    )
+    video = [stream for stream in info['streams'] if stream['codec_type'] == 'video']
+    audio = [stream['codec_name'] for stream in info['streams'] if stream['codec_type'] == 'audio']
+    return Codecs(
+        video=video[0]['codec_name'],
+        pix_fmt=video[0].get('pix_fmt'),
+        audio=audio,
+        profile=video[0].get('profile'),
+        level=video[0].get('level'),
+        time_base=video[0].get('time_base'),
+    )
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    duration: float
+    width: int | None = None
+    height: int | None = None
+    frame_rate: str | None = None
+    pix_fmt: str | None = None
+    sample_rate: str | None = None
+    channels: int | None = None
+    audio_codecs: tuple[str, ...] = ()
+
+    @property
+    def size(self):
+        return None if self.width is None else f'{self.width}x{self.height}'
+
+
+def probe_media(input) -> MediaInfo:
+    """
+    Probes the duration, the properties of the first video and audio streams that must match for a concat copy and the
+    codecs of all the audio streams.
+    """
+    info = json.loads(
+        subprocess.check_output(
+            [
+                'ffprobe',
+                '-v',
+                'error',
+                '-show_entries',
+                'format=duration:stream=codec_type,codec_name,width,height,r_frame_rate,pix_fmt,sample_rate,channels',
+                '-of',
+                'json',
+                input,
+            ],
+        )
+    )
+    video = next((stream for stream in info['streams'] if stream['codec_type'] == 'video'), {})
+    audio_streams = [stream for stream in info['streams'] if stream['codec_type'] == 'audio']
+    audio = audio_streams[0] if audio_streams else {}
+    return MediaInfo(
+        duration=float(info['format']['duration']),
+        width=video.get('width'),
+        height=video.get('height'),
+        frame_rate=video.get('r_frame_rate'),
+        pix_fmt=video.get('pix_fmt'),
+        sample_rate=audio.get('sample_rate'),
+        channels=audio.get('channels'),
+        audio_codecs=tuple(stream.get('codec_name') for stream in audio_streams),
+    )
+
+
+def load_probes(path: pathlib.Path):
+    """
+    Adds the probes saved by :func:`save_probes` in ``path`` (if it exists) to the ones of this process.
+    """
+    try:
+        data = json.loads(path.read_text())
+        probes = {identity: MediaInfo(**{**fields, 'audio_codecs': tuple(fields['audio_codecs'])}) for identity, fields in data.items()}
+    except (FileNotFoundError, ValueError, TypeError, KeyError):
+        return
+    with PROBES_LOCK:
+        for identity, info in probes.items():
+            PROBES.setdefault(identity, info)
+
+
+def save_probes(path: pathlib.Path):
+    """
+    Writes the most recent probes of this process (at most ``PROBE_FILE_ENTRIES``) to ``path``, atomically.
+    """
+    with PROBES_LOCK:
+        recent = list(PROBES.items())[-PROBE_FILE_ENTRIES:]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'{path.name}.{os.getpid()}')
+    temporary.write_text(json.dumps({identity: dataclasses.asdict(info) for identity, info in recent}))
+    temporary.replace(path)
+
+
+def cached_probe(input: pathlib.Path) -> MediaInfo:
+    """
+    Probes ``input`` unless it was already probed (by this process, or a previous run if loaded with
+    :func:`load_probes`) and its size and mtime didn't change since.
+    """
+    identity = json.dumps(file_identity(input))
+    with PROBES_LOCK:
+        info = PROBES.get(identity)
+    if info is None:
+        info = probe_media(input)
+        with PROBES_LOCK:
+            PROBES[identity] = info
+    return info
+
+
+def probe_all(inputs: list[pathlib.Path]) -> tuple[dict[pathlib.Path, MediaInfo], list[str]]:
+    """
+    Probes the distinct ``inputs`` in parallel. Returns what could be probed and the problems with the rest.
+    """
+    inputs = list(dict.fromkeys(inputs))
+    infos = {}
+    errors = []
+    if not inputs:
+        return infos, errors
+    with ThreadPoolExecutor(max_workers=min(len(inputs), PROBE_WORKERS), thread_name_prefix='ffmpeg-cut-probe') as executor:
+        futures = {input: executor.submit(cached_probe, input) for input in inputs}
+        for input, future in futures.items():
+            try:
+                infos[input] = future.result()
+            except FileNotFoundError:
+                errors.append(f'{str(input)!r} does not exist')
+            except (subprocess.CalledProcessError, KeyError, ValueError):
+                errors.append(f'cannot probe {str(input)!r}')
+    return infos, errors
+
+
+def probe_duration(input) -> float:
+    output = subprocess.check_output(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', input], text=True)
+    return float(output.strip())
+
+
+def probe_keyframes(input, start: float, end: float) -> list[float]:
+    output = subprocess.check_output(
+        [
+            'ffprobe',
+            '-v',
+            'error',
+            '-select_streams',
+            'v:0',
+            '-read_intervals',
+            f'{start}%{end}',
+            '-show_entries',
+            'packet=pts_time,flags',
+            '-of',
+            'csv=p=0',
+            input,
+        ],
+        text=True,
+    )
+    keyframes = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time != 'N/A':
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def plan_smart_cut(keyframes: list[float], start: float, end: float) -> SmartCutPlan:
+    """
+    Splits ``[start, end]`` in a head and tail that need re-encoding and the whole GOPs between them that can be copied.
+    """
+    inside = [keyframe for keyframe in keyframes if start <= keyframe <= end]
+    if len(inside) < 2:
+        return SmartCutPlan(head=(start, end), copy=None, tail=None)
+    first, last = inside[0], inside[-1]
+    return SmartCutPlan(
+        head=(start, first) if first > start else None,
+        copy=(first, last),
+        tail=(last, end) if end > last else None,
+    )
@@ -0,0 +1,173 @@
+"""
+Task queue in a spool directory, so clips can be encoded by worker processes on other machines that share the
+filesystem. Tasks move between subdirectories with atomic renames:
+
+* ``queue/NAME.json``: waiting for a worker
+* ``running/NAME@OWNER.json``: claimed by a worker, which bumps the mtime while it works (the lease)
+* ``done/NAME.json``
+* ``failed/NAME.json``: with an ``error`` key
+
+Running tasks whose lease wasn't renewed for ``lease`` seconds are moved back to the queue by the other workers (so the
+clocks of the machines need to be in sync).
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+LEASE = 60.0
+POLL = 1.0
+STATES = ('queue', 'running', 'done', 'failed')
+
+
+class TaskFailed(Exception):
+    pass
+
+
+@dataclass
+class Lease:
+    name: str
+    path: os.PathLike
+    task: dict
+
+
+class SpoolDir:
+    def __init__(self, path, lease=LEASE):
+        self.path = path
+        self.lease = lease
+        for state in STATES:
+            (path / state).mkdir(parents=True, exist_ok=True)
+
+    def submit(self, name, task: dict):
+        tmp = self.path / 'queue' / f'.{name}.tmp'
+        tmp.write_text(json.dumps(task))
+        tmp.replace(self.path / 'queue' / f'{name}.json')
+
+    def claim(self, owner) -> Lease | None:
+        for entry in sorted((self.path / 'queue').glob('*.json')):
+            running = self.path / 'running' / f'{entry.stem}@{owner}.json'
+            try:
+                entry.rename(running)
+            except FileNotFoundError:
+                continue  # another worker got it first
+            os.utime(running)
+            return Lease(entry.stem, running, json.loads(running.read_text()))
+        return None
+
+    def renew(self, lease: Lease) -> bool:
+        try:
+            os.utime(lease.path)
+        except FileNotFoundError:
+            return False  # expired and taken back
+        return True
+
+    def complete(self, lease: Lease) -> bool:
+        try:
+            lease.path.rename(self.path / 'done' / f'{lease.name}.json')
+        except FileNotFoundError:
+            return False
+        return True
+
+    def fail(self, lease: Lease, error: str):
+        failed = self.path / 'failed' / f'{lease.name}.json'
+        failed.write_text(json.dumps({**lease.task, 'error': error}))
+        lease.path.unlink(missing_ok=True)
+
+    def requeue_expired(self):
+        now = time.time()
+        for entry in (self.path / 'running').glob('*.json'):
+            name, _, _ = entry.stem.partition('@')
+            try:
+                if now - entry.stat().st_mtime > self.lease:
+                    entry.rename(self.path / 'queue' / f'{name}.json')
+            except FileNotFoundError:
+                pass
+
+    def state(self, name) -> str | None:
+        for state in 'done', 'failed', 'queue':
+            if (self.path / state / f'{name}.json').exists():
+                return state
+        if any((self.path / 'running').glob(f'{name}@*.json')):
+            return 'running'
+        return None
+
+    def error(self, name) -> str:
+        return json.loads((self.path / 'failed' / f'{name}.json').read_text())['error']
+
+    def idle(self) -> bool:
+        return not any((self.path / 'queue').glob('*.json')) and not any((self.path / 'running').glob('*.json'))
+
+    def remove(self, names):
+        """
+        Removes tasks that are queued or finished (running ones are left to finish).
+        """
+        for name in names:
+            for state in 'queue', 'done', 'failed':
+                (self.path / state / f'{name}.json').unlink(missing_ok=True)
+
+    def wait(self, names, poll=POLL, done=None):
+        """
+        Blocks until all the tasks are done, calling ``done`` with the name of each one as it completes. If a task fails the
+        queued ones are removed and :class:`TaskFailed` is raised.
+        """
+        pending = set(names)
+        missing = set()
+        while pending:
+            for name in sorted(pending):
+                match self.state(name):
+                    case 'done':
+                        pending.discard(name)
+                        if done:
+                            done(name)
+                    case 'failed':
+                        error = self.error(name)
+                        self.remove(names)
+                        raise TaskFailed(f'{name}: {error}')
+                    case None if name in missing:
+                        raise TaskFailed(f'{name}: disappeared from {self.path}')
+                    case None:
+                        missing.add(name)  # it may have been moving between directories
+                    case _:
+                        missing.discard(name)
+            if pending:
+                time.sleep(poll)
+        self.remove(names)
+
+
+def work(spool: SpoolDir, run, owner, idle_exit=False, stop=None, poll=POLL, echo=print):
+    """
+    Claims and runs tasks (by calling ``run`` with the task) until ``stop`` is set, or until there's nothing left to do if
+    ``idle_exit`` is true.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        spool.requeue_expired()
+        lease = spool.claim(owner)
+        if lease is None:
+            if idle_exit and spool.idle():
+                return
+            stop.wait(poll)
+            continue
+
+        finished = threading.Event()
+
+        def renew(lease=lease, finished=finished):
+            while not finished.wait(spool.lease / 3) and spool.renew(lease):
+                pass
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+        echo(f'{owner}: running {lease.name}')
+        try:
+            run(lease.task)
+        except Exception as exc:
+            echo(f'{owner}: {lease.name} failed: {exc}')
+            spool.fail(lease, f'{type(exc).__name__}: {exc}')
+        else:
+            if not spool.complete(lease):
+                echo(f'{owner}: lost the lease of {lease.name}')
+        finally:
+            finished.set()
+            renewer.join()
@@ -0,0 +1,82 @@
+import tempfile
+import threading
+
+from .jobs import CHUNK_SIZE
+from .jobs import JobCancelled
+
+
+class Spool:
+    """
+    Holds the output of one clip encoder until the muxer gets to it.
+
+    Data stays in memory up to ``max_size`` and then spills to a temporary file. Whenever the reader catches up with the
+    writer the buffer is emptied, so the clip that is being muxed only passes through memory.
+    """
+
+    def __init__(self, max_size: int, dir=None):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_size, dir=dir)
+        self.written = 0
+        self.position = 0
+        self.closed = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def write(self, data: bytes):
+        with self.condition:
+            if self.file.closed:
+                # the muxer gave up, just drain the encoder
+                return
+            self.file.seek(self.written)
+            self.file.write(data)
+            self.written += len(data)
+            self.condition.notify_all()
+
+    def close(self, error=None):
+        with self.condition:
+            if not self.closed:
+                self.closed = True
+                self.error = error
+                self.condition.notify_all()
+
+    def read(self) -> bytes:
+        """
+        Blocks until there's data or the writer is done. Returns an empty bytes object at the end.
+        """
+        with self.condition:
+            while self.position == self.written and not self.closed:
+                self.condition.wait()
+            self.file.seek(self.position)
+            data = self.file.read(min(CHUNK_SIZE, self.written - self.position))
+            self.position += len(data)
+            if self.position == self.written:
+                self.file.seek(0)
+                self.file.truncate()
+                self.position = self.written = 0
+            return data
+
+    def discard(self):
+        with self.condition:
+            self.file.close()
+
+    def close_from_future(self, future):
+        if future.cancelled():
+            self.close(JobCancelled())
+        else:
+            self.close(future.exception())
+
+
+def relay(spools: list[Spool], destination) -> bool:
+    """
+    Copies the spools, in order, to ``destination``. Returns ``False`` if a spool was closed because of an error.
+    """
+    try:
+        for spool in spools:
+            while data := spool.read():
+                destination.write(data)
+            if spool.error is not None:
+                return False
+            spool.discard()
+        return True
+    finally:
+        for spool in spools:
+            spool.discard()
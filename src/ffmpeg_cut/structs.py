@@ -1,25 +1,92 @@
 import pathlib
+import re
 from dataclasses import dataclass
 from dataclasses import field
 
+TIME_PATTERN = r'(?:\d+:){0,2}\d+(?:\.\d+)?'
+TIME_RE = re.compile(TIME_PATTERN)
+TIMESTAMP_RE = re.compile(rf'(?P<start>{TIME_PATTERN})-(?P<end>{TIME_PATTERN})')
+# in files cuts need minutes or a fraction so that lines like "2023-10" (a directory) stay paths
+LINE_TIME_PATTERN = r'(?:(?:\d+:){1,2}\d+(?:\.\d+)?|\d+\.\d+)'
+LINE_TIMESTAMP_RE = re.compile(rf'(?P<start>{LINE_TIME_PATTERN})-(?P<end>{LINE_TIME_PATTERN})')
 
-@dataclass
+
+def parse_ms(value: str) -> int:
+    """
+    Parses ``[[HH:]MM:]SS[.mmm]`` timestamps (so plain seconds too, eg: ``90.5``) into milliseconds.
+    """
+    if not TIME_RE.fullmatch(value):
+        raise ValueError(f'invalid timestamp: {value!r}')
+    *parts, seconds = value.split(':')
+    ms = round(float(seconds) * 1000)
+    hours, minutes = ([0, 0] + [int(part) for part in parts])[-2:]
+    if parts and (ms >= 60_000 or (len(parts) == 2 and minutes >= 60)):
+        raise ValueError(f'invalid timestamp: {value!r}')
+    return (hours * 60 + minutes) * 60_000 + ms
+
+
+def format_ms(ms: int) -> str:
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours:02}:{minutes:02}:{seconds:02}.{ms:03}'
+    else:
+        return f'{minutes:02}:{seconds:02}.{ms:03}'
+
+
+@dataclass(frozen=True, order=True)
 class Cut:
-    start: str
-    end: str
+    """
+    A range of an input, in milliseconds.
+    """
+
+    start: int
+    end: int
+
+    def __post_init__(self):
+        if not 0 <= self.start < self.end:
+            raise ValueError(f'cut must end after it starts: {self}')
+
+    @classmethod
+    def parse(cls, value: str) -> 'Cut':
+        if match := TIMESTAMP_RE.fullmatch(value.strip()):
+            return cls(parse_ms(match['start']), parse_ms(match['end']))
+        raise ValueError(f'invalid cut: {value!r}')
+
+    @property
+    def start_timestamp(self):
+        return format_ms(self.start)
+
+    @property
+    def end_timestamp(self):
+        return format_ms(self.end)
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) / 1000
+
+    def touches(self, other: 'Cut'):
+        """
+        Whether the cuts overlap or are adjacent.
+        """
+        return self.start <= other.end and other.start <= self.end
+
+    def __str__(self):
+        return f'{self.start_timestamp}-{self.end_timestamp}'
 
 
 @dataclass
 class Instruction:
     input: pathlib.Path
     cut: list[Cut]
-    args: object
+    args: object = None
 
     def __getattr__(self, item):
         return getattr(self.args, item)
 
     def __str__(self):
-        cuts = ' '.join(f'{cut.start}-{cut.end}' for cut in self.cut)
+        cuts = ' '.join(str(cut) for cut in self.cut)
         return f'{self.input} {cuts}'
 
 
@@ -41,8 +108,103 @@ class ClipList:
     def append(self, input, cut, output):
         self.clips.append(Clip(input=input, cut=cut, output=output))
 
-    def as_concat_input(self):
-        return '\n'.join(f'# {clip.input} {clip.cut.start}-{clip.cut.end}\n' f'file {str(clip.output)!r}\n' for clip in self.clips)
+    def as_concat_input(self, absolute=False):
+        """
+        The concat demuxer list of the clips. ffmpeg resolves relative entries against the directory of the list, so lists
+        written anywhere but the current directory need ``absolute``.
+        """
+        return '\n'.join(
+            f'# {clip.input} {clip.cut}\nfile {str(clip.output.absolute() if absolute else clip.output)!r}\n' for clip in self.clips
+        )
 
     def __len__(self):
         return len(self.clips)
+
+
+@dataclass
+class Step:
+    """
+    One thing to do for a plan. The ``kind`` is one of:
+
+    * ``clip``: cut ``input`` to ``output`` (``argv`` is ``None`` for smart cuts as they depend on the keyframes)
+    * ``encode``: run ``argv`` to produce ``output``
+    * ``chunk``: run ``argv`` to produce ``output``, in parallel with the neighbouring ``chunk`` steps
+    * ``split``: run ``argv`` to produce ``output`` and ``paths`` (one clip per rendition), in parallel with the
+      neighbouring ``split`` steps
+    * ``write``: write ``content`` to ``output``
+    * ``join``: run ``argv`` to join the clips into ``output``
+    * ``stream``: run ``argv`` and pipe its output to the next ``mux`` step
+    * ``mux``: run ``argv`` with the output of the ``stream`` steps as input
+    * ``cleanup``: remove ``paths``
+    """
+
+    kind: str
+    output: pathlib.Path | None = None
+    argv: list | None = None
+    input: pathlib.Path | None = None
+    cut: Cut | None = None
+    options: list[str] = field(default_factory=list)
+    duration: float | None = None
+    content: str | None = None
+    paths: list[pathlib.Path] = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'output': None if self.output is None else str(self.output),
+            'argv': None if self.argv is None else [str(arg) for arg in self.argv],
+            'input': None if self.input is None else str(self.input),
+            'cut': None if self.cut is None else {'start': self.cut.start, 'end': self.cut.end},
+            'options': self.options,
+            'duration': self.duration,
+            'content': self.content,
+            'paths': [str(path) for path in self.paths],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            kind=data['kind'],
+            output=None if data['output'] is None else pathlib.Path(data['output']),
+            argv=data['argv'],
+            input=None if data['input'] is None else pathlib.Path(data['input']),
+            cut=None if data['cut'] is None else Cut(**data['cut']),
+            options=data['options'],
+            duration=data['duration'],
+            content=data['content'],
+            paths=[pathlib.Path(path) for path in data['paths']],
+        )
+
+
+@dataclass
+class Plan:
+    inputs: list[pathlib.Path]
+    output: pathlib.Path
+    steps: list[Step] = field(default_factory=list)
+
+    @property
+    def clips(self):
+        clips = ClipList()
+        for step in self.steps:
+            if step.kind == 'clip':
+                clips.append(step.input, step.cut, step.output)
+        return clips
+
+    @property
+    def duration(self):
+        return sum(step.duration or 0 for step in self.steps if step.kind in ('clip', 'chunk', 'split', 'encode', 'stream'))
+
+    def as_dict(self):
+        return {
+            'inputs': [str(input) for input in self.inputs],
+            'output': str(self.output),
+            'steps': [step.as_dict() for step in self.steps],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            inputs=[pathlib.Path(input) for input in data['inputs']],
+            output=pathlib.Path(data['output']),
+            steps=[Step.from_dict(step) for step in data['steps']],
+        )
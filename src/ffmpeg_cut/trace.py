@@ -0,0 +1,90 @@
+"""
+Timeline of a run in the Chrome trace event format, that can be loaded in https://ui.perfetto.dev or chrome://tracing.
+
+Every stage (planning, the ffmpeg commands, writing the concat lists, cleanup) is a complete (``X``) event on the thread
+that ran it. Commands also have their exit status and the resource usage of the process (CPU time and max RSS).
+"""
+
+import contextlib
+import functools
+import json
+import pathlib
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+
+def record_usage(args: dict, rusage):
+    args['user_time'] = round(rusage.ru_utime, 3)
+    args['system_time'] = round(rusage.ru_stime, 3)
+    # kilobytes on Linux, bytes on macOS
+    args['max_rss'] = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class Tracer:
+    def __init__(self, path):
+        self.path = path
+        self.started = time.perf_counter()
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self.started) * 1_000_000
+
+    def tid(self) -> int:
+        """
+        Small numbers for the threads (in order of appearance) so they are listed in that order.
+        """
+        ident = threading.get_ident()
+        if ident not in self.threads:
+            self.threads[ident] = tid = len(self.threads) + 1
+            self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': threading.current_thread().name}})
+        return self.threads[ident]
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """
+        Records the time spent in the ``with`` block. The ``args`` dict is yielded so more details can be added to it.
+        """
+        start = self.now()
+        try:
+            yield args
+        except subprocess.CalledProcessError as exc:
+            args['returncode'] = exc.returncode
+            raise
+        except BaseException as exc:
+            args['error'] = repr(exc)
+            raise
+        finally:
+            end = self.now()
+            with self.lock:
+                self.events.append(
+                    {
+                        'name': str(name),
+                        'cat': category,
+                        'ph': 'X',
+                        'ts': round(start),
+                        'dur': round(end - start),
+                        'pid': 1,
+                        'tid': self.tid(),
+                        'args': args,
+                    }
+                )
+
+    @contextlib.contextmanager
+    def command(self, argv):
+        """
+        Records a command (named after its output). Yields a callback for the resource usage of the process.
+        """
+        with self.span(pathlib.Path(str(argv[-1])).name, 'ffmpeg', command=shlex.join(str(arg) for arg in argv)) as args:
+            yield functools.partial(record_usage, args)
+            args['returncode'] = 0
+
+    def close(self):
+        with self.lock:
+            data = {'traceEvents': self.events, 'displayTimeUnit': 'ms'}
+        with pathlib.Path(self.path).open('w') as fh:
+            json.dump(data, fh)
@@ -0,0 +1,89 @@
+"""
+Watch mode: the cut list is rendered again every time it or one of its inputs changes.
+
+Clips are named after their position in the plan (``NAME-000``, ``NAME-001``...) so inserting a line near the top of the
+cut list changes the name of every clip after it. Before every render the clips that are finished (as recorded in the
+journal) are matched to the clips of the new plan by their key and renamed to their new name, so only the cuts that were
+added or changed (or whose input changed) are encoded and the join runs again.
+"""
+
+import pathlib
+import time
+
+from .journal import Journal
+from .journal import journal_path
+from .plan import PlanError
+from .structs import Plan
+
+POLL = 0.5
+
+
+def check_watch(args):
+    if not (args.text or args.clips):
+        raise PlanError('--watch needs a cut list (--text or --clips)')
+    if args.export or args.renditions or args.single_decode or args.stream_join or args.scratch_budget:
+        raise PlanError('cannot use --export, --rendition, --single-decode, --stream-join or --scratch-budget with --watch')
+
+
+def snapshot(paths) -> dict[pathlib.Path, tuple[int, int] | None]:
+    """
+    The size and mtime of every path (``None`` if it doesn't exist).
+    """
+    state = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            state[path] = None
+        else:
+            state[path] = stat.st_size, stat.st_mtime_ns
+    return state
+
+
+def wait_for_change(state: dict, poll=POLL) -> list[pathlib.Path]:
+    """
+    Blocks until some of the files in ``state`` (from :func:`snapshot`) change and stay the same for ``poll`` seconds (as
+    editors may save in several writes). Returns the files that changed.
+    """
+    current = state
+    while current == state:
+        time.sleep(poll)
+        current = snapshot(state)
+    while True:
+        time.sleep(poll)
+        settled = snapshot(state)
+        if settled == current:
+            return [path for path in state if current[path] != state[path]]
+        current = settled
+
+
+def reuse_clips(plan: Plan, key) -> tuple[int, int]:
+    """
+    Renames the finished clips of the previous renders (from the journal of ``plan.output``) to the name that the clip
+    with the same ``key(step)`` has in ``plan``, and records them in the journal under that name. Finished clips that
+    ``plan`` doesn't use anymore are removed.
+
+    Returns how many clips are reused and how many need to be encoded.
+    """
+    journal = Journal(journal_path(plan.output))
+    finished = {}  # key to clip
+    for entry in journal.entries.values():
+        clip = pathlib.Path(entry['clip'])
+        if journal.finished(clip, entry['key']):
+            finished[entry['key']] = clip
+
+    keys = {step.output: key(step) for step in plan.steps if step.kind == 'clip' and '-n' in step.options}
+    moves = {finished[clip_key]: output for output, clip_key in keys.items() if finished.get(clip_key, output) != output}
+    durations = {clip: journal.entries[str(clip)]['duration'] for clip in moves}
+    used = set(keys.values())
+    for clip_key, clip in finished.items():
+        if clip_key not in used:
+            clip.unlink()
+    # clips can trade places, so they all get out of the way first
+    for clip in moves:
+        clip.rename(clip.with_stem(f'{clip.stem}.moving'))
+    for clip, output in moves.items():
+        clip.with_stem(f'{clip.stem}.moving').replace(output)
+        journal.record(output, keys[output], durations[clip])
+    reused = len(used & finished.keys())
+    return reused, len(keys) - reused
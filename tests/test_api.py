@@ -0,0 +1,314 @@
+import dataclasses
+import json
+import pathlib
+import types
+
+import pytest
+
+from ffmpeg_cut import api
+from ffmpeg_cut import cli
+from ffmpeg_cut import preflight
+from ffmpeg_cut import smartcut
+from ffmpeg_cut.plan import chunk_spans
+from ffmpeg_cut.preflight import check_free_space
+
+
+def test_plan_cuts(tmp_path):
+    source = tmp_path / 'source.mp4'
+    source.touch()
+    instructions = api.parse_text([str(source), '00:01.000-00:02.000', '', str(source), '00:03.000-00:04.500'])
+    settings = api.Settings(output=tmp_path / 'out.mp4', filters=api.parse_fps('30'), jobs=1)
+    plan = api.plan_cuts(instructions, settings)
+
+    assert plan.inputs == [source]
+    assert [step.kind for step in plan.steps] == ['clip', 'clip', 'write', 'join', 'cleanup']
+    assert plan.duration == 2.5
+    assert plan.steps[1].argv == [
+        'ffmpeg',
+        '-n',
+        '-ss',
+        '00:03.000',
+        '-to',
+        '00:04.500',
+        '-i',
+        source,
+        '-filter_complex',
+        '[0:v]fps=30',
+        '-c:v',
+        'libx264',
+        '-crf',
+        '15',
+        tmp_path / 'out-001.mp4',
+    ]
+    assert plan.steps[2].content == plan.clips.as_concat_input()
+    assert api.Plan.from_dict(json.loads(json.dumps(plan.as_dict()))).as_dict() == plan.as_dict()
+
+
+def test_execute_dry_run(tmp_path):
+    output = []
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, dry_run=True, echo=output.append)
+    plan = api.plan_cuts([api.Instruction(input=pathlib.Path('a.mp4'), cut=[api.parse_cut('00:01.000-00:02.000')])], settings)
+    api.execute(plan, settings)
+    assert output[0] == f'    ffmpeg -n -ss 00:01.000 -to 00:02.000 -i a.mp4 -c:v libx264 -crf 15 {tmp_path}/out-000.mp4'
+    assert output[-1] == f'    ffmpeg -f concat -safe 0 -i {tmp_path}/out.clips -c copy {tmp_path}/out.mp4'
+    assert not (tmp_path / 'out.clips').exists()
+
+
+def test_errors(tmp_path):
+    with pytest.raises(api.PlanError, match='did not find a path'):
+        api.parse_text(['00:01.000-00:02.000'])
+    with pytest.raises(api.PlanError, match='does not exist'):
+        api.parse_text([str(tmp_path / 'missing.mp4')])
+    with pytest.raises(api.PlanError, match='--smart-cut'):
+        api.check_settings(api.Settings(output=tmp_path / 'out.mp4', smart_cut=True, filters=api.parse_fps('30')))
+
+
+def test_cuts():
+    assert api.Cut.parse('01:02.5-1:00:00') == api.Cut(62500, 3600000)
+    assert api.Cut.parse('90-95.25') == api.Cut(90000, 95250)
+    assert str(api.Cut(62500, 3600000)) == '01:02.500-01:00:00.000'
+    for invalid in '00:02.000-00:01.000', '00:75.000-00:80.000', '1-1':
+        with pytest.raises(ValueError):  # noqa: PT011
+            api.Cut.parse(invalid)
+
+
+def test_merge_and_dedup(tmp_path):
+    a = tmp_path / 'a.mp4'
+    b = tmp_path / 'b.mp4'
+    instructions = api.parse_text(
+        [str(a), '00:10-00:20', '00:50-01:00', str(b), '00:10-00:20', str(a), '00:18-00:30', '00:30-00:50', '00:10-00:20'],
+        check_exists=False,
+    )
+
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1)
+    plan = api.plan_cuts(instructions, settings)
+    assert [step.cut for step in plan.steps if step.kind == 'clip'] == [
+        api.Cut(10000, 20000),
+        api.Cut(50000, 60000),
+        api.Cut(10000, 20000),
+        api.Cut(18000, 30000),
+        api.Cut(30000, 50000),
+    ]
+    assert plan.steps[5].content.count(f"file '{tmp_path}/out-000.mp4'") == 2
+    assert plan.steps[-1].paths == [*(tmp_path / f'out-{index:03}.mp4' for index in range(5)), tmp_path / 'out.journal']
+
+    settings.merge = True
+    plan = api.plan_cuts(instructions, settings)
+    assert [(step.input, step.cut) for step in plan.steps if step.kind == 'clip'] == [
+        (a, api.Cut(10000, 60000)),
+        (b, api.Cut(10000, 20000)),
+    ]
+
+    # a cut that bridges earlier ones takes the place of the first of them
+    instructions = api.parse_text([str(a), '00:40-00:50', str(b), '00:00-00:05', str(a), '00:10-00:20', '00:20-00:40'], check_exists=False)
+    assert [str(instruction) for instruction in api.merge_cuts(instructions)] == [f'{a} 00:10.000-00:50.000', f'{b} 00:00.000-00:05.000']
+
+
+def test_path_like_cuts(tmp_path):
+    # in files a cut needs minutes or a fraction, so "2023-10" is a path
+    instructions = api.parse_text(['2023-10', '90.0-95.5', '00:10-00:20'], check_exists=False, base=tmp_path)
+    assert [str(instruction) for instruction in instructions] == [f'{tmp_path}/2023-10 01:30.000-01:35.500 00:10.000-00:20.000']
+    with pytest.raises(api.PlanError, match='did not find a path'):
+        api.parse_text(['90.0-95.5'])
+
+
+def test_chunked(tmp_path):
+    assert chunk_spans([0.0, 4.0, 9.0, 12.5, 19.0, 21.0], 1.0, 22.0, 5.0) == [(1.0, 9.0), (9.0, 22.0)]
+    assert chunk_spans(None, 0.0, 11.0, 5.0) == [(0.0, 5.0), (5.0, 11.0)]
+
+    settings = api.Settings(output=tmp_path / 'out.mp4', filters=api.parse_fps('30'), jobs=2, chunk_length=60)
+    plan = api.plan_cut(tmp_path / 'in.mp4', api.parse_cut('01:00-04:30'), settings)
+    assert [step.kind for step in plan.steps] == ['chunk', 'chunk', 'chunk', 'write', 'encode', 'cleanup']
+    assert [step.cut for step in plan.steps[:3]] == [api.Cut(60000, 120000), api.Cut(120000, 180000), api.Cut(180000, 270000)]
+    assert plan.steps[0].argv[-4:] == ['-threads', plan.steps[0].argv[-3], '-an', tmp_path / 'out.chunk-000.ts']
+    assert plan.duration == 210
+
+
+def test_preview(tmp_path):
+    settings = api.Settings(output=tmp_path / 'out.mp4', filters=api.parse_fps('30'), encoder='libx265', jobs=1)
+    api.apply_preview(settings)
+    plan = api.plan_cuts([api.Instruction(input=tmp_path / 'in.mp4', cut=[api.parse_cut('00:01-00:02')])], settings)
+    assert plan.output == tmp_path / 'out.preview.mp4'
+    assert plan.steps[0].argv[-9:] == [
+        '-filter_complex',
+        '[0:v]fps=30[step_0];[step_0]scale=-2:360',
+        '-c:v',
+        'libx264',
+        '-crf',
+        '35',
+        '-preset',
+        'ultrafast',
+        tmp_path / 'out.preview-000.mp4',
+    ]
+
+
+def test_parse_errors(tmp_path):
+    (tmp_path / 'a.mp4').touch()
+    with pytest.raises(api.ParseErrors) as exc_info:
+        api.parse_text(['00:01-00:02', 'a.mp4', '00:03-00:02', '# comment', 'missing.mp4', '00:01-00:02', 'missing.mp4'], base=tmp_path)
+    assert exc_info.value.errors == [
+        (1, "did not find a path before '00:01-00:02'"),
+        (3, 'cut must end after it starts: 00:03.000-00:02.000'),
+        (5, "'missing.mp4' does not exist"),
+    ]
+
+    (tmp_path / 'out-000.mp4').touch()
+    clips = [f'# {tmp_path}/a.mp4 00:01.000-00:02.000', "file 'out-000.mp4'", '# a.mp4 00:03.000-00:04.000', "file 'out-001.mp4'", 'junk']
+    warnings = []
+    assert api.parse_join(clips, echo=warnings.append, base=tmp_path).outputs == [tmp_path / 'out-000.mp4']
+    assert warnings == ["WARNING: found junk in clips file on line 5: 'junk'", f'WARNING: {tmp_path / "out-001.mp4"!r} does not exist!']
+    assert [str(instruction) for instruction in api.parse_clips(clips, check_exists=False)] == [
+        f'{tmp_path}/a.mp4 00:01.000-00:02.000',
+        'a.mp4 00:03.000-00:04.000',
+    ]
+
+
+def test_audio(tmp_path, monkeypatch):
+    monkeypatch.setattr(smartcut, 'probe_media', lambda input: api.MediaInfo(duration=60.0, audio_codecs=('aac', 'pcm_s16le')))
+    monkeypatch.setattr(smartcut, 'PROBES', {})
+    source = tmp_path / 'in.mkv'
+    source.touch()
+    cut = api.parse_cut('00:01-00:02')
+
+    settings = api.Settings(output=tmp_path / 'out.mkv', jobs=1, audio='copy', audio_tracks=[0, 2])
+    assert api.plan_cut(source, cut, settings).steps[0].argv[-9:-1] == ['-map', '0:v:0', '-map', '0:a:0', '-map', '0:a:2', '-c:a', 'copy']
+    settings.output = tmp_path / 'out.mp4'
+    assert api.plan_cut(source, cut, settings).steps[0].argv[-3:] == ['-c:a', 'aac', settings.output]
+    settings.filters = api.parse_fps('30')
+    settings.audio_codec = 'libopus'
+    assert api.plan_cut(source, cut, settings).steps[0].argv[-7:] == ['-map', '0:a:0', '-map', '0:a:2', '-c:a', 'libopus', settings.output]
+
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, audio='none', chunk_length=10)
+    plan = api.plan_cut(tmp_path / 'missing.mp4', api.parse_cut('00:00-00:30'), settings)
+    assert plan.steps[0].argv[-2:] == ['-an', tmp_path / 'out.chunk-000.ts']
+    assert plan.steps[-2].argv[-5:] == ['-map', '0:v', '-c:v', 'copy', tmp_path / 'out.mp4']
+
+    with pytest.raises(api.PlanError, match='--smart-cut'):
+        api.check_settings(api.Settings(output=tmp_path / 'out.mp4', smart_cut=True, audio='copy'))
+
+
+def test_scratch_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(smartcut, 'probe_media', lambda input: api.MediaInfo(duration=100.0))
+    monkeypatch.setattr(smartcut, 'PROBES', {})
+    source = tmp_path / 'in.mp4'
+    source.write_bytes(b'x' * 1000)  # 10 bytes per second
+    scratch = tmp_path / 'scratch'
+    instructions = api.parse_text([str(source), '00:00-00:10', '00:10-00:20', '00:20-00:30', '00:00-00:10'])
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, scratch=scratch, scratch_budget=250)
+    plan = api.plan_cuts(instructions, settings)
+    assert [(step.kind, step.output) for step in plan.steps] == [
+        ('clip', scratch / 'out-000.mp4'),
+        ('clip', scratch / 'out-001.mp4'),
+        ('write', scratch / 'out.part-000.clips'),
+        ('join', scratch / 'out.part-000.mp4'),
+        ('cleanup', None),
+        ('clip', scratch / 'out-002.mp4'),
+        ('write', scratch / 'out.part-001.clips'),
+        ('join', scratch / 'out.part-001.mp4'),
+        ('cleanup', None),
+        ('write', scratch / 'out.segments'),
+        ('join', tmp_path / 'out.mp4'),
+        ('cleanup', None),
+    ]
+    assert plan.steps[4].paths == [scratch / 'out-001.mp4', scratch / 'out.part-000.clips']
+    assert plan.steps[8].paths == [scratch / 'out-002.mp4', scratch / 'out-000.mp4', scratch / 'out.part-001.clips']
+    assert plan.steps[3].argv[:2] == ['ffmpeg', '-y']
+    assert plan.steps[-1].paths[:2] == [scratch / 'out.part-000.mp4', scratch / 'out.part-001.mp4']
+
+    # the clips take up to the budget in the scratch directory, the segments and the output as much as the output
+    monkeypatch.setattr(preflight.shutil, 'disk_usage', lambda path: types.SimpleNamespace(free=50))
+    with pytest.raises(api.PlanError, match=f'not enough space in {tmp_path}: need about 0.8K, only 0.0K free'):
+        check_free_space(plan, settings)
+
+    # ffmpeg resolves the entries against the directory of the list, so a relative scratch directory needs absolute ones
+    monkeypatch.chdir(tmp_path)
+    plan = api.plan_cuts(instructions, dataclasses.replace(settings, scratch=pathlib.Path('s')))
+    assert plan.steps[2].output == pathlib.Path('s/out.part-000.clips')
+    assert plan.steps[2].content == (
+        f'# {source} 00:00.000-00:10.000\nfile {str(tmp_path / "s/out-000.mp4")!r}\n\n'
+        f'# {source} 00:10.000-00:20.000\nfile {str(tmp_path / "s/out-001.mp4")!r}\n'
+    )
+
+    settings.scratch_budget = None
+    plan = api.plan_cuts(instructions, settings)
+    assert [step.kind for step in plan.steps] == ['clip', 'clip', 'clip', 'write', 'join', 'cleanup']
+    assert plan.steps[3].output == tmp_path / 'out.clips'
+
+    with pytest.raises(api.PlanError, match=f'not enough space in {tmp_path}: need about 0.6K, only 0.0K free'):
+        check_free_space(plan, settings)
+
+
+def test_renditions(tmp_path, monkeypatch):
+    small = api.Rendition(output=tmp_path / 'small.mp4', filters=api.parse_fps('30'), quality=28)
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, audio='none', renditions=[small])
+    instructions = api.parse_text([str(tmp_path / 'in.mp4'), '00:01-00:02', '00:03-00:04', '00:01-00:02'], check_exists=False)
+    plan = api.plan_cuts(instructions, settings)
+    assert [(step.kind, step.output) for step in plan.steps] == [
+        ('split', tmp_path / 'out-000.mp4'),
+        ('split', tmp_path / 'out-001.mp4'),
+        ('write', tmp_path / 'out.clips'),
+        ('join', tmp_path / 'out.mp4'),
+        ('cleanup', None),
+        ('write', tmp_path / 'small.clips'),
+        ('join', tmp_path / 'small.mp4'),
+        ('cleanup', None),
+    ]
+    assert plan.steps[0].paths == [tmp_path / 'small-000.mp4']
+    assert plan.steps[0].argv == [
+        'ffmpeg',
+        '-y',
+        '-ss',
+        '00:01.000',
+        '-to',
+        '00:02.000',
+        '-i',
+        tmp_path / 'in.mp4',
+        '-filter_complex',
+        '[0:v]split=2[rendition0_in][rendition1_in];[rendition0_in]null[rendition0];[rendition1_in]fps=30[rendition1]',
+        *['-map', '[rendition0]', '-an', '-c:v', 'libx264', '-crf', '15', tmp_path / 'out-000.mp4'],
+        *['-map', '[rendition1]', '-an', '-c:v', 'libx264', '-crf', '28', tmp_path / 'small-000.mp4'],
+    ]
+    assert [line for line in plan.steps[5].content.splitlines() if line.startswith('file')] == [
+        f"file '{tmp_path}/small-000.mp4'",
+        f"file '{tmp_path}/small-001.mp4'",
+        f"file '{tmp_path}/small-000.mp4'",
+    ]
+    assert plan.duration == 2.0
+
+    api.export_plan(plan, tmp_path / 'build.ninja')
+    assert f'build {tmp_path}/out-000.mp4 {tmp_path}/small-000.mp4: ffmpeg {tmp_path}/in.mp4' in (tmp_path / 'build.ninja').read_text()
+
+    # each rendition needs room for its own clips and output: 2 clips of 10 bytes and their join, twice
+    monkeypatch.setattr(smartcut, 'probe_media', lambda input: api.MediaInfo(duration=100.0))
+    monkeypatch.setattr(smartcut, 'PROBES', {})
+    (tmp_path / 'in.mp4').write_bytes(b'x' * 1000)  # 10 bytes per second
+    monkeypatch.setattr(preflight.shutil, 'disk_usage', lambda path: types.SimpleNamespace(free=80))
+    check_free_space(plan, settings)
+    monkeypatch.setattr(preflight.shutil, 'disk_usage', lambda path: types.SimpleNamespace(free=79))
+    with pytest.raises(api.PlanError, match=f'not enough space in {tmp_path}'):
+        check_free_space(plan, settings)
+
+    # the clips are written under a temporary name and journaled, so only the splits that didn't finish run again
+    commands = []
+
+    def check_call(*argv, **kwargs):
+        commands.append(argv)
+        for arg in argv:
+            if str(arg).endswith('.partial.mp4'):
+                arg.write_bytes(b'clip')
+
+    monkeypatch.setattr(cli, 'check_call', check_call)
+    monkeypatch.setattr(cli, 'probe_duration', lambda path: 1.0)
+    (tmp_path / 'in.mp4').touch()
+    settings.no_join = True
+    plan.steps = plan.steps[:2]
+    api.execute(plan, settings)
+    assert [command[-1] for command in commands] == [tmp_path / 'small-000.partial.mp4', tmp_path / 'small-001.partial.mp4']
+    assert sorted(path.name for path in tmp_path.glob('*-*.mp4')) == ['out-000.mp4', 'out-001.mp4', 'small-000.mp4', 'small-001.mp4']
+    (tmp_path / 'small-001.mp4').unlink()
+    api.execute(plan, settings)
+    assert len(commands) == 3
+    assert commands[-1][-1] == tmp_path / 'small-001.partial.mp4'
+
+    with pytest.raises(api.PlanError, match='--rendition'):
+        api.check_settings(api.Settings(output=tmp_path / 'out.mp4', renditions=[small], single_decode=True))
@@ -0,0 +1,51 @@
+import dataclasses
+import os
+
+from ffmpeg_cut import api
+from ffmpeg_cut.cache import ClipCache
+from ffmpeg_cut.cache import parse_size
+from ffmpeg_cut.cli import clip_key
+from ffmpeg_cut.structs import Cut
+from ffmpeg_cut.structs import Step
+
+
+def test_parse_size():
+    assert parse_size('100') == 100
+    assert parse_size('1.5K') == 1536
+    assert parse_size('20G') == 20 << 30
+    assert parse_size('2mb') == 2 << 20
+
+
+def test_cache(tmp_path):
+    source = tmp_path / 'source.mp4'
+    source.write_bytes(b'source')
+    cache = ClipCache(tmp_path / 'cache', budget=10)
+    settings = api.Settings(output=tmp_path / 'out.mp4')
+
+    def key_of(cut, suffix='.mp4', **changes):
+        return clip_key(Step('clip', input=source, cut=cut, output=tmp_path / f'clip{suffix}'), dataclasses.replace(settings, **changes))
+
+    key = key_of(Cut(1000, 2000))
+    assert key == key_of(Cut(1000, 2000))
+    assert key != key_of(Cut(1000, 3000))
+    assert key != key_of(Cut(1000, 2000), quality=20)
+    assert key != key_of(Cut(1000, 2000), '.mkv')
+    assert key != key_of(Cut(1000, 2000), audio='none')
+    assert not cache.fetch(key, tmp_path / 'clip.mp4')
+
+    (tmp_path / 'clip.mp4').write_bytes(b'12345')
+    cache.store(key, tmp_path / 'clip.mp4')
+    assert cache.fetch(key, tmp_path / 'reused.mp4')
+    assert (tmp_path / 'reused.mp4').read_bytes() == b'12345'
+    # outputs the user gets never share the inode of the cache entry
+    assert cache.fetch(key, tmp_path / 'output.mp4', link=False)
+    assert (tmp_path / 'output.mp4').stat().st_ino != cache.entry(key, '.mp4').stat().st_ino
+    (tmp_path / 'output.mp4').write_bytes(b'edited')
+    assert cache.entry(key, '.mp4').read_bytes() == b'12345'
+
+    other = key_of(Cut(5000, 6000))
+    (tmp_path / 'other.mp4').write_bytes(b'123456')
+    os.utime(cache.entry(key, '.mp4'), (0, 0))
+    cache.store(other, tmp_path / 'other.mp4')
+    assert not cache.entry(key, '.mp4').exists()
+    assert cache.entry(other, '.mp4').exists()
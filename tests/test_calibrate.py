@@ -0,0 +1,54 @@
+import pytest
+
+from ffmpeg_cut import api
+from ffmpeg_cut import calibrate
+from ffmpeg_cut import smartcut
+
+SPEEDS = {'ultrafast': 12.0, 'superfast': 9.0, 'veryfast': 6.0, 'faster': 4.5, 'fast': 4.0, 'medium': 3.0, 'slow': 1.5}
+
+
+@pytest.fixture
+def measured(monkeypatch, tmp_path):
+    measured = []
+
+    def measure_speed(input, info, settings, preset):
+        measured.append(preset)
+        return SPEEDS.get(preset, 0.5)
+
+    monkeypatch.setattr(smartcut, 'probe_media', lambda input: api.MediaInfo(duration=600.0, width=1920, height=1080))
+    monkeypatch.setattr(smartcut, 'PROBES', {})
+    monkeypatch.setattr(calibrate, 'measure_speed', measure_speed)
+    monkeypatch.setattr(calibrate, 'CALIBRATION_FILE', tmp_path / 'cache' / 'presets.json')
+    (tmp_path / 'in.mp4').touch()
+    return measured
+
+
+def test_calibrate(tmp_path, measured):
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=2, target_speed=6, echo=lambda line: None)
+    instructions = [api.Instruction(input=tmp_path / 'in.mp4', cut=[api.parse_cut('00:00-01:00'), api.parse_cut('02:00-03:00')])]
+    plan = api.plan_cuts(instructions, settings)
+    api.calibrate(plan, settings)
+    # two clips at a time, so every encode needs 3x
+    assert settings.preset == 'medium'
+    assert measured == ['fast', 'slow', 'medium']
+    argv = plan.steps[0].argv
+    assert argv[argv.index('-crf') :][:4] == ['-crf', '15', '-preset', 'medium']
+
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, deadline=20, echo=lambda line: None)
+    plan = api.plan_cuts(instructions, settings)
+    api.calibrate(plan, settings)
+    # 120s in 20s, measured again as a single job gets all the threads
+    assert settings.preset == 'veryfast'
+    assert measured == ['fast', 'slow', 'medium', 'fast', 'veryfast', 'faster']
+
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=2, target_speed=6, echo=lambda line: None)
+    api.calibrate(api.plan_cuts(instructions, settings), settings)
+    assert settings.preset == 'medium'
+    assert len(measured) == 6
+
+
+def test_calibrate_settings(tmp_path):
+    with pytest.raises(api.PlanError, match='--preset'):
+        api.check_settings(api.Settings(output=tmp_path / 'out.mp4', target_speed=2, preset='slow'))
+    with pytest.raises(api.PlanError, match='only work with libx264 or libx265, not h264_nvenc'):
+        api.check_settings(api.Settings(output=tmp_path / 'out.mp4', deadline=60, encoder='h264_nvenc'))
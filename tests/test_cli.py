@@ -1,10 +1,17 @@
 import subprocess
 
+from ffmpeg_cut.cli import parse_filter
+from ffmpeg_cut.plan import single_decode_graph
+
 
 def test_main():
     assert (
         subprocess.check_output(['ffmpeg-cut', '--help'], text=True)
-        == """usage: ffmpeg-cut [-h] [[-j | -c W:H | -f W:H |] -n] [-q CRF] [-d] [-r] [-s FILTERS] [-e ENCODER] [-t] [-l] input output [cut] [cut ...]
+        == """usage: ffmpeg-cut [-h] [[-j | -c W:H | -f W:H |] -n] [-q CRF] [--preset PRESET] [--target-speed SPEED] [--deadline SECONDS] [-d] [-p N] [-r] [-k] [--merge] [--chunk-length SECONDS] [--single-decode]
+                  [--stream-join] [--stream-buffer SIZE] [--preview] [--spool DIR] [--scratch DIR] [--scratch-budget SIZE] [--rendition SPEC] [--export FILE] [--preflight] [--probe-cache FILE]
+                  [--watch] [--progress] [--metrics FILE] [--trace FILE] [--cache DIR] [--cache-size SIZE] [--optimize-filters] [--audio {encode,copy,none}] [--audio-codec CODEC] [--audio-track N]
+                  [-s FILTERS] [-e ENCODER] [-t] [-l]
+                  input output [cut] [cut ...]
 
 ffmpeg wrapper
 
@@ -22,8 +29,41 @@ options:
   -n, --no-join         only produce the intermediary clips and ffmpeg concat instruction file
   -q CRF, --quality CRF
                         libx265 crf
+  --preset PRESET       encoder preset, eg: `veryfast` or `slow`
+  --target-speed SPEED  use the slowest --preset that still encodes at least this many times faster than realtime (eg: 2), measured with short sample encodes
+  --deadline SECONDS    use the slowest --preset that still encodes everything within this many seconds, measured with short sample encodes
   -d, --dry-run
+  -p N, --jobs N        how many clips to encode in parallel (default: a quarter of the CPU count)
   -r, --dirty
+  -k, --smart-cut       stream-copy whole GOPs and only re-encode the edges of each cut (no filters)
+  --merge               merge overlapping or adjacent cuts of the same input (in place of the first one)
+  --chunk-length SECONDS
+                        split a single cut or a filters-only encode in chunks of about this long (starting on keyframes) that are encoded in parallel
+  --single-decode       decode each input once and render all cuts in a single ffmpeg process, without intermediary clips
+  --stream-join         pipe clips straight into the join step (as MPEG-TS) instead of writing intermediary clips
+  --stream-buffer SIZE  how much of a clip that finished before its turn to be joined is kept in memory before spilling to disk (default: 64M)
+  --preview             quickly render a low resolution preview (same cuts and filters, fastest preset) to NAME.preview.EXT instead of the output
+  --spool DIR           queue the clip encodes as tasks in this directory (eg: on a shared filesystem) for `ffmpeg-cut worker` processes
+  --scratch DIR         directory for the intermediary clips and chunks (eg: on a fast local disk) instead of next to the output
+  --scratch-budget SIZE
+                        join the clips in batches that fit in about this much space, removing them as soon as they are joined
+  --rendition SPEC      also render the same cuts to another output, decoding them only once: OUTPUT with its own filters (-c, -f, -s), encoder (-e), quality (-q) or --preset, eg: "small.mp4 -s 30
+                        -q 28" (can be repeated)
+  --export FILE         write the plan to a build file instead of running it: for ninja if FILE ends in .ninja, otherwise a Makefile
+  --preflight           probe the inputs before encoding anything: check that the cuts fit and re-encode the join if the inputs differ
+  --probe-cache FILE    keep what is probed from the inputs (duration, format) in FILE, so later runs only probe the inputs that changed
+  --watch               render the cut list again every time it or one of its inputs changes, only encoding the cuts that changed
+  --progress            show a progress bar with an ETA instead of ffmpeg's output
+  --metrics FILE        append metrics (wall time, speed, size) for every ffmpeg run as JSON lines
+  --trace FILE          write a timeline of the run (every stage and ffmpeg command) as a Chrome trace
+  --cache DIR           directory where encoded clips are kept for reuse across runs
+  --cache-size SIZE     maximum size of the clip cache (default: 20G)
+  --optimize-filters    reorder and simplify the filters (eg: reduce the frame rate before cropping), prints the graph before and after
+  --audio {encode,copy,none}
+                        encode the audio (with ffmpeg's default codec or --audio-codec), copy it if the container allows it (otherwise encode it with --audio-codec or AAC) or drop it (default:
+                        encode)
+  --audio-codec CODEC   audio encoder, eg: `aac` or `libopus`
+  --audio-track N       only keep this audio track (counting from 0), can be repeated
   -s FILTERS, --fps FILTERS
   -e ENCODER, --encoder ENCODER
                         you can use `libx265` for better compression but possibly worse player support
@@ -40,5 +80,22 @@ If you use --text then the input file must contain instructions in the form:
     HH:MM:SS.mmm-HH:MM:SS.mmm
     HH:MM:SS.mmm-HH:MM:SS.mmm
     HH:MM:SS.mmm-HH:MM:SS.mmm
+
+To queue jobs on a shared worker pool instead see: ffmpeg-cut serve --help
 """
     )
+
+
+def test_single_decode_graph():
+    assert single_decode_graph([(0, 0.0, 1.5), (1, 2.0, 3.0)], [], audio=False) == (
+        '[0:v:0]trim=start=0.000:end=1.500,setpts=PTS-STARTPTS[v0];'
+        '[1:v:0]trim=start=2.000:end=3.000,setpts=PTS-STARTPTS[v1];'
+        '[v0][v1]concat=n=2:v=1:a=0[outv]'
+    )
+    assert single_decode_graph([(0, 0.0, 1.5)], parse_filter('0:0:10:10:boxblur=5:4')) == (
+        '[0:v:0]trim=start=0.000:end=1.500,setpts=PTS-STARTPTS[v0];'
+        '[0:a:0]atrim=start=0.000:end=1.500,asetpts=PTS-STARTPTS[a0];'
+        '[v0][a0]concat=n=1:v=1:a=1[cutv][outa];'
+        '[cutv]split=2[cutv_0][cutv_1];'
+        '[cutv_0]crop=10:10:0:0,boxblur=5:4[filter1];[cutv_1][filter1]overlay=0:0[outv]'
+    )
@@ -0,0 +1,57 @@
+import pytest
+
+from ffmpeg_cut import api
+
+
+def test_export_ninja(tmp_path):
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1)
+    instruction = api.Instruction(input=tmp_path / 'in.mp4', cut=[api.parse_cut('00:01-00:02'), api.parse_cut('00:03-00:04')])
+    plan = api.plan_cuts([instruction], settings)
+    api.export_plan(plan, tmp_path / 'build.ninja')
+    assert (tmp_path / 'build.ninja').read_text() == (
+        '# generated by ffmpeg-cut, rerun it to update this file\n'
+        '\n'
+        'rule ffmpeg\n'
+        '  command = $cmd\n'
+        '  description = ffmpeg $out\n'
+        '\n'
+        f'build {tmp_path}/out-000.mp4: ffmpeg {tmp_path}/in.mp4\n'
+        f'  cmd = ffmpeg -y -ss 00:01.000 -to 00:02.000 -i {tmp_path}/in.mp4 -c:v libx264 -crf 15 {tmp_path}/out-000.mp4\n'
+        '\n'
+        f'build {tmp_path}/out-001.mp4: ffmpeg {tmp_path}/in.mp4\n'
+        f'  cmd = ffmpeg -y -ss 00:03.000 -to 00:04.000 -i {tmp_path}/in.mp4 -c:v libx264 -crf 15 {tmp_path}/out-001.mp4\n'
+        '\n'
+        f'build {tmp_path}/out.mp4: ffmpeg {tmp_path}/out.clips {tmp_path}/out-000.mp4 {tmp_path}/out-001.mp4\n'
+        f'  cmd = ffmpeg -f concat -safe 0 -i {tmp_path}/out.clips -c copy {tmp_path}/out.mp4\n'
+        '\n'
+        f'default {tmp_path}/out.mp4\n'
+    )
+    assert (tmp_path / 'out.clips').read_text() == plan.clips.as_concat_input()
+
+
+def test_export_make(tmp_path):
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, no_join=True, filters=api.parse_fps('30'))
+    plan = api.plan_cuts([api.Instruction(input=tmp_path / 'in put.mp4', cut=[api.parse_cut('00:01-00:02')])], settings)
+    api.export_plan(plan, tmp_path / 'Makefile')
+    command = (
+        f"ffmpeg -y -ss 00:01.000 -to 00:02.000 -i '{tmp_path}/in put.mp4' -filter_complex '[0:v]fps=30' "
+        f'-c:v libx264 -crf 15 {tmp_path}/out-000.mp4'
+    )
+    assert (tmp_path / 'Makefile').read_text().splitlines()[4:] == [
+        f'all: {tmp_path}/out-000.mp4',
+        '',
+        f'{tmp_path}/out-000.mp4: {tmp_path}/in\\ put.mp4 {tmp_path}/out-000.mp4.cmd',
+        f'\t{command}',
+    ]
+    assert (tmp_path / 'out-000.mp4.cmd').read_text() == f'{command}\n'
+
+    mtime = (tmp_path / 'out-000.mp4.cmd').stat().st_mtime_ns
+    api.export_plan(plan, tmp_path / 'Makefile')
+    assert (tmp_path / 'out-000.mp4.cmd').stat().st_mtime_ns == mtime
+
+
+def test_export_unsupported(tmp_path):
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, stream_join=True)
+    plan = api.plan_cuts([api.Instruction(input=tmp_path / 'in.mp4', cut=[api.parse_cut('00:01-00:02')])], settings)
+    with pytest.raises(api.PlanError, match='cannot export stream steps'):
+        api.export_plan(plan, tmp_path / 'build.ninja')
@@ -0,0 +1,23 @@
+from ffmpeg_cut.cli import parse_crop
+from ffmpeg_cut.cli import parse_filter
+from ffmpeg_cut.cli import parse_fps
+from ffmpeg_cut.filters import optimize_filters
+
+
+def test_fps_moves_before_frame_filters():
+    crop = parse_crop('9:16')
+    assert optimize_filters([*crop, *parse_fps('30')]) == ['fps=30', *crop]
+    # --filter reads the input again so the frame rate can't be reduced before it
+    overlay = parse_filter('0:0:100:100:boxblur=5')
+    assert optimize_filters([*overlay, *parse_fps('30')]) == [*overlay, 'fps=30']
+    assert optimize_filters(['tmix=frames=3', 'fps=30']) == ['tmix=frames=3,fps=30']
+
+
+def test_merge_and_drop():
+    assert optimize_filters(['crop=1000:800:10:20', 'null,crop=500:400:5:5', 'scale=iw:ih']) == ['crop=500:400:15:25']
+    assert optimize_filters(['scale=-2:720:flags=lanczos', 'fps=30', 'scale=640:360']) == ['fps=30,scale=640:360']
+    assert optimize_filters(['scale=-2:720', 'scale=-2:360', 'fps=30', 'fps=30']) == ['fps=30,scale=-2:720,scale=-2:360']
+    assert optimize_filters(['scale=-2:720', 'scale=640:360:force_original_aspect_ratio=decrease']) == [
+        'scale=-2:720,scale=640:360:force_original_aspect_ratio=decrease'
+    ]
+    assert optimize_filters(['scale=1280:720', 'scale=640:-1']) == ['scale=1280:720,scale=640:-1']
@@ -0,0 +1,20 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from ffmpeg_cut.jobs import JobPool
+
+
+def run_jobs(*commands):
+    with JobPool(2) as pool:
+        for command in commands:
+            pool.submit(pool.check_call, [sys.executable, '-c', command])
+
+
+def test_pool_fails_fast():
+    started = time.monotonic()
+    with pytest.raises(subprocess.CalledProcessError):
+        run_jobs('import time; time.sleep(30)', 'raise SystemExit(3)', 'import time; time.sleep(30)')
+    assert time.monotonic() - started < 10
@@ -0,0 +1,30 @@
+from ffmpeg_cut.journal import Journal
+from ffmpeg_cut.journal import journal_path
+
+
+def test_journal(tmp_path):
+    path = journal_path(tmp_path / 'out.mp4')
+    assert path == tmp_path / 'out.journal'
+    clip = tmp_path / 'out-000.mp4'
+    other = tmp_path / 'out-001.mp4'
+    clip.write_bytes(b'12345')
+    other.write_bytes(b'123')
+
+    journal = Journal(path)
+    assert not journal.finished(clip, 'key')
+    journal.record(clip, 'key', 1.0)
+    assert journal.finished(clip, 'key')
+    assert not journal.finished(clip, 'other settings')
+    with path.open('a') as fh:
+        fh.write('{"clip": "cut short')  # killed while writing
+
+    journal = Journal(path)
+    assert journal.finished(clip, 'key')
+    assert not journal.finished(other, 'key')
+    journal.record(other, 'key', 1.0)
+    assert Journal(path).finished(other, 'key')
+
+    clip.write_bytes(b'123')
+    assert not journal.finished(clip, 'key')
+    clip.unlink()
+    assert not journal.finished(clip, 'key')
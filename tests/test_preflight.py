@@ -0,0 +1,110 @@
+import pytest
+
+from ffmpeg_cut import api
+from ffmpeg_cut import smartcut
+from ffmpeg_cut.preflight import fixed_properties
+
+MEDIA = {
+    'a.mp4': api.MediaInfo(duration=10.0, width=1920, height=1080, frame_rate='60/1', pix_fmt='yuv420p', sample_rate='48000', channels=2),
+    'b.mp4': api.MediaInfo(duration=5.5, width=1280, height=720, frame_rate='30/1', pix_fmt='yuv420p', sample_rate='48000', channels=2),
+}
+
+
+@pytest.fixture
+def probes(monkeypatch, tmp_path):
+    probed = []
+
+    def probe_media(input):
+        probed.append(input.name)
+        return MEDIA[input.name]
+
+    monkeypatch.setattr(smartcut, 'probe_media', probe_media)
+    monkeypatch.setattr(smartcut, 'PROBES', {})
+    for name in MEDIA:
+        (tmp_path / name).touch()
+    return probed
+
+
+def test_preflight_cuts(tmp_path, probes):
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1)
+    instructions = api.parse_text(
+        ['a.mp4', '00:01-00:02', '00:09-00:11', 'b.mp4', '00:05-00:06', 'missing.mp4'], check_exists=False, base=tmp_path
+    )
+    with pytest.raises(api.PlanError) as exc_info:
+        api.preflight(api.plan_cuts(instructions, settings), settings)
+    assert str(exc_info.value).splitlines() == [
+        f"'{tmp_path}/missing.mp4' does not exist",
+        f"'{tmp_path}/a.mp4' is only 00:10.000 long, cannot cut 00:09.000-00:11.000",
+        f"'{tmp_path}/b.mp4' is only 00:05.500 long, cannot cut 00:05.000-00:06.000",
+    ]
+    assert sorted(probes) == ['a.mp4', 'b.mp4']
+
+    plan = api.plan_cuts(api.parse_text(['a.mp4', '00:01-00:02', '00:09-00:10'], base=tmp_path), settings)
+    assert api.preflight(plan, settings) == {tmp_path / 'a.mp4': MEDIA['a.mp4']}
+    assert sorted(probes) == ['a.mp4', 'b.mp4']  # cached
+
+
+def test_preflight_join(tmp_path, probes):
+    output = []
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, echo=output.append)
+    instructions = api.parse_text(['a.mp4', '00:01-00:02', 'b.mp4', '00:01-00:02'], base=tmp_path)
+    plan = api.plan_cuts(instructions, settings)
+    api.preflight(plan, settings)
+    assert output == [f'inputs have different size, frame_rate, the join will re-encode to match {tmp_path}/a.mp4']
+    assert plan.steps[3].argv == [
+        'ffmpeg',
+        '-f',
+        'concat',
+        '-safe',
+        '0',
+        '-i',
+        tmp_path / 'out.clips',
+        '-vf',
+        'scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:-1:-1,setsar=1,fps=60/1',
+        '-c:v',
+        'libx264',
+        '-crf',
+        '15',
+        tmp_path / 'out.mp4',
+    ]
+
+    settings.filters = api.parse_crop('9:16') + api.parse_fps('60')
+    plan = api.plan_cuts(instructions, settings)
+    api.preflight(plan, settings)
+    assert plan.steps[3].argv == ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', tmp_path / 'out.clips', '-c', 'copy', tmp_path / 'out.mp4']
+
+    # these keep the size of the input (or scale it by its aspect ratio) so the clips still differ
+    for filters in [api.parse_filter('10:10:100:100:boxblur=5') + api.parse_fps('60'), [*api.parse_fps('60'), 'scale=-2:360']]:
+        settings.filters = filters
+        plan = api.plan_cuts(instructions, settings)
+        api.preflight(plan, settings)
+        assert plan.steps[3].argv[7:9] == ['-vf', 'scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:-1:-1,setsar=1']
+
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, echo=output.append)
+    api.apply_preview(settings)
+    plan = api.plan_cuts(instructions, settings)
+    api.preflight(plan, settings)
+    assert plan.steps[3].argv[7:9] == ['-vf', 'scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:-1:-1,setsar=1,fps=60/1']
+
+
+def test_fixed_properties():
+    assert fixed_properties([*api.parse_crop('9:16'), 'scale=-2:360']) == {'size'}
+    assert fixed_properties(['scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:-1:-1', 'fps=30']) == {'size', 'frame_rate'}
+    assert fixed_properties(api.parse_crop('9:16') + api.parse_filter('10:10:100:100:hflip')) == set()
+    assert fixed_properties(['scale=-2:360']) == set()
+
+
+def test_probe_cache(tmp_path, probes, monkeypatch):
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1)
+    plan = api.plan_cuts(api.parse_text(['a.mp4', '00:01-00:02', 'b.mp4', '00:01-00:02'], base=tmp_path), settings)
+    infos = api.preflight(plan, settings)
+    assert sorted(probes) == ['a.mp4', 'b.mp4']
+    smartcut.save_probes(tmp_path / 'cache' / 'probes.json')
+
+    # a new run only probes the inputs that changed
+    monkeypatch.setattr(smartcut, 'PROBES', {})
+    smartcut.load_probes(tmp_path / 'cache' / 'probes.json')
+    (tmp_path / 'b.mp4').write_bytes(b'changed')
+    assert api.preflight(plan, settings) == infos
+    assert sorted(probes) == ['a.mp4', 'b.mp4', 'b.mp4']
+    smartcut.load_probes(tmp_path / 'missing.json')
@@ -0,0 +1,30 @@
+import io
+
+from ffmpeg_cut.progress import ProgressReporter
+from ffmpeg_cut.progress import out_time
+from ffmpeg_cut.progress import parse_progress
+
+
+def test_parse_progress():
+    lines = ['frame=10', 'out_time_us=400000', 'progress=continue', 'frame=20', 'out_time_us=N/A', 'out_time_ms=800000', 'progress=end']
+    blocks = list(parse_progress(lines))
+    assert len(blocks) == 2
+    assert out_time(blocks[0]) == 0.4
+    assert out_time(blocks[1]) == 0.8
+
+
+def test_reporter(tmp_path):
+    stream = io.StringIO()
+    reporter = ProgressReporter(metrics=tmp_path / 'metrics.jsonl', stream=stream)
+    reporter.add(4.0)
+    progress = reporter.track('clip-000.mp4', 2.0)
+    progress.consume(io.StringIO('out_time_us=1000000\ntotal_size=1234\nprogress=end\n'))
+    assert reporter.done == 1.0
+    progress.finish(0)
+    assert reporter.done == 2.0
+    killed = reporter.track('clip-001.mp4', 2.0)
+    killed.finish(None)  # cancelled before it exited
+    assert reporter.done == 2.0
+    reporter.close()
+    assert '50.0%' in stream.getvalue()
+    assert '"bytes": 1234' in (tmp_path / 'metrics.jsonl').read_text()
@@ -0,0 +1,50 @@
+import threading
+import time
+
+from ffmpeg_cut.jobs import PriorityPool
+from ffmpeg_cut.server import JobServer
+from ffmpeg_cut.server import request
+
+
+def test_priority_pool():
+    pool = PriorityPool(1)
+    blocker = threading.Event()
+    order = []
+    pool.submit(0, blocker.wait)
+    futures = [pool.submit(priority, order.append, priority) for priority in (5, 1, 3)]
+    blocker.set()
+    for future in futures:
+        future.result()
+    pool.shutdown()
+    assert order == [1, 3, 5]
+
+
+def test_server(tmp_path):
+    (tmp_path / 'source.mp4').touch()
+    (tmp_path / 'cuts.txt').write_text('source.mp4\n00:01.000-00:02.000\n00:03.000-00:04.000\n')
+    path = tmp_path / 'server.sock'
+    with JobServer(path, jobs=2, max_jobs=1) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            job = request(path, {'action': 'submit', 'argv': ['-d', '-t', 'cuts.txt', 'out.mp4'], 'cwd': str(tmp_path)})
+            while job['state'] in ('queued', 'running'):
+                time.sleep(0.05)
+                job = request(path, {'action': 'status', 'id': job['id']})
+            assert job['state'] == 'done', job
+            assert job['output'] == str(tmp_path / 'out.mp4')
+            assert f'    {tmp_path}/source.mp4 00:01.000-00:02.000 00:03.000-00:04.000' in job['log']
+            assert job['log'][-1] == f'    ffmpeg -f concat -safe 0 -i {tmp_path}/out.clips -c copy {tmp_path}/out.mp4'
+
+            # jobs are planned on the pool, so a plan that fails is a failed job
+            job = request(path, {'action': 'submit', 'argv': ['-t', 'missing.txt', 'out.mp4'], 'cwd': str(tmp_path)})
+            while job['state'] in ('queued', 'running'):
+                time.sleep(0.05)
+                job = request(path, {'action': 'status', 'id': job['id']})
+            assert job['state'] == 'failed'
+            assert 'missing.txt' in job['error']
+            assert [job['id'] for job in request(path, {'action': 'status'})['jobs']] == [1, 2]
+        finally:
+            server.shutdown()
+            thread.join()
+    assert not path.exists()
@@ -0,0 +1,41 @@
+from ffmpeg_cut.smartcut import Codecs
+from ffmpeg_cut.smartcut import SmartCutPlan
+from ffmpeg_cut.smartcut import format_timestamp
+from ffmpeg_cut.smartcut import plan_smart_cut
+
+
+def test_timestamps():
+    assert format_timestamp(3602.5) == '01:00:02.500'
+
+
+def test_plan_smart_cut():
+    keyframes = [0.0, 2.0, 4.0, 6.0]
+    assert plan_smart_cut(keyframes, 1.5, 5.0) == SmartCutPlan(head=(1.5, 2.0), copy=(2.0, 4.0), tail=(4.0, 5.0))
+    assert plan_smart_cut(keyframes, 2.0, 6.0) == SmartCutPlan(head=None, copy=(2.0, 6.0), tail=None)
+    assert plan_smart_cut(keyframes, 2.5, 3.5) == SmartCutPlan(head=(2.5, 3.5), copy=None, tail=None)
+
+
+def test_codecs():
+    codecs = Codecs(video='h264', pix_fmt='yuv420p', audio=['aac'], profile='High', level=41, time_base='1/15360')
+    assert codecs.supported
+    assert codecs.video_options == [
+        '-c:v',
+        'libx264',
+        '-pix_fmt',
+        'yuv420p',
+        '-profile:v',
+        'high',
+        '-level:v',
+        '4.1',
+        '-enc_time_base:v',
+        '1/15360',
+    ]
+    codecs = Codecs(video='hevc', pix_fmt='yuv420p10le', audio=[], profile='Main 10', level=120, time_base='1/90000')
+    assert codecs.supported
+    assert codecs.video_options[4:8] == ['-profile:v', 'main10', '-x265-params', 'level-idc=4']
+    # anything unknown means the head and tail might not match the copied GOPs
+    assert not Codecs(video='h264', pix_fmt=None, audio=[], profile='High', level=41, time_base='1/15360').supported
+    assert not Codecs(video='h264', pix_fmt='yuv420p', audio=[], profile='High', level=-99, time_base='1/15360').supported
+    assert not Codecs(video='h264', pix_fmt='yuv420p', audio=[], profile='High', level=41).supported
+    assert not Codecs(video='h264', pix_fmt='yuv420p', audio=[], profile='Extended', level=41, time_base='1/15360').supported
+    assert not Codecs(video='h264', pix_fmt='yuv420p', audio=['pcm_s16le'], profile='High', level=41, time_base='1/15360').supported
@@ -0,0 +1,71 @@
+import json
+import multiprocessing
+import os
+import pathlib
+
+import pytest
+
+from ffmpeg_cut.spool import SpoolDir
+from ffmpeg_cut.spool import TaskFailed
+from ffmpeg_cut.spool import work
+
+
+def write_task(task):
+    if task['fail']:
+        raise RuntimeError('broken')
+    with pathlib.Path(task['path']).open('a') as fh:
+        fh.write(f'{os.getpid()}\n')
+
+
+def run_worker(path):
+    work(SpoolDir(path), write_task, f'worker-{os.getpid()}', idle_exit=True, poll=0.01, echo=lambda line: None)
+
+
+def test_lease_expiry(tmp_path):
+    spool = SpoolDir(tmp_path / 'spool', lease=10)
+    spool.submit('task', {'value': 1})
+    lease = spool.claim('a')
+    assert lease.task == {'value': 1}
+    assert spool.claim('b') is None
+    assert spool.state('task') == 'running'
+
+    spool.requeue_expired()
+    assert spool.state('task') == 'running'
+    os.utime(lease.path, (0, 0))
+    spool.requeue_expired()
+    assert spool.state('task') == 'queue'
+    assert not spool.renew(lease)
+    assert not spool.complete(lease)
+
+    lease = spool.claim('b')
+    assert spool.complete(lease)
+    assert spool.state('task') == 'done'
+
+
+def test_workers(tmp_path):
+    spool = SpoolDir(tmp_path / 'spool')
+    names = [f'task-{index}' for index in range(20)]
+    for name in names:
+        spool.submit(name, {'path': str(tmp_path / name), 'fail': False})
+    workers = [multiprocessing.Process(target=run_worker, args=(spool.path,)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    spool.wait(names, poll=0.01)
+    for worker in workers:
+        worker.join(10)
+        assert worker.exitcode == 0
+    for name in names:
+        assert len((tmp_path / name).read_text().splitlines()) == 1
+    assert spool.idle()
+    assert not any((spool.path / 'done').iterdir())
+
+
+def test_failure(tmp_path):
+    spool = SpoolDir(tmp_path / 'spool')
+    spool.submit('good', {'path': str(tmp_path / 'good'), 'fail': False})
+    spool.submit('bad', {'path': str(tmp_path / 'bad'), 'fail': True})
+    run_worker(spool.path)
+    assert json.loads((spool.path / 'failed' / 'bad.json').read_text())['error'] == 'RuntimeError: broken'
+    with pytest.raises(TaskFailed, match='bad: RuntimeError: broken'):
+        spool.wait(['good', 'bad'], poll=0.01)
+    assert spool.state('bad') is None
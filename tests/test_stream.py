@@ -0,0 +1,34 @@
+import io
+import threading
+
+from ffmpeg_cut.stream import Spool
+from ffmpeg_cut.stream import relay
+
+
+def test_relay_keeps_order():
+    first = Spool(max_size=4)
+    second = Spool(max_size=4)
+    second.write(b'second clip')
+    second.close()
+
+    def produce():
+        for chunk in [b'first', b' ', b'clip|']:
+            first.write(chunk)
+        first.close()
+
+    thread = threading.Thread(target=produce)
+    thread.start()
+    output = io.BytesIO()
+    assert relay([first, second], output)
+    thread.join()
+    assert output.getvalue() == b'first clip|second clip'
+
+
+def test_relay_stops_on_error():
+    first = Spool(max_size=4)
+    first.write(b'partial')
+    first.close(RuntimeError('encoder failed'))
+    second = Spool(max_size=4)
+    output = io.BytesIO()
+    assert not relay([first, second], output)
+    assert output.getvalue() == b'partial'
@@ -0,0 +1,30 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from ffmpeg_cut.cli import check_call
+from ffmpeg_cut.jobs import JobPool
+from ffmpeg_cut.trace import Tracer
+
+
+def test_trace(tmp_path):
+    tracer = Tracer(tmp_path / 'trace.json')
+    with tracer.span('plan', 'stage', clips=2):
+        pass
+    check_call(sys.executable, '-c', 'bytearray(10_000_000)', 'ok', dry_run=False, echo=lambda line: None, tracer=tracer)
+    with JobPool(1) as pool, pytest.raises(subprocess.CalledProcessError):
+        check_call(sys.executable, '-c', 'raise SystemExit(3)', 'failed', dry_run=False, pool=pool, echo=lambda line: None, tracer=tracer)
+    tracer.close()
+
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert [(event['ph'], event['name']) for event in events] == [('M', 'thread_name'), ('X', 'plan'), ('X', 'ok'), ('X', 'failed')]
+    assert events[1]['args'] == {'clips': 2}
+    ok, failed = events[2]['args'], events[3]['args']
+    assert ok['command'] == f"{sys.executable} -c 'bytearray(10_000_000)' ok"
+    assert ok['returncode'] == 0
+    assert ok['max_rss'] > 10_000_000
+    assert ok['user_time'] >= 0
+    assert failed['returncode'] == 3
+    assert events[3]['ts'] >= events[2]['ts'] + events[2]['dur']
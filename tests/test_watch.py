@@ -0,0 +1,48 @@
+import threading
+
+from ffmpeg_cut import api
+from ffmpeg_cut.journal import Journal
+from ffmpeg_cut.watch import reuse_clips
+from ffmpeg_cut.watch import snapshot
+from ffmpeg_cut.watch import wait_for_change
+
+
+def key(step):
+    return str(step.cut)
+
+
+def render(tmp_path, cuts):
+    """
+    Plans the ``cuts``, reuses what it can and "encodes" the rest (the content of a clip is its key).
+    """
+    settings = api.Settings(output=tmp_path / 'out.mp4', jobs=1, dirty=True)
+    plan = api.plan_cuts(api.parse_text(['in.mp4', *cuts], check_exists=False, base=tmp_path), settings)
+    counts = reuse_clips(plan, key)
+    journal = Journal(tmp_path / 'out.journal')
+    for step in plan.steps:
+        if step.kind == 'clip' and not journal.finished(step.output, key(step)):
+            step.output.write_text(key(step))
+            journal.record(step.output, key(step), step.duration)
+    return counts
+
+
+def test_reuse_clips(tmp_path):
+    assert render(tmp_path, ['00:01-00:02', '00:03-00:04']) == (0, 2)
+    assert render(tmp_path, ['00:05-00:06', '00:01-00:02', '00:03-00:04']) == (2, 1)
+    assert (tmp_path / 'out-000.mp4').read_text() == '00:05.000-00:06.000'
+    assert (tmp_path / 'out-001.mp4').read_text() == '00:01.000-00:02.000'
+    assert (tmp_path / 'out-002.mp4').read_text() == '00:03.000-00:04.000'
+
+    assert render(tmp_path, ['00:03-00:04', '00:01-00:02']) == (2, 0)
+    assert (tmp_path / 'out-000.mp4').read_text() == '00:03.000-00:04.000'
+    assert (tmp_path / 'out-001.mp4').read_text() == '00:01.000-00:02.000'
+    assert sorted(path.name for path in tmp_path.glob('out-*')) == ['out-000.mp4', 'out-001.mp4']
+    assert Journal(tmp_path / 'out.journal').finished(tmp_path / 'out-000.mp4', '00:03.000-00:04.000')
+
+
+def test_wait_for_change(tmp_path):
+    cuts = tmp_path / 'cuts.txt'
+    cuts.write_text('in.mp4\n')
+    state = snapshot([cuts, tmp_path / 'in.mp4'])
+    threading.Timer(0.1, cuts.write_text, ['in.mp4\n00:01-00:02\n']).start()
+    assert wait_for_change(state, poll=0.05) == [cuts]